@@ -42,11 +42,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fluxo.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fluxo.membership.InstitutionMembershipMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,6 +80,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transações de escrita (services) reservam o lock de escrita no BEGIN:
+            # com o modo padrão (DEFERRED), a transação que lê e depois grava recebe
+            # "database is locked" imediatamente, sem esperar o timeout
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -124,4 +132,58 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+# Modo de aplicação do carimbo de assinatura no PDF:
+# 'incremental' anexa uma atualização incremental ao original (custo proporcional ao carimbo);
+# 'rewrite' reescreve o documento inteiro com PyPDF2.
+FLUXO_SIGNING_MODE = 'incremental'
+
+# Quando True, health_school_sign_document apenas registra um SigningJob e
+# retorna; o carimbo é feito por `python manage.py signing_worker`.
+FLUXO_SIGNING_QUEUE = True
+
+# Entrega dos downloads pelo servidor web, sem o Python ler os bytes:
+# None (FileResponse/Range no Django), 'nginx' (X-Accel-Redirect para uma
+# location `internal` em FLUXO_SENDFILE_URL_PREFIX) ou 'xsendfile' (Apache/lighttpd).
+FLUXO_SENDFILE_BACKEND = None
+FLUXO_SENDFILE_URL_PREFIX = '/protected-media/'
+
+# Instrumentação por requisição (cabeçalho Server-Timing e log JSON em
+# `fluxo.timing`): consultas e tempo de banco, templates e etapas da assinatura.
+FLUXO_SERVER_TIMING = False
+
+# Limites do envio em lote (manifesto CSV + ZIP ou vários PDFs): número de
+# documentos por envio e tamanho máximo, em bytes, de cada PDF descompactado.
+FLUXO_BULK_SEND_MAX_FILES = 500
+FLUXO_BULK_SEND_MAX_FILE_SIZE = 50 * 1024 * 1024
+
+# Segundos que o resultado da verificação pública (/verify/) fica no cache
+# do Django; invalidado quando a assinatura ou o original do documento mudam.
+FLUXO_VERIFY_CACHE_TIMEOUT = 3600
+
+# Exige um cache compartilhado entre processos (verificação fluxo.E001): as
+# invalidações do cache de instituições e da verificação pública precisam
+# alcançar todos os processos. Desligado no desenvolvimento (runserver, um processo).
+FLUXO_REQUIRE_SHARED_CACHE = False
+
+# Requisições repetidas de assinatura (duplo clique, retry): segundos até o
+# registro da execução em andamento expirar e segundos que a repetição espera
+# pela primeira, ocupando o worker (ver fluxo.idempotency). Com vários
+# processos, use um cache compartilhado com `add` atômico (ver fluxo.checks).
+FLUXO_SIGN_IN_FLIGHT_TIMEOUT = 120
+FLUXO_SIGN_WAIT_TIMEOUT = 5
+
+# PRAGMAs executados em cada nova conexão SQLite (ver fluxo.sqlite). Vazio no
+# desenvolvimento; o perfil de produção (Assinatura.settings_production) liga WAL & cia.
+FLUXO_SQLITE_PRAGMAS = {}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'fluxo.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
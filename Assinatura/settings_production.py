@@ -0,0 +1,56 @@
+"""
+Perfil de produção com SQLite: DJANGO_SETTINGS_MODULE=Assinatura.settings_production
+
+Herda Assinatura.settings e ajusta o banco para vários processos/threads
+assinando e consultando ao mesmo tempo (ver fluxo.sqlite), com um cache
+compartilhado entre eles (ver fluxo.checks). Segredos e hosts vêm do ambiente.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+DEBUG = False
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if host]
+
+# Conexões persistentes: a abertura e os PRAGMAs são pagos uma vez por
+# processo/thread, não a cada requisição
+DATABASES['default'] = {
+    **DATABASES['default'],
+    'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        **DATABASES['default'].get('OPTIONS', {}),
+        # Espera do driver Python pelo lock de escrita (segundos)
+        'timeout': 20,
+    },
+}
+
+# Cache compartilhado entre os processos (o LocMemCache é por processo): a
+# invalidação das instituições por usuário e da verificação pública e a
+# deduplicação das assinaturas repetidas precisam valer em todos eles. O
+# DatabaseCache grava no próprio banco; crie a tabela com
+# `manage.py createcachetable`. Com Redis disponível, prefira
+# django.core.cache.backends.redis.RedisCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'fluxo_cache',
+    },
+}
+FLUXO_REQUIRE_SHARED_CACHE = True
+
+FLUXO_SQLITE_PRAGMAS = {
+    # Leitores não bloqueiam o escritor (e vice-versa); persiste no arquivo do banco
+    'journal_mode': 'WAL',
+    # Com WAL, fsync apenas nos checkpoints: um commit não espera o disco
+    'synchronous': 'NORMAL',
+    # Espera pelo lock (ms) no próprio SQLite, inclusive em BEGIN IMMEDIATE
+    'busy_timeout': 20000,
+    # Leituras via mmap do arquivo (bytes)
+    'mmap_size': 256 * 1024 * 1024,
+    # Cache de páginas por conexão (negativo: em KiB)
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
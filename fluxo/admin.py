@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Institution, InternshipDocument, DigitalSignature, DocumentHistory
+from .models import (
+    AuditCheckpoint, Institution, InternshipDocument, DigitalSignature, DocumentHistory, FileAudit, SigningJob, StoredBlob
+)
 
 # --- 1. Instituições (Universidade/Escola de Saúde) ---
 
@@ -50,16 +52,59 @@ class InternshipDocumentAdmin(admin.ModelAdmin):
             'fields': ('university', 'health_school', 'status')
         }),
         ('Arquivos e Integridade', {
-            'fields': ('original_file', 'original_hash', 'signed_file')
+            'fields': ('original_file', 'original_hash', 'signed_file', 'signed_hash', 'signed_size')
+        }),
+        ('Trilha de Auditoria', {
+            'fields': ('audit_head', 'audit_length')
         }),
         ('Detalhes do Estágio', {
             'fields': ('num_students', 'student_info')
         }),
     )
     
-    readonly_fields = ('original_hash',)
+    readonly_fields = ('original_hash', 'signed_hash', 'signed_size', 'audit_head', 'audit_length')
     
     inlines = [
         DigitalSignatureInline,
         DocumentHistoryInline,
-    ]
\ No newline at end of file
+    ]
+
+
+# --- 5. Fila de Assinaturas ---
+
+@admin.register(SigningJob)
+class SigningJobAdmin(admin.ModelAdmin):
+    """Acompanhamento das tarefas de assinatura processadas pelo worker."""
+    list_display = ('document', 'signer', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    list_select_related = ('document', 'signer')
+    readonly_fields = ('signature', 'created_at', 'started_at', 'finished_at')
+
+
+# --- 6. Armazenamento por Conteúdo ---
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    """Blobs de PDF compartilhados entre documentos (ver manage.py gc_blobs)."""
+    list_display = ('name', 'ref_count', 'created_at', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'ref_count', 'created_at', 'updated_at')
+
+
+# --- 7. Auditoria de Integridade ---
+
+@admin.register(FileAudit)
+class FileAuditAdmin(admin.ModelAdmin):
+    """Resultado da última auditoria de cada arquivo (ver manage.py audit_integrity)."""
+    list_display = ('name', 'status', 'size', 'checked_at')
+    list_filter = ('status',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'mtime_ns', 'status', 'checked_at')
+
+
+@admin.register(AuditCheckpoint)
+class AuditCheckpointAdmin(admin.ModelAdmin):
+    """Raízes de Merkle das trilhas de auditoria (ver manage.py verify_audit)."""
+    list_display = ('institution', 'leaf_count', 'root', 'created_at')
+    list_filter = ('institution',)
+    readonly_fields = ('institution', 'root', 'leaf_count', 'last_history_id', 'last_signature_id', 'created_at')
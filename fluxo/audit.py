@@ -0,0 +1,264 @@
+"""
+Trilha de auditoria encadeada por hash.
+
+Cada DocumentHistory e DigitalSignature de um documento recebe, ao ser
+gravado, a posição na trilha (`chain_index`), o hash da entrada anterior
+(`previous_hash`) e o próprio hash (`entry_hash`), calculado sobre os campos
+imutáveis da linha. O último hash fica em InternshipDocument.audit_head:
+alterar, remover ou reordenar qualquer linha quebra a cadeia.
+
+Periodicamente, `manage.py verify_audit --checkpoint` grava, por instituição,
+a raiz de uma árvore de Merkle (RFC 6962) cujas folhas são as cabeças das
+trilhas dos seus documentos (AuditCheckpoint). Uma prova de inclusão liga
+a trilha de um único documento a essa raiz com O(log n) hashes.
+"""
+import hashlib
+import heapq
+import json
+from datetime import datetime
+
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import Q
+
+from .models import DigitalSignature, DocumentHistory, InternshipDocument
+
+# Campos imutáveis que entram no hash de cada tipo de entrada
+HISTORY_FIELDS = ('document_id', 'action', 'performed_by_id', 'notes', 'created_at')
+SIGNATURE_FIELDS = (
+    'document_id', 'signer_id', 'signer_type', 'signature_data', 'signature_hash', 'certificate_data',
+    'signed_at', 'ip_address', 'user_agent', 'signer_name', 'signer_email', 'signer_cpf',
+)
+ENTRY_FIELDS = {'history': HISTORY_FIELDS, 'signature': SIGNATURE_FIELDS}
+
+
+def entry_kind(entry):
+    """'history' ou 'signature', conforme o modelo da entrada."""
+    return 'history' if entry._meta.model_name == 'documenthistory' else 'signature'
+
+
+def _canonical(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def entry_digest(previous_hash, kind, chain_index, values):
+    """
+    Hash de uma entrada da trilha. `values` são os valores de ENTRY_FIELDS[kind],
+    na mesma ordem (ex.: vindos de values_list).
+    """
+    payload = json.dumps(
+        [kind, chain_index] + [_canonical(value) for value in values],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(f'{previous_hash}\n{payload}'.encode()).hexdigest()
+
+
+def entry_values(entry):
+    """Valores de ENTRY_FIELDS já no formato gravado no banco (ex.: IPv6 normalizado)."""
+    values = []
+    for name in ENTRY_FIELDS[entry_kind(entry)]:
+        field = entry._meta.get_field(name)
+        values.append(field.get_prep_value(getattr(entry, field.attname)))
+    return values
+
+
+def chain_entries(entries):
+    """
+    Encadeia entradas novas (ainda não salvas) ao fim da trilha dos seus
+    documentos, na ordem recebida, e atualiza audit_head/audit_length.
+    Deve rodar na transação que grava as entradas: os documentos ficam
+    bloqueados (SELECT FOR UPDATE) até o commit, e a restrição única
+    (document, chain_index) impede que duas gravações concorrentes bifurquem
+    a trilha. Fora de uma transação, uma falha na gravação deixaria a cabeça
+    apontando para uma entrada inexistente.
+    """
+    if not entries:
+        return
+    if not transaction.get_connection().in_atomic_block:
+        raise TransactionManagementError("chain_entries deve rodar na transação que grava as entradas.")
+    document_ids = {entry.document_id for entry in entries}
+    heads = {
+        pk: [head, length]
+        for pk, head, length in InternshipDocument.objects.select_for_update().filter(
+            pk__in=document_ids
+        ).values_list('pk', 'audit_head', 'audit_length')
+    }
+    for entry in entries:
+        head = heads[entry.document_id]
+        entry.chain_index = head[1]
+        entry.previous_hash = head[0]
+        entry.entry_hash = entry_digest(head[0], entry_kind(entry), head[1], entry_values(entry))
+        head[0], head[1] = entry.entry_hash, head[1] + 1
+    for pk, (head, length) in heads.items():
+        InternshipDocument.objects.filter(pk=pk).update(audit_head=head, audit_length=length)
+
+    # Mantém atualizadas as instâncias já carregadas dos documentos
+    for entry in entries:
+        document = entry._state.fields_cache.get('document')
+        if document is not None:
+            document.audit_head, document.audit_length = heads[entry.document_id]
+
+
+def _chain_rows(queryset, kind, with_values, chunk_size):
+    # ENTRY_FIELDS começa sempre por document_id, já lido na primeira coluna
+    extra = ENTRY_FIELDS[kind][1:] if with_values else ()
+    rows = queryset.filter(chain_index__isnull=False).order_by('document_id', 'chain_index').values_list(
+        'document_id', 'chain_index', 'id', 'previous_hash', 'entry_hash', *extra
+    ).iterator(chunk_size=chunk_size)
+    for document_id, chain_index, pk, previous_hash, entry_hash, *values in rows:
+        yield document_id, chain_index, kind, pk, previous_hash, entry_hash, [document_id, *values]
+
+
+def iter_chain_entries(history, signatures, with_values=False, chunk_size=2000):
+    """
+    Entradas encadeadas dos querysets de DocumentHistory e DigitalSignature,
+    intercaladas na ordem (documento, posição), lendo cada tabela uma única
+    vez em streaming. Gera tuplas (document_id, chain_index, kind, id,
+    previous_hash, entry_hash, valores); os valores de ENTRY_FIELDS[kind]
+    só são lidos com `with_values`.
+    """
+    return heapq.merge(
+        _chain_rows(history, 'history', with_values, chunk_size),
+        _chain_rows(signatures, 'signature', with_values, chunk_size),
+        key=lambda entry: entry[:4],
+    )
+
+
+def prefix_length(entries, last_history_id, last_signature_id):
+    """Quantas entradas iniciais da trilha (em ordem) um checkpoint com esses IDs cobre."""
+    length = 0
+    for entry in entries:
+        if entry[3] > (last_history_id if entry[2] == 'history' else last_signature_id):
+            break
+        length += 1
+    return length
+
+
+# --- ÁRVORE DE MERKLE (RFC 6962) ---
+
+def leaf_hash(document_id, length, head):
+    """Folha da árvore de uma instituição: a cabeça da trilha de um documento."""
+    return hashlib.sha256(b'\x00' + f'{document_id}:{length}:{head}'.encode()).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+class MerkleBuilder:
+    """Calcula a raiz da árvore com as folhas chegando em sequência, em memória O(log n)."""
+
+    def __init__(self):
+        self.count = 0
+        self._stack = []
+
+    def add(self, leaf):
+        self.count += 1
+        size, node = 1, leaf
+        while self._stack and self._stack[-1][0] == size:
+            left_size, left = self._stack.pop()
+            size, node = left_size + size, node_hash(left, node)
+        self._stack.append((size, node))
+
+    def root(self):
+        if not self._stack:
+            return hashlib.sha256(b'').hexdigest()
+        node = self._stack[-1][1]
+        for _, left in reversed(self._stack[:-1]):
+            node = node_hash(left, node)
+        return node.hex()
+
+
+def _subtree_root(leaves):
+    builder = MerkleBuilder()
+    for leaf in leaves:
+        builder.add(leaf)
+    return bytes.fromhex(builder.root())
+
+
+def inclusion_path(leaves, index):
+    """Caminho de auditoria (hashes irmãos, da folha para a raiz) da folha `index`."""
+    if len(leaves) <= 1:
+        return []
+    split = 1 << ((len(leaves) - 1).bit_length() - 1)
+    if index < split:
+        return inclusion_path(leaves[:split], index) + [_subtree_root(leaves[split:])]
+    return inclusion_path(leaves[split:], index - split) + [_subtree_root(leaves[:split])]
+
+
+def root_from_path(leaf, index, count, path):
+    """Recalcula a raiz a partir da folha e do caminho (RFC 9162, 2.1.3.2); None se o caminho é inválido."""
+    if index >= count:
+        return None
+    fn, sn, node = index, count - 1, leaf
+    for sibling in path:
+        if sn == 0:
+            return None
+        if fn & 1 or fn == sn:
+            node = node_hash(sibling, node)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            node = node_hash(node, sibling)
+        fn >>= 1
+        sn >>= 1
+    return node.hex() if sn == 0 else None
+
+
+def inclusion_proof(document_id, checkpoint, chunk_size=2000):
+    """
+    Prova de inclusão da trilha do documento na raiz do checkpoint: as
+    entradas cobertas (sem os dados das linhas, que o verificador recalcula
+    com entry_digest) e o caminho de auditoria. None se o documento não tem
+    entradas no checkpoint.
+    """
+    belongs = Q(document__university_id=checkpoint.institution_id) | Q(document__health_school_id=checkpoint.institution_id)
+    entries = iter_chain_entries(
+        DocumentHistory.objects.filter(belongs, id__lte=checkpoint.last_history_id),
+        DigitalSignature.objects.filter(belongs, id__lte=checkpoint.last_signature_id),
+        chunk_size=chunk_size,
+    )
+    leaves, index, chain = [], None, []
+    current, head, length = None, '', 0
+    for entry in entries:
+        if entry[0] != current:
+            if current is not None:
+                leaves.append(leaf_hash(current, length, head))
+            current, head, length = entry[0], '', 0
+        head, length = entry[5], length + 1
+        if entry[0] == document_id:
+            index = len(leaves)
+            chain.append({
+                'kind': entry[2], 'id': entry[3], 'chain_index': entry[1],
+                'previous_hash': entry[4], 'entry_hash': entry[5],
+            })
+    if current is not None:
+        leaves.append(leaf_hash(current, length, head))
+    if index is None:
+        return None
+    return {
+        'institution_id': checkpoint.institution_id,
+        'checkpoint_id': checkpoint.pk,
+        'root': checkpoint.root,
+        'leaf_count': checkpoint.leaf_count,
+        'leaf_index': index,
+        'document_id': document_id,
+        'entries': chain,
+        'path': [sibling.hex() for sibling in inclusion_path(leaves, index)],
+    }
+
+
+def verify_inclusion_proof(proof):
+    """Confere uma prova gerada por `verify_audit --prove` (dict carregado do JSON)."""
+    head = proof['entries'][-1]['entry_hash'] if proof['entries'] else ''
+    previous = ''
+    for entry in proof['entries']:
+        if entry['previous_hash'] != previous:
+            return False
+        previous = entry['entry_hash']
+    leaf = leaf_hash(proof['document_id'], len(proof['entries']), head)
+    path = [bytes.fromhex(sibling) for sibling in proof['path']]
+    return root_from_path(leaf, proof['leaf_index'], proof['leaf_count'], path) == proof['root']
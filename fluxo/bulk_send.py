@@ -0,0 +1,296 @@
+"""
+Envio em lote de documentos pela Universidade.
+
+Recebe um manifesto CSV (file, title, description, num_students,
+health_school) e os PDFs, em um ZIP ou em vários arquivos no mesmo
+formulário. Cada entrada do ZIP é copiada em streaming para um arquivo
+temporário (em memória até FILE_UPLOAD_MAX_MEMORY_SIZE), com o SHA-256
+calculado durante a cópia: o ZIP nunca é descompactado inteiro em memória.
+Os documentos, o histórico e as assinaturas do remetente são gravados com
+bulk_create, em uma transação por lote de BULK_SEND_BATCH_SIZE documentos.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .audit import chain_entries
+from .models import (
+    DigitalSignature,
+    DocumentHistory,
+    Institution,
+    InstitutionDocumentStats,
+    InternshipDocument,
+    StoredBlob,
+)
+from .pdf import read_page_geometry
+from .storage import blob_name, content_digest, document_storage
+from .verification import invalidate_verification
+
+# Documentos gravados por transação no envio em lote
+BULK_SEND_BATCH_SIZE = 50
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_COLUMNS = ('file', 'title', 'description', 'num_students', 'health_school')
+
+
+# Limites por envio, contra arquivos compactados maliciosos (zip bombs)
+def max_files():
+    return getattr(settings, 'FLUXO_BULK_SEND_MAX_FILES', 500)
+
+
+def max_file_size():
+    return getattr(settings, 'FLUXO_BULK_SEND_MAX_FILE_SIZE', 50 * 1024 * 1024)
+
+
+class BulkSendError(Exception):
+    """Manifesto ou arquivo compactado inválido: nenhum documento é enviado."""
+
+
+def sent_records(document, user, ip_address, user_agent):
+    """
+    Histórico de envio e assinatura do remetente (Universidade) de um
+    documento novo, ainda não salvos.
+    """
+    history = DocumentHistory(
+        document=document,
+        action='sent',
+        performed_by=user,
+        notes='Documento enviado para assinatura da Escola de Saúde'
+    )
+    signature = DigitalSignature(
+        document=document,
+        signer=user,
+        signer_type='university',
+        signature_data=json.dumps({'notes': 'Enviado/Assinado pela Universidade'}),
+        signature_hash=document.original_hash[:64] if document.original_hash else 'NOHASH',
+        ip_address=ip_address,
+        user_agent=user_agent,
+        signer_name=user.get_full_name() or user.username,
+        signer_email=user.email,
+        signer_cpf='000.000.000-00'
+    )
+    return history, signature
+
+
+def parse_manifest(manifest):
+    """
+    Lê o manifesto CSV (UTF-8, separado por vírgula ou ponto e vírgula).
+    Retorna uma lista de dicts com as colunas de MANIFEST_COLUMNS e a linha
+    do arquivo ('line'). Levanta BulkSendError se o manifesto for inválido.
+    """
+    text = io.TextIOWrapper(manifest, encoding='utf-8-sig', newline='')
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(text, dialect=dialect)
+        fieldnames = [name.strip() for name in reader.fieldnames or []]
+        reader.fieldnames = fieldnames
+        missing = [column for column in ('file', 'health_school') if column not in fieldnames]
+        if missing:
+            raise BulkSendError(f"Colunas obrigatórias ausentes no manifesto: {', '.join(missing)}.")
+        rows = []
+        for row in reader:
+            entry = {column: (row.get(column) or '').strip() for column in MANIFEST_COLUMNS}
+            if not any(entry.values()):
+                continue
+            entry['file'] = os.path.basename(entry['file'])
+            entry['line'] = reader.line_num
+            rows.append(entry)
+    except UnicodeDecodeError as e:
+        raise BulkSendError("O manifesto deve estar codificado em UTF-8.") from e
+    finally:
+        # Sem detach, fechar o TextIOWrapper fecharia também o upload
+        text.detach()
+
+    if not rows:
+        raise BulkSendError("O manifesto não possui nenhum documento.")
+    if len(rows) > max_files():
+        raise BulkSendError(f"O manifesto excede o limite de {max_files()} documentos.")
+    names = [row['file'] for row in rows]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise BulkSendError(f"Arquivos repetidos no manifesto: {', '.join(duplicated)}.")
+    return rows
+
+
+def _spool(source):
+    """
+    Copia `source` em chunks para um arquivo temporário calculando o SHA-256.
+    Retorna (arquivo temporário posicionado no início, hash).
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    sha256 = hashlib.sha256()
+    size = 0
+    limit = max_file_size()
+    while chunk := source.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            spooled.close()
+            raise BulkSendError("Arquivo maior que o limite permitido.")
+        sha256.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled, sha256.hexdigest()
+
+
+def iter_zip_entries(archive):
+    """
+    Percorre os PDFs de um ZIP, um de cada vez. Gera (nome, arquivo
+    temporário, hash); o temporário é descartado assim que o consumidor
+    pede a próxima entrada. Diretórios e arquivos que não são PDF são ignorados.
+    Os limites de quantidade e de tamanho são verificados antes da primeira entrada.
+    """
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile as e:
+        raise BulkSendError("O arquivo enviado não é um ZIP válido.") from e
+    with zip_file:
+        entries = [
+            info for info in zip_file.infolist()
+            if not info.is_dir() and info.filename.lower().endswith('.pdf')
+        ]
+        if len(entries) > max_files():
+            raise BulkSendError(f"O ZIP excede o limite de {max_files()} documentos.")
+        # Antes de gerar qualquer entrada: os lotes já gravados não seriam desfeitos
+        for info in entries:
+            if info.file_size > max_file_size():
+                raise BulkSendError(f"{info.filename}: arquivo maior que o limite permitido.")
+        for info in entries:
+            with zip_file.open(info) as source:
+                spooled, digest = _spool(source)
+            with spooled:
+                yield os.path.basename(info.filename), spooled, digest
+
+
+def iter_uploaded_files(files, digests):
+    """Gera (nome, arquivo, hash) para os arquivos enviados, usando os hashes do SHA256UploadHandler."""
+    if len(files) > max_files():
+        raise BulkSendError(f"O envio excede o limite de {max_files()} documentos.")
+    for index, uploaded in enumerate(files):
+        digest = digests[index] if index < len(digests) else content_digest(uploaded)
+        yield os.path.basename(uploaded.name), uploaded, digest
+
+
+def _health_schools_for(rows):
+    """Escolas de saúde citadas no manifesto (por ID ou CNPJ), carregadas em uma consulta."""
+    references = {row['health_school'] for row in rows if row['health_school']}
+    ids = [int(reference) for reference in references if reference.isdigit()]
+    cnpjs = [reference for reference in references if not reference.isdigit()]
+    schools = {}
+    for school in Institution.objects.filter(Q(id__in=ids) | Q(cnpj__in=cnpjs), type='health_school'):
+        schools[str(school.id)] = school
+        schools[school.cnpj] = school
+    return schools
+
+
+def _save_batch(batch, user, ip_address, user_agent):
+    """Grava um lote de documentos novos, com histórico, assinaturas e contadores, em uma transação."""
+    documents = [document for document, _ in batch]
+    with transaction.atomic():
+        InternshipDocument.objects.bulk_create(documents)
+        history, signatures = zip(*(sent_records(document, user, ip_address, user_agent) for document in documents))
+        # bulk_create não dispara pre_save: as entradas são encadeadas aqui
+        chain_entries([entry for pair in zip(history, signatures) for entry in pair])
+        DocumentHistory.objects.bulk_create(history)
+        DigitalSignature.objects.bulk_create(signatures)
+
+        # bulk_create não dispara post_save: referências dos blobs e contadores
+        # por instituição são atualizados aqui, na mesma transação
+        StoredBlob.retain([name for document in documents for name in document.blob_names()])
+        InstitutionDocumentStats.record_transitions([(None, document.stats_state()) for document in documents])
+        for document in documents:
+            document._blob_names = document.blob_names()
+            document._stats_state = document.stats_state()
+    invalidate_verification(signature.signature_hash for signature in signatures)
+
+
+def send_documents(rows, entries, university, user, ip_address, user_agent):
+    """
+    Cria os documentos do manifesto `rows` (ver parse_manifest) a partir dos
+    arquivos `entries` ((nome, arquivo, hash), ver iter_zip_entries e
+    iter_uploaded_files). Retorna, na ordem do manifesto, um dict por linha
+    com 'name', 'document', 'status' ('sent' ou 'failed') e 'error'.
+    """
+    schools = _health_schools_for(rows)
+    by_name = {row['file']: row for row in rows}
+    results = {}
+    batch = []
+    seen = set()
+
+    def fail(name, error):
+        results[name] = {'name': name, 'document': None, 'status': 'failed', 'error': error}
+
+    def flush():
+        try:
+            _save_batch(batch, user, ip_address, user_agent)
+        except Exception as e:
+            print(f"Erro ao gravar o lote de documentos: {e}")
+            for document, name in batch:
+                fail(name, 'Falha ao gravar o documento.')
+        else:
+            for document, name in batch:
+                results[name] = {'name': name, 'document': document, 'status': 'sent', 'error': ''}
+        batch.clear()
+
+    for name, file, digest in entries:
+        # Arquivos fora do manifesto (ou repetidos no ZIP) são ignorados
+        row = by_name.get(name)
+        if row is None or name in seen:
+            continue
+        seen.add(name)
+        health_school = schools.get(row['health_school'])
+        if health_school is None:
+            fail(name, f"Linha {row['line']}: escola de saúde não encontrada.")
+            continue
+        try:
+            num_students = int(row['num_students'] or 0)
+        except ValueError:
+            fail(name, f"Linha {row['line']}: número de estudantes inválido.")
+            continue
+
+        try:
+            page_count, page_geometry = read_page_geometry(file)
+            file.seek(0)
+            # O storage pula a gravação se o blob já existe
+            stored_name = document_storage.save(blob_name(digest), file)
+        except Exception as e:
+            print(f"Erro ao processar o arquivo {name} do envio em lote: {e}")
+            fail(name, 'Arquivo PDF inválido.')
+            continue
+
+        document = InternshipDocument(
+            title=row['title'] or os.path.splitext(name)[0],
+            description=row['description'],
+            university=university,
+            health_school=health_school,
+            original_file=stored_name,
+            original_hash=digest,
+            page_count=page_count,
+            page_geometry=page_geometry,
+            created_by=user,
+            status='pending_health_school',
+            num_students=num_students,
+            student_info=json.dumps({'num_students': num_students})
+        )
+        batch.append((document, name))
+        if len(batch) >= BULK_SEND_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    for row in rows:
+        if row['file'] not in results:
+            fail(row['file'], f"Linha {row['line']}: arquivo não enviado.")
+    return [results[row['file']] for row in rows]
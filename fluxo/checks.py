@@ -0,0 +1,38 @@
+"""
+Verificações do sistema (manage.py check) do app fluxo.
+
+Com vários processos servindo a aplicação, o cache do Django precisa ser
+compartilhado entre eles: a invalidação das instituições por usuário (ver
+fluxo.membership) feita em um processo não alcança o LocMemCache dos outros,
+e um administrador removido manteria o acesso até o cache expirar. A
+deduplicação das assinaturas (ver fluxo.idempotency) usa `cache.add` como
+lock, o que exige um backend em que `add` seja atômico entre processos.
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Backends cujo conteúdo é visível apenas no processo que o gravou
+PROCESS_LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+# Backends compartilhados cujo `add` (verifica e grava) não é atômico
+NON_ATOMIC_ADD_CACHE_BACKENDS = ('django.core.cache.backends.filebased.FileBasedCache',)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    if not getattr(settings, 'FLUXO_REQUIRE_SHARED_CACHE', False):
+        return []
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f"O cache padrão ({backend}) é local ao processo, mas FLUXO_REQUIRE_SHARED_CACHE está ligado.",
+            hint="Configure CACHES['default'] com um backend compartilhado (ex.: DatabaseCache ou Redis).",
+            id='fluxo.E001',
+        )]
+    if backend in NON_ATOMIC_ADD_CACHE_BACKENDS:
+        return [Error(
+            f"O cache padrão ({backend}) não garante `add` atômico entre processos, "
+            "necessário à deduplicação das assinaturas (fluxo.idempotency).",
+            hint="Use DatabaseCache, Redis ou Memcached.",
+            id='fluxo.E002',
+        )]
+    return []
@@ -0,0 +1,140 @@
+"""
+Entrega dos PDFs sem carregar o arquivo inteiro na memória do worker.
+
+* FileResponse (wsgi.file_wrapper / sendfile) para o arquivo completo;
+* HTTP Range (um intervalo por requisição; com vários intervalos, o arquivo
+  inteiro é enviado) para o carregamento sob demanda do PDF.js;
+* ETag forte a partir do SHA-256 do conteúdo, com 304 para If-None-Match;
+* opcionalmente, X-Accel-Redirect (nginx) ou X-Sendfile (Apache/lighttpd),
+  para que o servidor web leia o arquivo e o Python nunca toque nos bytes.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+from .storage import blob_digest
+
+# Tamanho dos blocos lidos nas respostas parciais
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+def file_etag(field_file, content_hash=None):
+    """ETag forte: SHA-256 do conteúdo (hash conhecido ou nome do blob), ou tamanho+mtime."""
+    digest = content_hash or blob_digest(field_file.name)
+    if digest:
+        return quote_etag(digest)
+    storage = field_file.storage
+    modified = storage.get_modified_time(field_file.name).timestamp()
+    return quote_etag(f'{field_file.size:x}-{int(modified * 1000000):x}')
+
+
+def parse_range(header, size):
+    """
+    Interpreta um cabeçalho Range.
+
+    Retorna (início, fim) inclusivos, None para ignorar o cabeçalho (ausente,
+    inválido ou com vários intervalos, pois multipart/byteranges não é
+    suportado) ou False se o intervalo não é satisfazível.
+    """
+    header = (header or '').strip()
+    if not header.startswith('bytes='):
+        return None
+    specs = []
+    for spec in header[len('bytes='):].split(','):
+        match = _RANGE_SPEC_RE.match(spec.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        specs.append(match.groups())
+    if len(specs) > 1:
+        return None
+
+    start, end = specs[0]
+    if not start:
+        # Sufixo: últimos N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(field_file, start, end):
+    with field_file.storage.open(field_file.name, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(field_file):
+    """Delega a leitura do arquivo ao servidor web (settings.FLUXO_SENDFILE_BACKEND)."""
+    backend = getattr(settings, 'FLUXO_SENDFILE_BACKEND', None)
+    if not backend:
+        return None
+    response = HttpResponse(content_type='application/pdf')
+    if backend == 'nginx':
+        # Exige uma location `internal` no nginx apontando para MEDIA_ROOT
+        prefix = getattr(settings, 'FLUXO_SENDFILE_URL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + field_file.name
+    elif backend == 'xsendfile':
+        response['X-Sendfile'] = field_file.path
+    else:
+        raise ValueError(f"FLUXO_SENDFILE_BACKEND inválido: {backend!r}")
+    return response
+
+
+def serve_file(request, field_file, filename, content_hash=None, size=None):
+    """
+    Resposta de download de `field_file` com suporte a ETag/304, Range e
+    sendfile. `content_hash` e `size`, quando já conhecidos, evitam ler ou
+    consultar o arquivo.
+    """
+    etag = file_etag(field_file, content_hash)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    response = _sendfile_response(field_file)
+    if response is None:
+        size = field_file.size if size is None else size
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if byte_range is not None and if_range and if_range.strip() != etag:
+            # O arquivo mudou desde a resposta parcial anterior: envia o arquivo inteiro
+            byte_range = None
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(field_file, start, end), status=206, content_type='application/pdf'
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(field_file.storage.open(field_file.name, 'rb'), content_type='application/pdf')
+            response['Content-Length'] = str(size)
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    # Conteúdo autenticado: o navegador pode guardar, proxies compartilhados não
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(filename)}"'
+    return response
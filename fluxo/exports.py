@@ -0,0 +1,159 @@
+"""
+Exportação dos documentos assinados de uma instituição em um único ZIP.
+
+O ZIP é gerado em streaming: os PDFs são gravados sem recompressão
+(ZIP_STORED, já que o PDF é comprimido) em um destino não posicionável, e
+cada bloco produzido é entregue ao cliente (StreamingHttpResponse) ou ao
+arquivo de saída (`manage.py export_documents`) assim que fica pronto. A
+memória usada não depende do tamanho do arquivo: apenas um bloco de PDF e a
+lista de entradas do diretório central ficam em memória. O manifesto
+(manifest.csv, com o original_hash, o SHA-256 do PDF assinado e os hashes
+das assinaturas) é acumulado em um arquivo temporário e anexado ao final.
+"""
+import csv
+import hashlib
+import io
+import re
+import tempfile
+import zipfile
+
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from .models import DigitalSignature, InternshipDocument
+
+# Tamanho dos blocos lidos dos PDFs
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Documentos (e assinaturas) carregados do banco por consulta
+EXPORT_QUERY_CHUNK_SIZE = 200
+
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_COLUMNS = (
+    'document_id', 'file', 'title', 'university', 'health_school', 'status',
+    'original_hash', 'signed_sha256', 'signatures',
+)
+
+
+class _StreamBuffer:
+    """Destino não posicionável do ZipFile: acumula os bytes até o próximo `drain`."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_queryset(institution, status=None, partner_id=None):
+    """
+    Documentos assinados (com signed_file) em que a instituição é remetente
+    ou destinatária, opcionalmente filtrados por status e pela instituição
+    do outro lado (`partner_id`).
+    """
+    documents = InternshipDocument.objects.filter(
+        Q(university=institution) | Q(health_school=institution)
+    ).exclude(signed_file='').exclude(signed_file__isnull=True)
+    if status:
+        documents = documents.filter(status=status)
+    if partner_id:
+        documents = documents.filter(Q(university_id=partner_id) | Q(health_school_id=partner_id))
+    return documents.select_related('university', 'health_school').only(
+        'id', 'title', 'status', 'original_hash', 'signed_file', 'created_at',
+        'university__name', 'health_school__name',
+    ).prefetch_related(Prefetch(
+        'signatures',
+        queryset=DigitalSignature.objects.only(
+            'id', 'document_id', 'signer_type', 'signer_name', 'signature_hash', 'signed_at'
+        ).order_by('signed_at'),
+    )).order_by('id')
+
+
+def archive_name(document):
+    """Nome do PDF dentro do ZIP: ID (único) e título sem caracteres problemáticos."""
+    title = re.sub(r'[^\w.-]+', '_', document.title, flags=re.UNICODE).strip('_')[:80]
+    return f'{document.id}_{title or "documento"}_ASSINADO.pdf'
+
+
+def _zip_info(name, size):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    info.file_size = size
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def iter_export_zip(documents):
+    """
+    Gera os bytes do ZIP dos documentos (queryset de export_queryset), um
+    bloco por vez. Documentos cujo arquivo assinado não pode ser lido ficam
+    no manifesto com `file` e `signed_sha256` vazios.
+    """
+    return (chunk for chunk in _iter_export_zip(documents) if chunk)
+
+
+def _iter_export_zip(documents):
+    buffer = _StreamBuffer()
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as manifest:
+        text = io.TextIOWrapper(manifest, encoding='utf-8', newline='', write_through=True)
+        writer = csv.writer(text)
+        writer.writerow(MANIFEST_COLUMNS)
+
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+            for document in documents.iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE):
+                name, signed_sha256 = archive_name(document), ''
+                try:
+                    source = document.signed_file.open('rb')
+                    size = document.signed_file.size
+                except OSError as e:
+                    print(f"Erro ao exportar o documento {document.id}: {e}")
+                    name = ''
+                else:
+                    sha256 = hashlib.sha256()
+                    with source, zip_file.open(
+                        _zip_info(name, size), 'w', force_zip64=size > zipfile.ZIP64_LIMIT
+                    ) as target:
+                        while chunk := source.read(EXPORT_CHUNK_SIZE):
+                            sha256.update(chunk)
+                            target.write(chunk)
+                            yield buffer.drain()
+                    signed_sha256 = sha256.hexdigest()
+                    yield buffer.drain()
+
+                writer.writerow([
+                    document.id,
+                    name,
+                    document.title,
+                    document.university.name,
+                    document.health_school.name,
+                    document.status,
+                    document.original_hash,
+                    signed_sha256,
+                    ';'.join(
+                        f'{signature.signer_type}:{signature.signature_hash}'
+                        for signature in document.signatures.all()
+                    ),
+                ])
+
+            text.detach()
+            size = manifest.tell()
+            manifest.seek(0)
+            with zip_file.open(_zip_info(MANIFEST_NAME, size), 'w') as target:
+                while chunk := manifest.read(EXPORT_CHUNK_SIZE):
+                    target.write(chunk)
+                    yield buffer.drain()
+        # Diretório central, gravado ao fechar o ZipFile
+        yield buffer.drain()
+
+
+def export_filename(institution):
+    """Nome sugerido para o ZIP exportado."""
+    return f'documentos_assinados_{institution.pk}_{timezone.localdate():%Y%m%d}.zip'
@@ -0,0 +1,91 @@
+"""
+Deduplicação de requisições repetidas de assinatura (duplo clique, retry do proxy).
+
+O formulário de assinatura leva uma chave de idempotência (campo oculto
+`idempotency_key`, gerado a cada exibição). `run_once` registra no cache do
+Django a execução em andamento por escopo (documento, signatário e papel):
+uma requisição repetida não carimba o PDF de novo; ela espera a primeira
+terminar e reaproveita o resultado guardado para a mesma chave. O registro
+expira sozinho (FLUXO_SIGN_IN_FLIGHT_TIMEOUT) se o processo morrer no meio.
+
+Com vários processos, o cache precisa ser compartilhado e ter `add`
+atômico (DatabaseCache, Redis, Memcached; ver fluxo.checks) para que a
+deduplicação valha entre eles; de qualquer forma, o lock de
+finalize_signatures e a restrição única de DigitalSignature impedem uma
+segunda assinatura. A espera ocupa o worker da requisição repetida, por isso
+é curta (FLUXO_SIGN_WAIT_TIMEOUT): esgotada, a view responde que a
+assinatura está em processamento em vez de bloquear.
+"""
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Segundos que o resultado fica disponível para a mesma chave
+RESULT_TIMEOUT = 3600
+POLL_INTERVAL = 0.1
+
+_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class InFlightTimeout(Exception):
+    """A execução em andamento no mesmo escopo não terminou dentro da espera (FLUXO_SIGN_WAIT_TIMEOUT)."""
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def clean_key(value):
+    """A chave enviada pelo formulário, ou uma nova se ausente ou inválida (formulários antigos)."""
+    return value if _KEY_RE.match(value or '') else new_key()
+
+
+def in_flight_timeout():
+    """Segundos até o registro de uma execução em andamento expirar."""
+    return getattr(settings, 'FLUXO_SIGN_IN_FLIGHT_TIMEOUT', 120)
+
+
+def wait_timeout():
+    """Segundos que uma requisição repetida espera pela primeira."""
+    return getattr(settings, 'FLUXO_SIGN_WAIT_TIMEOUT', 5)
+
+
+def in_flight_key(scope):
+    return f'fluxo:inflight:{scope}'
+
+
+def result_key(scope, key):
+    return f'fluxo:idempotency:{scope}:{key}'
+
+
+def run_once(scope, key, func, timeout=None):
+    """
+    Executa `func()` (que não pode retornar None) no máximo uma vez por vez no
+    escopo e uma única vez por chave. Retorna (resultado, executado): uma
+    requisição com a mesma chave recebe o resultado guardado; com outra
+    chave, executa `func` depois que a anterior terminar (cabe a `func`
+    conferir o estado no banco). Levanta InFlightTimeout se a espera
+    (`timeout`, por padrão FLUXO_SIGN_WAIT_TIMEOUT) esgotar.
+    """
+    deadline = time.monotonic() + (wait_timeout() if timeout is None else timeout)
+    while True:
+        cached = cache.get(result_key(scope, key))
+        if cached is not None:
+            return cached, False
+        if cache.add(in_flight_key(scope), key, in_flight_timeout()):
+            break
+        if time.monotonic() >= deadline:
+            raise InFlightTimeout(scope)
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        result = func()
+        cache.set(result_key(scope, key), result, RESULT_TIMEOUT)
+        return result, True
+    finally:
+        # Só libera o próprio registro (ele pode ter expirado e sido tomado por outra requisição)
+        if cache.get(in_flight_key(scope)) == key:
+            cache.delete(in_flight_key(scope))
@@ -0,0 +1,136 @@
+"""
+Instrumentação opcional por requisição (settings.FLUXO_SERVER_TIMING).
+
+O ServerTimingMiddleware mede o tempo total, o número de consultas e o tempo
+gasto no banco, a renderização de templates e os trechos marcados com
+`span(...)` (carimbo, QR Code, mesclagem e gravação do PDF assinado). O
+resultado vai para o cabeçalho `Server-Timing` e para uma linha JSON no
+logger `fluxo.timing`.
+
+Desativado, o middleware nem é instalado (MiddlewareNotUsed) e cada `span`
+custa apenas a leitura de uma ContextVar.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('fluxo.timing')
+
+_active = ContextVar('fluxo_request_timing', default=None)
+
+
+class RequestTiming:
+    """Tempos acumulados de uma requisição."""
+
+    def __init__(self):
+        self.spans = {}
+        self.db_queries = 0
+        self.db_time = 0.0
+
+    def add(self, name, seconds):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.db_queries += 1
+
+    def header(self, total):
+        """Valor do cabeçalho Server-Timing (durações em ms)."""
+        metrics = [f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"']
+        for name, (seconds, count) in self.spans.items():
+            metrics.append(f'{name};dur={seconds * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else ''))
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_log(self, request, response, total):
+        match = getattr(request, 'resolver_match', None)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'db_queries': self.db_queries,
+            'spans': {name: round(seconds * 1000, 1) for name, (seconds, _) in self.spans.items()},
+        }
+
+
+@contextmanager
+def span(name):
+    """Mede um trecho da requisição atual; sem instrumentação ativa, não faz nada."""
+    timing = _active.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+_templates_lock = threading.Lock()
+_templates_instrumented = False
+
+
+def _instrument_templates():
+    """
+    Mede a renderização dos templates (backend do Django) como o span 'tpl'.
+    Instalado uma única vez por processo, mesmo com vários handlers (threads,
+    recarga do middleware); fora de uma requisição instrumentada, o span não
+    faz nada.
+    """
+    global _templates_instrumented
+    with _templates_lock:
+        if _templates_instrumented:
+            return
+        from django.template.backends.django import Template
+
+        original_render = Template.render
+
+        def render(self, context=None, request=None):
+            with span('tpl'):
+                return original_render(self, context, request)
+
+        Template.render = render
+        _templates_instrumented = True
+
+
+class ServerTimingMiddleware:
+    """Adiciona Server-Timing e registra os tempos da requisição; deve ser o primeiro middleware."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'FLUXO_SERVER_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        _instrument_templates()
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _active.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            _active.reset(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = timing.header(total)
+        logger.info(json.dumps(timing.as_log(request, response, total)))
+        return response
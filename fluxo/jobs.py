@@ -0,0 +1,155 @@
+"""
+Fila de assinaturas baseada no banco de dados (sem broker externo).
+
+A view apenas registra um SigningJob e retorna. O comando
+`manage.py signing_worker` reivindica as tarefas pendentes, renderiza os PDFs
+em um ProcessPoolExecutor e grava o resultado de forma transacional e
+idempotente (ver services.finalize_signature).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SigningJob
+from .services import build_signature, finalize_signature, render_signed_pdf
+
+# Número máximo de tentativas antes de marcar a tarefa como falha definitiva
+MAX_ATTEMPTS = 3
+# Tarefas 'running' há mais tempo que isso são consideradas abandonadas (worker morto)
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue_signing(document, user, signer_cpf, position_x, position_y, ip_address, user_agent):
+    """
+    Registra uma tarefa de assinatura. Se já houver uma tarefa ativa do mesmo
+    signatário para o documento, ela é reutilizada.
+    """
+    with transaction.atomic():
+        job = SigningJob.objects.filter(
+            document=document,
+            signer=user,
+            status__in=SigningJob.ACTIVE_STATUSES
+        ).first()
+        if job is not None:
+            return job, False
+        job = SigningJob.objects.create(
+            document=document,
+            signer=user,
+            signer_cpf=signer_cpf,
+            position_x=position_x,
+            position_y=position_y,
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+    return job, True
+
+
+def latest_job_for(document, user):
+    """Retorna a tarefa mais recente do usuário para o documento (ou None)."""
+    return SigningJob.objects.filter(document=document, signer=user).order_by('-created_at').first()
+
+
+def requeue_stale_jobs(now=None):
+    """Devolve à fila as tarefas presas em 'running' por workers que morreram."""
+    now = now or timezone.now()
+    stale = SigningJob.objects.filter(status='running', started_at__lt=now - STALE_AFTER)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', error='Número máximo de tentativas excedido.', finished_at=now
+    )
+    requeued = stale.update(status='queued')
+    return requeued, failed
+
+
+def claim_jobs(limit):
+    """
+    Reivindica até `limit` tarefas da fila para este worker.
+
+    A troca de status é condicional (`status='queued'`), então dois workers
+    nunca processam a mesma tarefa. Em bancos com SKIP LOCKED as linhas já
+    reivindicadas por outro worker nem chegam a ser lidas.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = SigningJob.objects.filter(status='queued').order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        candidate_ids = list(queryset.values_list('id', flat=True)[:limit])
+
+        claimed_ids = [
+            job_id for job_id in candidate_ids
+            if SigningJob.objects.filter(id=job_id, status='queued').update(
+                status='running', started_at=now, attempts=F('attempts') + 1
+            )
+        ]
+    return list(
+        SigningJob.objects.filter(id__in=claimed_ids)
+        .select_related('document', 'signer')
+        .order_by('created_at')
+    )
+
+
+def prepare_job(job):
+    """Monta a assinatura da tarefa. A data da assinatura é a do clique (criação da tarefa)."""
+    return build_signature(
+        job.document, job.signer, job.signer_cpf, job.position_x, job.position_y,
+        job.ip_address, job.user_agent, signed_at=job.created_at, signer_type=job.signer_type
+    )
+
+
+def complete_job(job, signature, signed_pdf_content):
+    """Finaliza a tarefa gravando a assinatura (ou reaproveitando uma já existente)."""
+    if signed_pdf_content is None:
+        return fail_job(job, "Falha ao gerar o documento assinado digitalmente.")
+    # Assinatura e conclusão da tarefa no mesmo commit
+    with transaction.atomic():
+        signature, _ = finalize_signature(job.document, signature, signed_pdf_content, job.position_x, job.position_y)
+        SigningJob.objects.filter(pk=job.pk).update(
+            status='done', signature=signature, error='', finished_at=timezone.now()
+        )
+    return job
+
+
+def fail_job(job, error):
+    """Registra a falha; a tarefa volta à fila enquanto houver tentativas."""
+    status = 'failed' if job.attempts >= MAX_ATTEMPTS else 'queued'
+    SigningJob.objects.filter(pk=job.pk).update(
+        status=status, error=str(error), finished_at=timezone.now() if status == 'failed' else None
+    )
+    return job
+
+
+def run_jobs(jobs, executor=None):
+    """
+    Processa as tarefas reivindicadas. Com `executor` (ProcessPoolExecutor), a
+    renderização dos PDFs acontece em paralelo nos processos filhos; as
+    gravações no banco ficam sempre no processo do worker.
+    """
+    pending = []
+    for job in jobs:
+        try:
+            existing = job.document.signatures.filter(signer=job.signer, signer_type=job.signer_type).first()
+            if existing is not None:
+                # Já assinado (ex.: tarefa reprocessada): conclui sem re-carimbar
+                SigningJob.objects.filter(pk=job.pk).update(
+                    status='done', signature=existing, finished_at=timezone.now()
+                )
+                continue
+            signature, signature_info = prepare_job(job)
+        except Exception as e:
+            # Só esta tarefa falha; as demais do lote seguem
+            fail_job(job, e)
+            continue
+        args = (job.document, signature_info, signature.signature_hash, job.position_x, job.position_y)
+        if executor is None:
+            pending.append((job, signature, None, args))
+        else:
+            pending.append((job, signature, executor.submit(render_signed_pdf, *args), args))
+
+    for job, signature, future, args in pending:
+        try:
+            content = render_signed_pdf(*args) if future is None else future.result()
+            complete_job(job, signature, content)
+        except Exception as e:
+            fail_job(job, e)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from fluxo.models import FileAudit, InternshipDocument
+from fluxo.storage import blob_digest, document_storage
+
+# Blocos lidos por vez no cálculo do hash (hashlib libera o GIL em blocos grandes)
+CHUNK_SIZE = 1024 * 1024
+# Arquivos processados (e registros gravados) por lote
+BATCH_SIZE = 500
+
+
+def hash_file(path):
+    """SHA-256 do arquivo, lido em blocos."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as source:
+        while chunk := source.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula, em paralelo, o SHA-256 dos PDFs originais e assinados e registra "
+        "os arquivos divergentes ou ausentes (FileAudit)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help="Não recalcula arquivos íntegros cujo tamanho e mtime não mudaram desde a última auditoria.")
+        parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                            help="Número de threads de leitura/hash.")
+
+    def handle(self, *args, **options):
+        self.incremental = options['incremental']
+        started = time.perf_counter()
+
+        expected, documents = self.expected_hashes()
+        previous = {
+            name: (sha256, size, mtime_ns, status)
+            for name, sha256, size, mtime_ns, status in FileAudit.objects.values_list(
+                'name', 'sha256', 'size', 'mtime_ns', 'status'
+            ).iterator(chunk_size=2000)
+        }
+
+        names = sorted(documents)
+        totals = defaultdict(int)
+        problems = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for start in range(0, len(names), BATCH_SIZE):
+                batch = names[start:start + BATCH_SIZE]
+                checks = executor.map(lambda name: self.audit_file(name, expected[name], previous.get(name)), batch)
+                now = timezone.now()
+                audits = []
+                for name, (status, sha256, size, mtime_ns, hashed) in zip(batch, checks):
+                    totals[status] += 1
+                    if hashed:
+                        totals['hashed'] += 1
+                        totals['bytes'] += size
+                    elif status != 'missing':
+                        totals['skipped'] += 1
+                    if status != 'ok':
+                        problems.append((name, status))
+                    audits.append(FileAudit(
+                        name=name, sha256=sha256, size=size, mtime_ns=mtime_ns, status=status, checked_at=now
+                    ))
+                FileAudit.objects.bulk_create(
+                    audits,
+                    update_conflicts=True,
+                    unique_fields=['name'],
+                    update_fields=['sha256', 'size', 'mtime_ns', 'status', 'checked_at'],
+                )
+
+        for name, status in problems:
+            label = 'Hash divergente' if status == 'mismatch' else 'Arquivo ausente'
+            ids = ', '.join(str(document_id) for document_id in sorted(documents[name]))
+            self.stdout.write(f"{label}: {name} (documento(s) {ids})")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{len(names)} arquivo(s) em {elapsed:.1f}s: {totals['hashed']} recalculado(s) "
+            f"({totals['bytes'] / (1024 * 1024):.1f} MB), {totals['skipped']} sem alteração, "
+            f"{totals['mismatch']} divergente(s), {totals['missing']} ausente(s)."
+        )
+        if problems:
+            raise CommandError(f"{len(problems)} arquivo(s) com problema de integridade.")
+        self.stdout.write(self.style.SUCCESS("Todos os arquivos estão íntegros."))
+
+    def expected_hashes(self):
+        """
+        Hashes esperados por arquivo: o original_hash e o signed_hash dos
+        documentos e o hash contido no nome dos blobs. Retorna (hashes por
+        nome, documentos por nome).
+        """
+        expected = defaultdict(set)
+        documents = defaultdict(set)
+        rows = InternshipDocument.objects.values_list(
+            'id', 'original_file', 'original_hash', 'signed_file', 'signed_hash'
+        ).iterator(chunk_size=2000)
+        for document_id, original, original_hash, signed, signed_hash in rows:
+            for name, known_hash in ((original, original_hash), (signed, signed_hash)):
+                if not name:
+                    continue
+                documents[name].add(document_id)
+                for digest in (known_hash, blob_digest(name)):
+                    if digest:
+                        expected[name].add(digest)
+        return expected, documents
+
+    def audit_file(self, name, expected, previous):
+        """
+        Audita um arquivo. Retorna (status, sha256, tamanho, mtime_ns, recalculado).
+        Sem hash esperado (ex.: assinado antigo, sem signed_hash), compara com o hash da
+        auditoria anterior; na primeira auditoria, o hash calculado vira a
+        referência, e uma divergência continua registrada até o registro do
+        FileAudit ser removido (após a investigação).
+        """
+        try:
+            stat = os.stat(document_storage.path(name))
+        except FileNotFoundError:
+            return 'missing', '', None, None, False
+
+        if not expected and previous:
+            if previous[3] == 'mismatch':
+                return 'mismatch', previous[0], stat.st_size, stat.st_mtime_ns, False
+            if previous[0]:
+                expected = {previous[0]}
+        if (self.incremental and previous and previous[3] == 'ok'
+                and previous[1] == stat.st_size and previous[2] == stat.st_mtime_ns
+                and (not expected or expected == {previous[0]})):
+            return 'ok', previous[0], stat.st_size, stat.st_mtime_ns, False
+
+        try:
+            sha256 = hash_file(document_storage.path(name))
+        except FileNotFoundError:
+            return 'missing', '', None, None, False
+        status = 'mismatch' if expected - {sha256} else 'ok'
+        return status, sha256, stat.st_size, stat.st_mtime_ns, True
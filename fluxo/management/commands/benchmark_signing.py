@@ -0,0 +1,90 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from fluxo.pdf import SIGNING_MODES, create_signature_stamp_pdf
+from fluxo.stamps import get_stamp_template
+
+
+def build_synthetic_pdf(num_pages):
+    """Gera um PDF sintético com `num_pages` páginas de texto."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for page_num in range(num_pages):
+        c.setFont("Helvetica", 10)
+        for line in range(50):
+            c.drawString(50, 800 - line * 15, f"Termo de Compromisso de Estágio - página {page_num + 1}, cláusula {line + 1}")
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Compara os modos de assinatura 'rewrite' e 'incremental' em PDFs sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', default='1,10,100,500,1000',
+                            help="Lista de tamanhos (em páginas) separados por vírgula.")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Número de repetições por medição (usa a melhor).")
+        parser.add_argument('--stamps', type=int, default=0,
+                            help="Mede também a vazão de geração de carimbos (carimbos/s) com N carimbos, "
+                                 "sem e com o cache de templates.")
+
+    def benchmark_stamps(self, signature_info, count):
+        rates = {}
+        for cached in (False, True):
+            get_stamp_template.cache_clear()
+            start = time.perf_counter()
+            for i in range(count):
+                if not cached:
+                    # Sem cache: o template é remontado a cada carimbo
+                    get_stamp_template.cache_clear()
+                create_signature_stamp_pdf(signature_info, 300, 100, f'{i:064x}')
+            elapsed = time.perf_counter() - start
+            rates[cached] = count / elapsed
+            label = 'com cache' if cached else 'sem cache'
+            self.stdout.write(f"carimbos ({label}): {count} em {elapsed:.2f}s ({rates[cached]:.0f} carimbos/s)")
+        self.stdout.write(f"ganho do cache de templates: {rates[True] / rates[False]:.2f}x")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['pages'].split(',')]
+        repeat = options['repeat']
+
+        signature_info = {
+            'document_id': 1,
+            'signer_name': 'Benchmark',
+            'signer_cpf': '000.000.000-00',
+            'signer_type': 'health_school',
+            'signing_timestamp': '2025-01-01T00:00:00',
+            'document_hash': '0' * 64,
+        }
+        if options['stamps']:
+            self.benchmark_stamps(signature_info, options['stamps'])
+
+        stamp_page = create_signature_stamp_pdf(signature_info, 300, 100, 'f' * 64)
+
+        self.stdout.write(f"{'páginas':>8} {'original':>10} | {'rewrite':>10} {'saída':>10} | {'incremental':>11} {'saída':>10} | {'ganho':>6}")
+        for num_pages in sizes:
+            data = build_synthetic_pdf(num_pages)
+            results = {}
+            for mode, merge in SIGNING_MODES.items():
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    output = merge(io.BytesIO(data), stamp_page)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results[mode] = (best, len(output))
+
+            rewrite_time, rewrite_size = results['rewrite']
+            incremental_time, incremental_size = results['incremental']
+            self.stdout.write(
+                f"{num_pages:>8} {len(data) / 1024:>8.0f}KB | "
+                f"{rewrite_time * 1000:>8.1f}ms {rewrite_size / 1024:>8.0f}KB | "
+                f"{incremental_time * 1000:>9.1f}ms {incremental_size / 1024:>8.0f}KB | "
+                f"{rewrite_time / incremental_time:>5.1f}x"
+            )
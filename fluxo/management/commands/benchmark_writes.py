@@ -0,0 +1,164 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from fluxo.bulk_send import sent_records
+from fluxo.management.commands.benchmark_signing import build_synthetic_pdf
+from fluxo.models import DocumentHistory, Institution, InternshipDocument
+from fluxo.services import build_signature, finalize_signature, send_document
+from fluxo.storage import blob_name
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class CommitCounter:
+    """
+    Conta os commits da conexão da thread atual: commits explícitos (fim de
+    um transaction.atomic) e escritas feitas em modo autocommit.
+    """
+
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not context['connection'].in_atomic_block and sql.lstrip().split(None, 1)[0].upper() in WRITE_STATEMENTS:
+            self.commits += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        commit = connection.commit
+
+        def counted_commit():
+            self.commits += 1
+            commit()
+
+        connection.commit = counted_commit
+        return connection.execute_wrapper(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a vazão de commits dos fluxos de envio e assinatura com várias threads "
+        "gravando ao mesmo tempo no banco configurado. Os registros criados são "
+        "removidos ao final (os blobs ficam para o gc_blobs)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,4,8',
+                            help="Lista de números de threads separados por vírgula.")
+        parser.add_argument('--documents', type=int, default=50,
+                            help="Documentos enviados e assinados por thread.")
+        parser.add_argument('--autocommit', action='store_true',
+                            help="Compara com a sequência antiga, sem transação (um commit por escrita).")
+
+    def handle(self, *args, **options):
+        self.base_pdf = build_synthetic_pdf(1)
+        suffix = uuid.uuid4().hex[:8]
+        self.user = User.objects.create_user(f'benchmark-{suffix}', f'benchmark-{suffix}@example.com')
+        self.university = Institution.objects.create(
+            name=f'Benchmark {suffix}', type='university', cnpj=f'bench-u-{suffix}'
+        )
+        self.health_school = Institution.objects.create(
+            name=f'Benchmark {suffix}', type='health_school', cnpj=f'bench-h-{suffix}'
+        )
+        modes = [('atomic', self.atomic_workflow)]
+        if options['autocommit']:
+            modes.append(('autocommit', self.autocommit_workflow))
+
+        self.stdout.write(
+            f"{'modo':>10} {'threads':>7} {'fluxos':>7} {'erros':>6} {'tempo':>8} "
+            f"{'fluxos/s':>9} {'commits':>8} {'commits/s':>10}"
+        )
+        try:
+            for num_threads in [int(value) for value in options['threads'].split(',')]:
+                for mode, workflow in modes:
+                    self.run(mode, workflow, num_threads, options['documents'])
+        finally:
+            InternshipDocument.objects.filter(university=self.university).delete()
+            Institution.objects.filter(pk__in=[self.university.pk, self.health_school.pk]).delete()
+            self.user.delete()
+
+    def run(self, mode, workflow, num_threads, num_documents):
+        totals = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(num_threads)
+
+        def worker(index):
+            counter = CommitCounter()
+            results = Counter()
+            try:
+                with counter.install():
+                    barrier.wait()
+                    for i in range(num_documents):
+                        try:
+                            workflow(f'{mode}-{num_threads}-{index}-{i}-{uuid.uuid4().hex}')
+                            results['workflows'] += 1
+                        except OperationalError as e:
+                            # Ex.: "database is locked" no SQLite após o timeout
+                            print(f"Erro no fluxo de benchmark: {e}")
+                            results['errors'] += 1
+            finally:
+                results['commits'] = counter.commits
+                connection.close()
+                close_old_connections()
+            with lock:
+                totals.update(results)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{mode:>10} {num_threads:>7} {totals['workflows']:>7} {totals['errors']:>6} {elapsed:>7.2f}s "
+            f"{totals['workflows'] / elapsed:>9.1f} {totals['commits']:>8} {totals['commits'] / elapsed:>10.1f}"
+        )
+
+    def pdf_content(self, seed):
+        """PDF sintético de uma página com conteúdo único (blob novo a cada fluxo)."""
+        return self.base_pdf + b'% benchmark ' + seed.encode() + b'\n'
+
+    def atomic_workflow(self, seed):
+        """Envio e assinatura pela camada de serviços: um commit por etapa."""
+        document = send_document(
+            self.university, self.health_school, ContentFile(self.pdf_content(seed), name='benchmark.pdf'),
+            self.user, '127.0.0.1', 'benchmark', title=f'Benchmark {seed}',
+        )
+        signature, _ = build_signature(document, self.user, '000.000.000-00', 100, 100, '127.0.0.1', 'benchmark')
+        finalize_signature(document, signature, self.pdf_content(f'{seed}-assinado'), 100, 100)
+
+    def autocommit_workflow(self, seed):
+        """A sequência anterior das views: cada escrita confirmada isoladamente."""
+        document = InternshipDocument.objects.create(
+            title=f'Benchmark {seed}',
+            description='',
+            university=self.university,
+            health_school=self.health_school,
+            original_file=ContentFile(self.pdf_content(seed), name='benchmark.pdf'),
+            created_by=self.user,
+        )
+        history, signature = sent_records(document, self.user, '127.0.0.1', 'benchmark')
+        history.save()
+        signature.save()
+
+        signature, _ = build_signature(document, self.user, '000.000.000-00', 100, 100, '127.0.0.1', 'benchmark')
+        signature.save()
+        content = self.pdf_content(f'{seed}-assinado')
+        document.signed_file.save(blob_name(document.calculate_hash(ContentFile(content))), ContentFile(content), save=False)
+        document.status = 'signed_health_school'
+        document.save()
+        DocumentHistory.objects.create(
+            document=document,
+            action='signed',
+            performed_by=self.user,
+            notes='Documento assinado digitalmente (benchmark)'
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from fluxo.models import Institution, InstitutionDocumentStats
+
+COUNTER_FIELDS = ('pending', 'signed', 'completed', 'rejected', 'total')
+
+
+class Command(BaseCommand):
+    help = "Verifica e reconstrói os contadores de documentos por instituição (InstitutionDocumentStats)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Apenas compara os contadores com os documentos; falha se houver divergência.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = self.drift()
+            for institution_id, field, stored, actual in drift:
+                self.stdout.write(f"Instituição {institution_id}: {field} = {stored}, esperado {actual}")
+            if drift:
+                raise CommandError(f"{len(drift)} contador(es) divergente(s). Rode `manage.py document_stats` para reconstruir.")
+            self.stdout.write(self.style.SUCCESS("Contadores consistentes."))
+            return
+
+        with transaction.atomic():
+            # Apaga primeiro: no SQLite a escrita bloqueia as demais até o fim da
+            # reconstrução, e nenhuma atualização concorrente se perde.
+            InstitutionDocumentStats.objects.all().delete()
+            counts = InstitutionDocumentStats.compute()
+            InstitutionDocumentStats.objects.bulk_create([
+                InstitutionDocumentStats(institution_id=institution_id, **counters)
+                for institution_id, counters in counts.items()
+            ])
+        self.stdout.write(self.style.SUCCESS(f"Contadores reconstruídos para {len(counts)} instituição(ões)."))
+
+    def drift(self):
+        """Lista (instituição, campo, valor gravado, valor real) dos contadores divergentes."""
+        actual = InstitutionDocumentStats.compute()
+        stored = {stats.institution_id: stats.as_counts() for stats in InstitutionDocumentStats.objects.all()}
+        drift = []
+        for institution_id in Institution.objects.values_list('id', flat=True):
+            expected = actual.get(institution_id, {})
+            current = stored.get(institution_id, {})
+            for field in COUNTER_FIELDS:
+                if current.get(field, 0) != expected.get(field, 0):
+                    drift.append((institution_id, field, current.get(field, 0), expected.get(field, 0)))
+        return drift
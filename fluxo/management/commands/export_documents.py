@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fluxo.exports import export_filename, export_queryset, iter_export_zip
+from fluxo.models import Institution, InternshipDocument
+
+
+class Command(BaseCommand):
+    help = "Exporta em um ZIP os documentos assinados de uma instituição, com manifest.csv dos hashes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('institution', type=int, help="ID da instituição (universidade ou escola de saúde).")
+        parser.add_argument('--output', '-o',
+                            help="Arquivo ZIP de saída ('-' para a saída padrão). Padrão: nome gerado no diretório atual.")
+        parser.add_argument('--status', choices=[value for value, _ in InternshipDocument.STATUS_CHOICES],
+                            help="Exporta apenas os documentos com este status.")
+        parser.add_argument('--partner', type=int,
+                            help="Exporta apenas os documentos trocados com esta instituição.")
+
+    def handle(self, *args, **options):
+        try:
+            institution = Institution.objects.get(pk=options['institution'])
+        except Institution.DoesNotExist:
+            raise CommandError(f"Instituição {options['institution']} não encontrada.")
+
+        documents = export_queryset(institution, status=options['status'], partner_id=options['partner'])
+        output = options['output'] or export_filename(institution)
+        if output == '-':
+            for chunk in iter_export_zip(documents):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        size = 0
+        with open(output, 'wb') as target:
+            for chunk in iter_export_zip(documents):
+                target.write(chunk)
+                size += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Exportado: {output} ({size / (1024 * 1024):.2f} MB)."))
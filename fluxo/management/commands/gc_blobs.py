@@ -0,0 +1,137 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from fluxo.models import InternshipDocument, StoredBlob
+from fluxo.storage import BLOB_PREFIX, PREVIEW_PREFIX, blob_digest, document_storage, preview_digest
+
+
+class Command(BaseCommand):
+    help = "Remove os blobs de PDF sem referências e as prévias órfãs (armazenamento endereçado por conteúdo)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Só remove blobs sem uso há mais que esse tempo (padrão: 24h).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Apenas lista o que seria removido.")
+        parser.add_argument('--repair', action='store_true',
+                            help="Recalcula as referências a partir dos documentos antes da coleta.")
+        parser.add_argument('--adopt-legacy', action='store_true',
+                            help="Move os arquivos antigos (nomes por data) para o armazenamento de blobs.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        if options['adopt_legacy']:
+            self.adopt_legacy(dry_run)
+        if options['repair']:
+            self.repair(dry_run)
+
+        freed = removed = 0
+        for blob in StoredBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff):
+            if self.recently_used(blob.name, cutoff):
+                continue
+            size = self.size(blob.name)
+            if not dry_run:
+                # Condicional: um upload pode ter voltado a referenciar o blob
+                deleted, _ = StoredBlob.objects.filter(
+                    pk=blob.pk, ref_count__lte=0, updated_at__lt=cutoff
+                ).delete()
+                if not deleted:
+                    continue
+                document_storage.delete(blob.name)
+            self.stdout.write(f"Removido: {blob.name}")
+            freed += size
+            removed += 1
+
+        # Arquivos sem registro (ex.: gravação interrompida antes do commit)
+        tracked = set(StoredBlob.objects.values_list('name', flat=True))
+        for name in self.files_under(BLOB_PREFIX):
+            if name in tracked or self.recently_used(name, cutoff):
+                continue
+            size = self.size(name)
+            if not dry_run:
+                document_storage.delete(name)
+            self.stdout.write(f"Removido (sem registro): {name}")
+            freed += size
+            removed += 1
+
+        # Prévias de originais que nenhum documento referencia mais
+        hashes = set(InternshipDocument.objects.values_list('original_hash', flat=True))
+        for name in self.files_under(PREVIEW_PREFIX):
+            if preview_digest(name) in hashes or self.recently_used(name, cutoff):
+                continue
+            size = self.size(name)
+            if not dry_run:
+                document_storage.delete(name)
+            self.stdout.write(f"Removida (prévia): {name}")
+            freed += size
+            removed += 1
+
+        action = "Seriam removidos" if dry_run else "Removidos"
+        self.stdout.write(self.style.SUCCESS(f"{action} {removed} blob(s), {freed / 1024 / 1024:.2f} MB."))
+
+    def repair(self, dry_run):
+        """Recalcula StoredBlob.ref_count contando as referências nos documentos."""
+        counts = Counter()
+        for original, signed in InternshipDocument.objects.values_list('original_file', 'signed_file').iterator():
+            counts.update(name for name in (original, signed) if blob_digest(name) is not None)
+
+        fixed = 0
+        existing = dict(StoredBlob.objects.values_list('name', 'ref_count'))
+        for name in set(existing) | set(counts):
+            if existing.get(name) == counts[name]:
+                continue
+            fixed += 1
+            self.stdout.write(f"Referências de {name}: {existing.get(name)} -> {counts[name]}")
+            if not dry_run:
+                StoredBlob.objects.update_or_create(name=name, defaults={'ref_count': counts[name]})
+        self.stdout.write(f"{fixed} contagem(ns) de referência corrigida(s).")
+
+    def adopt_legacy(self, dry_run):
+        """Grava os arquivos antigos como blobs e aponta os documentos para eles."""
+        adopted = 0
+        for document in InternshipDocument.objects.iterator():
+            for attname in ('original_file', 'signed_file'):
+                field_file = getattr(document, attname)
+                old_name = field_file.name
+                if not old_name or blob_digest(old_name) is not None:
+                    continue
+                if not document_storage.exists(old_name):
+                    self.stderr.write(f"Arquivo ausente no documento {document.pk}: {old_name}")
+                    continue
+                adopted += 1
+                self.stdout.write(f"Documento {document.pk}: {old_name}")
+                if dry_run:
+                    continue
+                with document_storage.open(old_name) as content:
+                    new_name = document_storage.save(old_name, content)
+                InternshipDocument.objects.filter(pk=document.pk).update(**{attname: new_name})
+                StoredBlob.retain([new_name])
+                if not InternshipDocument.objects.filter(original_file=old_name).exists() and \
+                   not InternshipDocument.objects.filter(signed_file=old_name).exists():
+                    document_storage.delete(old_name)
+        self.stdout.write(f"{adopted} arquivo(s) antigo(s) movido(s) para blobs.")
+
+    def files_under(self, prefix):
+        root = document_storage.path(prefix)
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, document_storage.location).replace(os.sep, '/')
+
+    def recently_used(self, name, cutoff):
+        try:
+            return document_storage.get_modified_time(name) >= cutoff
+        except FileNotFoundError:
+            return False
+
+    def size(self, name):
+        try:
+            return document_storage.size(name)
+        except FileNotFoundError:
+            return 0
@@ -0,0 +1,177 @@
+import hashlib
+import random
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from fluxo.management.commands.benchmark_signing import build_synthetic_pdf
+from fluxo.models import Institution, InternshipDocument
+from fluxo.services import init_render_process, send_document
+from fluxo.sqlite import read_pragmas
+
+
+def idempotency_key(run_id, document_id):
+    """Chave do formulário de assinatura de um documento, a mesma em todos os processos."""
+    return hashlib.md5(f'{run_id}:{document_id}'.encode()).hexdigest()
+
+
+def run_client(user_id, document_ids, retry_ids, run_id, duration, dashboard_ratio, sync_signing, seed):
+    """
+    Um processo de carga: alterna assinaturas (POST em health_school_sign_document)
+    e acessos ao dashboard até esgotar `duration`. Os documentos de `retry_ids`
+    (de outro processo) são assinados de novo com a mesma chave de idempotência,
+    simulando retries que chegam a outro processo. Retorna as latências por tipo
+    e as contagens de erros.
+    """
+    result = {'latencies': defaultdict(list), 'lock_errors': 0, 'errors': 0}
+    rng = random.Random(seed)
+    pending = [(document_id, 'sign') for document_id in document_ids]
+    pending += [(document_id, 'retry') for document_id in retry_ids]
+    rng.shuffle(pending)
+    client = Client()
+    with override_settings(ALLOWED_HOSTS=['testserver'], FLUXO_SIGNING_QUEUE=not sync_signing):
+        client.force_login(User.objects.get(pk=user_id))
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            kind = 'dashboard'
+            if pending and rng.random() >= dashboard_ratio:
+                document_id, kind = pending.pop()
+            start = time.perf_counter()
+            try:
+                if kind != 'dashboard':
+                    response = client.post(
+                        reverse('health_school_sign_document', args=[document_id]),
+                        {'signer_cpf': '000.000.000-00', 'signature_x': 100, 'signature_y': 100,
+                         'idempotency_key': idempotency_key(run_id, document_id)},
+                    )
+                else:
+                    response = client.get(reverse('health_school_dashboard'))
+                    client.get(reverse('health_school_dashboard_counts'))
+                if response.status_code >= 400:
+                    result['errors'] += 1
+                    continue
+            except OperationalError as e:
+                if 'locked' in str(e) or 'busy' in str(e):
+                    result['lock_errors'] += 1
+                else:
+                    result['errors'] += 1
+                continue
+            except Exception as e:
+                print(f"Erro na requisição de carga ({kind}): {e}")
+                result['errors'] += 1
+                continue
+            result['latencies'][kind].append(time.perf_counter() - start)
+    connection.close()
+    result['latencies'] = dict(result['latencies'])
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga com vários processos: assinaturas (health_school_sign_document) e "
+        "dashboards da escola de saúde ao mesmo tempo no banco configurado. Informa a vazão, "
+        "as latências e os erros de lock. Parte das assinaturas é repetida por outro processo "
+        "com a mesma chave de idempotência, exercitando o cache compartilhado. Use com "
+        "--settings=Assinatura.settings_production para medir o perfil de produção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4,
+                            help="Processos simulando signatários simultâneos.")
+        parser.add_argument('--duration', type=float, default=20,
+                            help="Duração do teste, em segundos.")
+        parser.add_argument('--documents', type=int, default=50,
+                            help="Documentos pendentes criados por processo.")
+        parser.add_argument('--dashboard-ratio', type=float, default=0.5,
+                            help="Fração das requisições que são acessos ao dashboard.")
+        parser.add_argument('--retry-ratio', type=float, default=0.2,
+                            help="Fração dos documentos assinados de novo, por outro processo, com a mesma chave.")
+        parser.add_argument('--sync-signing', action='store_true',
+                            help="Carimba na própria requisição (FLUXO_SIGNING_QUEUE=False) em vez de enfileirar.")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        # Tabela do DatabaseCache, se for o backend configurado (sem efeito nos demais)
+        call_command('createcachetable')
+        suffix = uuid.uuid4().hex[:8]
+        university = Institution.objects.create(name=f'Carga {suffix}', type='university', cnpj=f'load-u-{suffix}')
+        health_school = Institution.objects.create(name=f'Carga {suffix}', type='health_school', cnpj=f'load-h-{suffix}')
+        sender = User.objects.create_user(f'load-sender-{suffix}')
+        # Um único signatário em todos os processos: os retries de um processo
+        # caem no mesmo escopo de idempotência das assinaturas de outro
+        signer = User.objects.create_user(f'load-{suffix}')
+        health_school.admin_users.add(signer)
+
+        try:
+            self.stdout.write(f"Criando {processes * options['documents']} documento(s) pendente(s)...")
+            pdf = build_synthetic_pdf(1)
+            document_ids = [
+                send_document(
+                    university, health_school,
+                    SimpleUploadedFile('carga.pdf', pdf + f'% {suffix} {index}\n'.encode()),
+                    sender, '127.0.0.1', 'load_test', title=f'Carga {index}',
+                ).pk
+                for index in range(processes * options['documents'])
+            ]
+            # Os processos filhos abrem as próprias conexões
+            connections.close_all()
+
+            slices = [document_ids[index::processes] for index in range(processes)]
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=processes, initializer=init_render_process) as executor:
+                futures = []
+                for index in range(processes):
+                    retries = slices[(index + 1) % processes]
+                    retries = retries[:int(len(retries) * options['retry_ratio'])]
+                    futures.append(executor.submit(
+                        run_client, signer.pk, slices[index], retries, suffix, options['duration'],
+                        options['dashboard_ratio'], options['sync_signing'], index,
+                    ))
+                results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+            self.report(results, elapsed)
+        finally:
+            InternshipDocument.objects.filter(university=university).delete()
+            Institution.objects.filter(pk__in=[university.pk, health_school.pk]).delete()
+            User.objects.filter(pk__in=[sender.pk, signer.pk]).delete()
+
+    def report(self, results, elapsed):
+        latencies = defaultdict(list)
+        for result in results:
+            for kind, values in result['latencies'].items():
+                latencies[kind] += values
+        lock_errors = sum(result['lock_errors'] for result in results)
+        errors = sum(result['errors'] for result in results)
+
+        self.stdout.write(
+            f"cache={type(caches['default']).__name__} "
+            f"CONN_MAX_AGE={settings.DATABASES['default'].get('CONN_MAX_AGE', 0)} "
+            + ' '.join(f'{name}={value}' for name, value in read_pragmas(connection).items())
+        )
+
+        self.stdout.write(f"{'tipo':>10} {'requisições':>12} {'req/s':>8} {'p50':>9} {'p95':>9}")
+        total = 0
+        for kind, values in sorted(latencies.items()):
+            total += len(values)
+            values.sort()
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            self.stdout.write(
+                f"{kind:>10} {len(values):>12} {len(values) / elapsed:>8.1f} "
+                f"{statistics.median(values) * 1000:>7.1f}ms {p95 * 1000:>7.1f}ms"
+            )
+        self.stdout.write(
+            f"{total} requisição(ões) em {elapsed:.1f}s ({total / elapsed:.1f} req/s); "
+            f"erros de lock: {lock_errors}; outros erros: {errors}."
+        )
@@ -0,0 +1,46 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from fluxo.jobs import claim_jobs, requeue_stale_jobs, run_jobs
+from fluxo.services import init_render_process
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de assinaturas (SigningJob) renderizando os PDFs em um pool de processos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Número de processos de renderização (padrão: núcleos da máquina).")
+        parser.add_argument('--batch', type=int, default=None,
+                            help="Tarefas reivindicadas por ciclo (padrão: 2x o número de processos).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Intervalo (s) entre consultas quando a fila está vazia.")
+        parser.add_argument('--once', action='store_true',
+                            help="Processa a fila até esvaziar e encerra.")
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        batch = options['batch'] or processes * 2
+
+        self.stdout.write(f"Worker de assinaturas iniciado ({processes} processo(s)).")
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_render_process) as executor:
+            while True:
+                close_old_connections()
+                requeued, failed = requeue_stale_jobs()
+                if requeued or failed:
+                    self.stdout.write(f"Tarefas abandonadas: {requeued} devolvida(s) à fila, {failed} com falha.")
+
+                jobs = claim_jobs(batch)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                started = time.perf_counter()
+                run_jobs(jobs, executor)
+                self.stdout.write(f"{len(jobs)} tarefa(s) processada(s) em {time.perf_counter() - started:.2f}s.")
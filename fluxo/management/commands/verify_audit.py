@@ -0,0 +1,174 @@
+import json
+import time
+from collections import defaultdict
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from fluxo.audit import (
+    MerkleBuilder,
+    entry_digest,
+    inclusion_proof,
+    iter_chain_entries,
+    leaf_hash,
+    prefix_length,
+)
+from fluxo.models import AuditCheckpoint, DigitalSignature, DocumentHistory, InternshipDocument
+
+# Problemas listados na saída (o total é sempre informado)
+MAX_REPORTED = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica, em uma única leitura em streaming, a trilha de auditoria encadeada "
+        "(histórico e assinaturas) de todos os documentos e os checkpoints de Merkle "
+        "das instituições; opcionalmente grava novos checkpoints ou gera a prova de "
+        "inclusão de um documento."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Linhas lidas do banco por vez.")
+        parser.add_argument('--checkpoint', action='store_true',
+                            help="Grava um novo checkpoint por instituição se a verificação não encontrar problemas.")
+        parser.add_argument('--prove', type=int, metavar='DOCUMENTO',
+                            help="Gera (em JSON) a prova de inclusão do documento no último checkpoint, sem verificar o restante.")
+        parser.add_argument('--institution', type=int,
+                            help="Instituição do checkpoint usado por --prove (padrão: a universidade do documento).")
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        if options['prove'] is not None:
+            return self.prove(options['prove'], options['institution'])
+
+        started = time.perf_counter()
+        # Entradas gravadas durante a verificação ficam para a próxima execução
+        cutoff = {
+            'history': DocumentHistory.objects.aggregate(last=Max('id'))['last'] or 0,
+            'signature': DigitalSignature.objects.aggregate(last=Max('id'))['last'] or 0,
+        }
+        checkpoints = {}
+        for checkpoint in AuditCheckpoint.objects.order_by('institution_id', '-created_at', '-id'):
+            checkpoints.setdefault(checkpoint.institution_id, checkpoint)
+        checked = defaultdict(MerkleBuilder)
+        current = defaultdict(MerkleBuilder)
+
+        self.problems = []
+        totals = defaultdict(int)
+        entries = iter_chain_entries(
+            DocumentHistory.objects.filter(id__lte=cutoff['history']),
+            DigitalSignature.objects.filter(id__lte=cutoff['signature']),
+            with_values=True,
+            chunk_size=self.chunk_size,
+        )
+        chains = groupby(entries, key=lambda entry: entry[0])
+        chain_id, chain = next(chains, (None, []))
+        documents = InternshipDocument.objects.order_by('id').values_list(
+            'id', 'university_id', 'health_school_id', 'audit_head', 'audit_length'
+        ).iterator(chunk_size=self.chunk_size)
+
+        for document_id, university_id, health_school_id, audit_head, audit_length in documents:
+            chain_entries = []
+            while chain_id is not None and chain_id < document_id:
+                self.problem(f"Documento {chain_id}: entradas de trilha sem documento.")
+                chain_id, chain = next(chains, (None, []))
+            if chain_id == document_id:
+                chain_entries = list(chain)
+                chain_id, chain = next(chains, (None, []))
+            totals['documents'] += 1
+            totals['entries'] += len(chain_entries)
+            head = self.check_chain(document_id, chain_entries)
+            self.check_head(document_id, audit_head, audit_length, head, len(chain_entries), cutoff)
+
+            for institution_id in (university_id, health_school_id):
+                checkpoint = checkpoints.get(institution_id)
+                if checkpoint is not None:
+                    length = prefix_length(chain_entries, checkpoint.last_history_id, checkpoint.last_signature_id)
+                    if length:
+                        checked[institution_id].add(leaf_hash(document_id, length, chain_entries[length - 1][5]))
+                if chain_entries:
+                    current[institution_id].add(leaf_hash(document_id, len(chain_entries), head))
+
+        for institution_id, checkpoint in checkpoints.items():
+            builder = checked[institution_id]
+            if builder.root() != checkpoint.root or builder.count != checkpoint.leaf_count:
+                self.problem(
+                    f"Checkpoint {checkpoint.pk} da instituição {institution_id} divergente: "
+                    f"raiz recalculada {builder.root()} ({builder.count} documento(s))."
+                )
+        for label, model in (('Histórico', DocumentHistory), ('Assinatura', DigitalSignature)):
+            unchained = model.objects.filter(chain_index__isnull=True).count()
+            if unchained:
+                self.problem(f"{label}: {unchained} entrada(s) fora da trilha de auditoria.")
+
+        for message in self.problems[:MAX_REPORTED]:
+            self.stdout.write(message)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{totals['entries']} entrada(s) de {totals['documents']} documento(s) e {len(checkpoints)} "
+            f"checkpoint(s) verificados em {elapsed:.1f}s ({totals['entries'] / max(elapsed, 1e-9):.0f} entradas/s)."
+        )
+        if self.problems:
+            raise CommandError(f"{len(self.problems)} problema(s) na trilha de auditoria.")
+        self.stdout.write(self.style.SUCCESS("Trilha de auditoria íntegra."))
+
+        if options['checkpoint']:
+            AuditCheckpoint.objects.bulk_create([
+                AuditCheckpoint(
+                    institution_id=institution_id,
+                    root=builder.root(),
+                    leaf_count=builder.count,
+                    last_history_id=cutoff['history'],
+                    last_signature_id=cutoff['signature'],
+                )
+                for institution_id, builder in sorted(current.items())
+            ])
+            self.stdout.write(self.style.SUCCESS(f"{len(current)} checkpoint(s) gravado(s)."))
+
+    def problem(self, message):
+        self.problems.append(message)
+
+    def check_chain(self, document_id, entries):
+        """Recalcula o hash de cada entrada e confere o encadeamento. Retorna a cabeça gravada."""
+        head = ''
+        for position, (_, chain_index, kind, pk, previous_hash, entry_hash, values) in enumerate(entries):
+            label = f"Documento {document_id}, {'histórico' if kind == 'history' else 'assinatura'} {pk}"
+            if chain_index != position:
+                self.problem(f"{label}: posição {chain_index} na trilha, esperada {position}.")
+            if previous_hash != head:
+                self.problem(f"{label}: hash anterior não corresponde à entrada anterior.")
+            if entry_digest(previous_hash, kind, chain_index, values) != entry_hash:
+                self.problem(f"{label}: conteúdo alterado (hash da entrada divergente).")
+            head = entry_hash
+        return head
+
+    def check_head(self, document_id, audit_head, audit_length, head, length, cutoff):
+        """Compara a cabeça gravada no documento com a trilha lida (detecta entradas removidas do fim)."""
+        if audit_length == length and audit_head == head:
+            return
+        if audit_length > length and (
+            DocumentHistory.objects.filter(document_id=document_id, id__gt=cutoff['history']).exists()
+            or DigitalSignature.objects.filter(document_id=document_id, id__gt=cutoff['signature']).exists()
+        ):
+            # Entradas gravadas depois do início da verificação
+            return
+        self.problem(
+            f"Documento {document_id}: cabeça da trilha divergente "
+            f"({audit_length} entrada(s) registradas, {length} encontradas)."
+        )
+
+    def prove(self, document_id, institution_id):
+        try:
+            document = InternshipDocument.objects.only('id', 'university_id').get(pk=document_id)
+        except InternshipDocument.DoesNotExist:
+            raise CommandError(f"Documento {document_id} não encontrado.")
+        institution_id = institution_id or document.university_id
+        checkpoint = AuditCheckpoint.objects.filter(institution_id=institution_id).order_by('-created_at', '-id').first()
+        if checkpoint is None:
+            raise CommandError(f"A instituição {institution_id} não possui checkpoint (use --checkpoint).")
+        proof = inclusion_proof(document.pk, checkpoint, chunk_size=self.chunk_size)
+        if proof is None:
+            raise CommandError(f"O documento {document_id} não está no checkpoint {checkpoint.pk}.")
+        self.stdout.write(json.dumps(proof, indent=2))
@@ -0,0 +1,89 @@
+"""
+Instituições administradas pelo usuário, carregadas uma vez por requisição.
+
+O InstitutionMembershipMiddleware expõe `request.institutions` (preguiçoso):
+a primeira consulta busca as instituições no cache do Django e, na ausência,
+no banco. O cache é invalidado pelos sinais de `admin_users` (m2m_changed) e
+de alteração/remoção de instituições (ver fluxo.signals). Com vários
+processos, o cache precisa ser compartilhado (ver fluxo.checks): uma
+invalidação em um LocMemCache não alcança os demais processos.
+"""
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import Institution
+
+# Segundos que a lista de instituições de um usuário fica no cache
+CACHE_TIMEOUT = 300
+
+
+def cache_key(user_id):
+    return f'fluxo:institutions:{user_id}'
+
+
+class UserInstitutions:
+    """Instituições de um usuário, com acesso por tipo."""
+
+    def __init__(self, institutions):
+        self.institutions = list(institutions)
+        self.ids = {institution.pk for institution in self.institutions}
+
+    def __iter__(self):
+        return iter(self.institutions)
+
+    def __bool__(self):
+        return bool(self.institutions)
+
+    def of_type(self, institution_type):
+        """Primeira instituição do tipo (ou None)."""
+        for institution in self.institutions:
+            if institution.type == institution_type:
+                return institution
+        return None
+
+    @property
+    def university(self):
+        return self.of_type('university')
+
+    @property
+    def health_school(self):
+        return self.of_type('health_school')
+
+    def can_access(self, document):
+        """Indica se o usuário administra a universidade ou a escola de saúde do documento."""
+        return document.university_id in self.ids or document.health_school_id in self.ids
+
+
+def get_user_institutions(user):
+    """Carrega as instituições do usuário do cache ou, na ausência, do banco."""
+    if not user.is_authenticated:
+        return UserInstitutions([])
+    key = cache_key(user.pk)
+    institutions = cache.get(key)
+    if institutions is None:
+        institutions = list(Institution.objects.filter(admin_users=user).order_by('id'))
+        cache.set(key, institutions, CACHE_TIMEOUT)
+    return UserInstitutions(institutions)
+
+
+def invalidate_user_institutions(user_ids):
+    """Remove do cache as instituições dos usuários informados."""
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
+
+
+def institutions_for(request):
+    """`request.institutions`, criando-o se o middleware não estiver instalado."""
+    if not hasattr(request, 'institutions'):
+        request.institutions = SimpleLazyObject(lambda: get_user_institutions(request.user))
+    return request.institutions
+
+
+class InstitutionMembershipMiddleware:
+    """Adiciona `request.institutions`; deve vir depois do AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        institutions_for(request)
+        return self.get_response(request)
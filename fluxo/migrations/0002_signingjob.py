@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SigningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signer_type', models.CharField(choices=[('university', 'Representante da Universidade'), ('health_school', 'Representante da Escola de Saúde')], default='health_school', max_length=20, verbose_name='Tipo de Signatário')),
+                ('signer_cpf', models.CharField(max_length=14, verbose_name='CPF do Signatário')),
+                ('position_x', models.FloatField(verbose_name='Posição X')),
+                ('position_y', models.FloatField(verbose_name='Posição Y')),
+                ('ip_address', models.GenericIPAddressField(verbose_name='Endereço IP')),
+                ('user_agent', models.TextField(verbose_name='User Agent')),
+                ('status', models.CharField(choices=[('queued', 'Na Fila'), ('running', 'Processando'), ('done', 'Concluída'), ('failed', 'Falhou')], default='queued', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('error', models.TextField(blank=True, verbose_name='Erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finalizada em')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signing_jobs', to='fluxo.internshipdocument', verbose_name='Documento')),
+                ('signature', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='fluxo.digitalsignature', verbose_name='Assinatura Gerada')),
+                ('signer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Signatário')),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Assinatura',
+                'verbose_name_plural': 'Tarefas de Assinatura',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='fluxo_signi_status_988d58_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:31
+
+import fluxo.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0002_signingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Nome do Blob')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='Referências')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Blob Armazenado',
+                'verbose_name_plural': 'Blobs Armazenados',
+            },
+        ),
+        migrations.AlterField(
+            model_name='internshipdocument',
+            name='original_file',
+            field=models.FileField(storage=fluxo.storage.get_document_storage, upload_to=fluxo.storage.original_upload_to, verbose_name='Arquivo Original (PDF)'),
+        ),
+        migrations.AlterField(
+            model_name='internshipdocument',
+            name='signed_file',
+            field=models.FileField(blank=True, null=True, storage=fluxo.storage.get_document_storage, upload_to='documents/signed/%Y/%m/', verbose_name='Arquivo Assinado (PDF)'),
+        ),
+    ]
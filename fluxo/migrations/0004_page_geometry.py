@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0003_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Número de Páginas'),
+        ),
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='page_geometry',
+            field=models.JSONField(blank=True, default=list, verbose_name='Geometria das Páginas'),
+        ),
+    ]
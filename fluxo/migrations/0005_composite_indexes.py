@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0004_page_geometry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='digitalsignature',
+            index=models.Index(fields=['document', 'signer', 'signer_type'], name='fluxo_digit_documen_15dcfe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documenthistory',
+            index=models.Index(fields=['document', '-created_at'], name='fluxo_docum_documen_baee7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='internshipdocument',
+            index=models.Index(fields=['university', 'status', '-created_at'], name='fluxo_inter_univers_8cb237_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='internshipdocument',
+            index=models.Index(fields=['health_school', 'status', '-created_at'], name='fluxo_inter_health__3d8a87_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='internshipdocument',
+            index=models.Index(fields=['university', '-created_at', '-id'], name='fluxo_inter_univers_ad59d5_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+STATUS_FIELDS = {
+    'pending_health_school': 'pending',
+    'signed_health_school': 'signed',
+    'completed': 'completed',
+    'rejected': 'rejected',
+}
+
+
+def populate_stats(apps, schema_editor):
+    """Preenche os contadores a partir dos documentos já existentes."""
+    InternshipDocument = apps.get_model('fluxo', 'InternshipDocument')
+    InstitutionDocumentStats = apps.get_model('fluxo', 'InstitutionDocumentStats')
+
+    counts = {}
+    for role in ('university', 'health_school'):
+        rows = InternshipDocument.objects.order_by().values(role, 'status').annotate(count=models.Count('id'))
+        for row in rows:
+            stats = counts.setdefault(row[role], InstitutionDocumentStats(institution_id=row[role]))
+            stats.total += row['count']
+            field = STATUS_FIELDS.get(row['status'])
+            if field:
+                setattr(stats, field, getattr(stats, field) + row['count'])
+    InstitutionDocumentStats.objects.bulk_create(counts.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0005_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstitutionDocumentStats',
+            fields=[
+                ('institution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_stats', serialize=False, to='fluxo.institution', verbose_name='Instituição')),
+                ('pending', models.IntegerField(default=0, verbose_name='Aguardando Assinatura')),
+                ('signed', models.IntegerField(default=0, verbose_name='Assinados')),
+                ('completed', models.IntegerField(default=0, verbose_name='Concluídos')),
+                ('rejected', models.IntegerField(default=0, verbose_name='Rejeitados')),
+                ('total', models.IntegerField(default=0, verbose_name='Total')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Estatística de Documentos',
+                'verbose_name_plural': 'Estatísticas de Documentos',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
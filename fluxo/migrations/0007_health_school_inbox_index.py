@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0006_institution_document_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='internshipdocument',
+            index=models.Index(fields=['health_school', '-created_at', '-id'], name='fluxo_inter_health__a5d94b_idx'),
+        ),
+    ]
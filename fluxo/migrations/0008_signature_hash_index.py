@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0007_health_school_inbox_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='digitalsignature',
+            index=models.Index(fields=['signature_hash'], name='fluxo_digit_signatu_8215ea_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0008_signature_hash_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileAudit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Arquivo')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 Calculado')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='Tamanho (bytes)')),
+                ('mtime_ns', models.BigIntegerField(blank=True, null=True, verbose_name='Modificado em (ns)')),
+                ('status', models.CharField(choices=[('ok', 'Íntegro'), ('mismatch', 'Hash Divergente'), ('missing', 'Arquivo Ausente')], max_length=10, verbose_name='Status')),
+                ('checked_at', models.DateTimeField(verbose_name='Auditado em')),
+            ],
+            options={
+                'verbose_name': 'Auditoria de Arquivo',
+                'verbose_name_plural': 'Auditorias de Arquivos',
+                'indexes': [models.Index(fields=['status'], name='fluxo_filea_status_3bac5b_idx')],
+            },
+        ),
+    ]
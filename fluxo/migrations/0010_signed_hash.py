@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:54
+
+import re
+
+from django.db import migrations, models
+
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+
+def populate_signed_hash(apps, schema_editor):
+    """
+    Preenche o signed_hash dos assinados já gravados como blob, cujo nome é o
+    próprio SHA-256 (sem ler os arquivos). Os demais ficam para o audit_integrity.
+    """
+    InternshipDocument = apps.get_model('fluxo', 'InternshipDocument')
+    documents = InternshipDocument.objects.filter(signed_file__startswith='blobs/').only('id', 'signed_file')
+    updated = []
+    for document in documents.iterator(chunk_size=2000):
+        match = BLOB_NAME_RE.match(document.signed_file.name)
+        if match:
+            document.signed_hash = match.group(1)
+            updated.append(document)
+    InternshipDocument.objects.bulk_update(updated, ['signed_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0009_file_audit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='signed_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash SHA-256 do Assinado'),
+        ),
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='signed_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Tamanho do Assinado (bytes)'),
+        ),
+        migrations.RunPython(populate_signed_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:59
+
+import hashlib
+import heapq
+import json
+from datetime import datetime
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+# Cópia de fluxo.audit no momento desta migração: mudanças posteriores no
+# formato do hash não podem alterar o que ela grava em um banco novo
+ENTRY_FIELDS = {
+    'history': ('document_id', 'action', 'performed_by_id', 'notes', 'created_at'),
+    'signature': (
+        'document_id', 'signer_id', 'signer_type', 'signature_data', 'signature_hash', 'certificate_data',
+        'signed_at', 'ip_address', 'user_agent', 'signer_name', 'signer_email', 'signer_cpf',
+    ),
+}
+
+
+def _canonical(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def entry_digest(previous_hash, kind, chain_index, values):
+    payload = json.dumps(
+        [kind, chain_index] + [_canonical(value) for value in values],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(f'{previous_hash}\n{payload}'.encode()).hexdigest()
+
+
+def chain_existing_entries(apps, schema_editor):
+    """
+    Encadeia o histórico e as assinaturas já gravados, por documento, em ordem
+    cronológica (criação/assinatura, depois ID), em uma leitura em streaming
+    de cada tabela.
+    """
+    models_by_kind = {
+        'history': (apps.get_model('fluxo', 'DocumentHistory'), 'created_at'),
+        'signature': (apps.get_model('fluxo', 'DigitalSignature'), 'signed_at'),
+    }
+    InternshipDocument = apps.get_model('fluxo', 'InternshipDocument')
+
+    def stream(kind):
+        model, timestamp = models_by_kind[kind]
+        rows = model.objects.order_by('document_id', timestamp, 'id').values_list(
+            'id', timestamp, *ENTRY_FIELDS[kind]
+        ).iterator(chunk_size=2000)
+        for pk, moment, *values in rows:
+            yield values[0], moment, kind, pk, values
+
+    pending = {kind: [] for kind in models_by_kind}
+    heads = []
+
+    def flush(kind):
+        model = models_by_kind[kind][0]
+        model.objects.bulk_update(pending[kind], ['chain_index', 'previous_hash', 'entry_hash'])
+        pending[kind] = []
+
+    document_id, head, length = None, '', 0
+    for entry_document_id, _, kind, pk, values in heapq.merge(stream('history'), stream('signature')):
+        if entry_document_id != document_id:
+            if document_id is not None:
+                heads.append(InternshipDocument(pk=document_id, audit_head=head, audit_length=length))
+            document_id, head, length = entry_document_id, '', 0
+        entry_hash = entry_digest(head, kind, length, values)
+        pending[kind].append(models_by_kind[kind][0](
+            pk=pk, chain_index=length, previous_hash=head, entry_hash=entry_hash
+        ))
+        head, length = entry_hash, length + 1
+        if len(pending[kind]) >= BATCH_SIZE:
+            flush(kind)
+        if len(heads) >= BATCH_SIZE:
+            InternshipDocument.objects.bulk_update(heads, ['audit_head', 'audit_length'])
+            heads = []
+    if document_id is not None:
+        heads.append(InternshipDocument(pk=document_id, audit_head=head, audit_length=length))
+    for kind in pending:
+        flush(kind)
+    InternshipDocument.objects.bulk_update(heads, ['audit_head', 'audit_length'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0010_signed_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('root', models.CharField(max_length=64, verbose_name='Raiz de Merkle')),
+                ('leaf_count', models.PositiveIntegerField(verbose_name='Documentos')),
+                ('last_history_id', models.BigIntegerField(default=0, verbose_name='Último Histórico')),
+                ('last_signature_id', models.BigIntegerField(default=0, verbose_name='Última Assinatura')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint de Auditoria',
+                'verbose_name_plural': 'Checkpoints de Auditoria',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='digitalsignature',
+            name='chain_index',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Posição na Trilha'),
+        ),
+        migrations.AddField(
+            model_name='digitalsignature',
+            name='entry_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Entrada'),
+        ),
+        migrations.AddField(
+            model_name='digitalsignature',
+            name='previous_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Entrada Anterior'),
+        ),
+        migrations.AddField(
+            model_name='documenthistory',
+            name='chain_index',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Posição na Trilha'),
+        ),
+        migrations.AddField(
+            model_name='documenthistory',
+            name='entry_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Entrada'),
+        ),
+        migrations.AddField(
+            model_name='documenthistory',
+            name='previous_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Entrada Anterior'),
+        ),
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='audit_head',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Última Entrada da Auditoria'),
+        ),
+        migrations.AddField(
+            model_name='internshipdocument',
+            name='audit_length',
+            field=models.PositiveIntegerField(default=0, verbose_name='Entradas na Trilha de Auditoria'),
+        ),
+        migrations.AlterField(
+            model_name='documenthistory',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Data/Hora'),
+        ),
+        migrations.AddConstraint(
+            model_name='digitalsignature',
+            constraint=models.UniqueConstraint(fields=('document', 'chain_index'), name='unique_signature_chain_index'),
+        ),
+        migrations.AddConstraint(
+            model_name='documenthistory',
+            constraint=models.UniqueConstraint(fields=('document', 'chain_index'), name='unique_history_chain_index'),
+        ),
+        migrations.AddField(
+            model_name='auditcheckpoint',
+            name='institution',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audit_checkpoints', to='fluxo.institution', verbose_name='Instituição'),
+        ),
+        migrations.AddIndex(
+            model_name='auditcheckpoint',
+            index=models.Index(fields=['institution', '-created_at'], name='fluxo_audit_institu_e70fa1_idx'),
+        ),
+        migrations.RunPython(chain_existing_entries, migrations.RunPython.noop),
+    ]
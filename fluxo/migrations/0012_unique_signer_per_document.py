@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_signatures(apps, schema_editor):
+    """
+    Assinaturas repetidas (mesmo documento, signatário e papel) impedem a
+    restrição. Elas fazem parte da trilha de auditoria encadeada e não são
+    removidas automaticamente: a migração falha listando os documentos.
+    """
+    DigitalSignature = apps.get_model('fluxo', 'DigitalSignature')
+    duplicated = list(
+        DigitalSignature.objects.values('document_id', 'signer_id', 'signer_type')
+        .annotate(total=Count('id')).filter(total__gt=1).values_list('document_id', flat=True)[:20]
+    )
+    if duplicated:
+        raise RuntimeError(
+            "Assinaturas repetidas por signatário nos documentos "
+            f"{', '.join(str(document_id) for document_id in duplicated)}: resolva-as antes de migrar."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0011_audit_chain'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_signatures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='digitalsignature',
+            constraint=models.UniqueConstraint(fields=('document', 'signer', 'signer_type'), name='unique_signer_per_document'),
+        ),
+        migrations.RemoveIndex(
+            model_name='digitalsignature',
+            name='fluxo_digit_documen_15dcfe_idx',
+        ),
+    ]
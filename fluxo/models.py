@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 import hashlib
 import json
 from datetime import datetime
 
+from .pdf import DEFAULT_PAGE_GEOMETRY, read_page_geometry
+from .storage import blob_digest, get_document_storage, original_upload_to
+
 class Institution(models.Model):
     """Instituição - Universidade ou Escola de Saúde"""
     INSTITUTION_TYPES = [
@@ -57,18 +61,32 @@ class InternshipDocument(models.Model):
     
     # Arquivo original
     original_file = models.FileField(
-        upload_to='documents/original/%Y/%m/',
+        upload_to=original_upload_to,
+        storage=get_document_storage,
         verbose_name="Arquivo Original (PDF)"
     )
     original_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash SHA-256 do Original")
     
+    # Geometria das páginas, extraída uma única vez no upload:
+    # [[x0, y0, largura, altura, rotação], ...] em pontos (CropBox)
+    page_count = models.PositiveIntegerField(null=True, blank=True, verbose_name="Número de Páginas")
+    page_geometry = models.JSONField(default=list, blank=True, verbose_name="Geometria das Páginas")
+    
     # Arquivo assinado
     signed_file = models.FileField(
         upload_to='documents/signed/%Y/%m/',
+        storage=get_document_storage,
         null=True,
         blank=True,
         verbose_name="Arquivo Assinado (PDF)"
     )
+    # Calculados a partir dos bytes assinados em memória, no momento da gravação
+    signed_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash SHA-256 do Assinado")
+    signed_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Tamanho do Assinado (bytes)")
+    
+    # Cabeça da trilha de auditoria encadeada (histórico e assinaturas, ver fluxo.audit)
+    audit_head = models.CharField(max_length=64, blank=True, verbose_name="Hash da Última Entrada da Auditoria")
+    audit_length = models.PositiveIntegerField(default=0, verbose_name="Entradas na Trilha de Auditoria")
     
     # Status e controle
     status = models.CharField(
@@ -91,26 +109,111 @@ class InternshipDocument(models.Model):
         verbose_name = "Documento de Estágio"
         verbose_name_plural = "Documentos de Estágio"
         ordering = ['-created_at']
+        indexes = [
+            # Listagens e contagens por instituição e status
+            models.Index(fields=['university', 'status', '-created_at']),
+            models.Index(fields=['health_school', 'status', '-created_at']),
+            # Paginação por cursor dos dashboards (fluxo.pagination)
+            models.Index(fields=['university', '-created_at', '-id']),
+            models.Index(fields=['health_school', '-created_at', '-id']),
+        ]
+    
+    AUDIT_FIELDS = ('audit_head', 'audit_length')
     
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
     
     def calculate_hash(self, file_field):
-        """Calcula o hash SHA-256 de um arquivo"""
+        """Calcula o hash SHA-256 de um arquivo, lendo-o em chunks"""
         if file_field:
             file_field.seek(0)
-            file_content = file_field.read()
-            return hashlib.sha256(file_content).hexdigest()
+            sha256 = hashlib.sha256()
+            for chunk in file_field.chunks():
+                sha256.update(chunk)
+            return sha256.hexdigest()
         return None
     
+    def blob_names(self):
+        """Blobs referenciados pelo documento (ignora campos adiados e arquivos fora do storage de blobs)."""
+        names = []
+        for attname in ('original_file', 'signed_file'):
+            value = self.__dict__.get(attname)
+            name = getattr(value, 'name', value)
+            if blob_digest(name) is not None:
+                names.append(name)
+        return names
+    
+    def stats_state(self):
+        """(status, universidade, escola de saúde) usados nos contadores; None se algum campo foi adiado."""
+        try:
+            return tuple(self.__dict__[attname] for attname in ('status', 'university_id', 'health_school_id'))
+        except KeyError:
+            return None
+    
+    def verification_state(self):
+        """Hashes exibidos na verificação pública (fluxo.verification); None nos campos adiados."""
+        return (self.__dict__.get('original_hash'), self.__dict__.get('signed_hash'))
+    
+    def first_page_geometry(self):
+        """Geometria da página carimbada (a primeira), ou a padrão (A4) se desconhecida."""
+        return self.page_geometry[0] if self.page_geometry else DEFAULT_PAGE_GEOMETRY
+    
+    def ensure_page_geometry(self):
+        """Preenche page_count/page_geometry de documentos enviados antes do índice de geometria."""
+        if self.page_count is not None or not self.original_file:
+            return
+        try:
+            with self.original_file.open('rb') as original:
+                self.page_count, self.page_geometry = read_page_geometry(original)
+        except Exception as e:
+            print(f"Erro ao ler a geometria do documento {self.pk}: {e}")
+            return
+        InternshipDocument.objects.filter(pk=self.pk).update(
+            page_count=self.page_count, page_geometry=self.page_geometry
+        )
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Mantém o estado usado na contagem de referências dos blobs, nos
+        # contadores por instituição e no cache da verificação (fluxo.signals)
+        self._blob_names = self.blob_names()
+        self._stats_state = self.stats_state()
+        self._verification_state = self.verification_state()
+    
     def save(self, *args, **kwargs):
-        # Calcular hash do arquivo original na primeira vez
-        if self.original_file and not self.original_hash:
+        # Calcular hash do arquivo original na primeira vez. Uploads feitos pela
+        # view já chegam com o hash calculado pelo SHA256UploadHandler. Um
+        # arquivo substituído (ex.: pelo admin) precisa de novo hash, pois ele
+        # define o nome do blob no armazenamento.
+        replaced = self.pk and self.original_file and not self.original_file._committed
+        if self.original_file and (not self.original_hash or replaced):
             self.original_hash = self.calculate_hash(self.original_file)
+        # Assinado enviado por fora do fluxo de assinatura (ex.: admin)
+        if self.signed_file and not self.signed_file._committed:
+            self.signed_hash = self.calculate_hash(self.signed_file)
+            self.signed_size = self.signed_file.size
+        # A cabeça da trilha de auditoria só é gravada por fluxo.audit.chain_entries:
+        # uma instância carregada antes de uma nova entrada não pode sobrescrevê-la
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.AUDIT_FIELDS and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
 
 
-class DigitalSignature(models.Model):
+class AuditEntryMixin:
+    """Entradas da trilha de auditoria (DigitalSignature e DocumentHistory)."""
+
+    def save(self, *args, **kwargs):
+        # O encadeamento (pre_save, ver fluxo.audit) e o INSERT na mesma transação:
+        # se o INSERT falhar, a nova cabeça da trilha também é desfeita
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class DigitalSignature(AuditEntryMixin, models.Model):
     """Assinatura Digital"""
     SIGNER_TYPES = [
         ('university', 'Representante da Universidade'),
@@ -142,10 +245,26 @@ class DigitalSignature(models.Model):
     signer_email = models.EmailField(verbose_name="Email do Signatário")
     signer_cpf = models.CharField(max_length=14, verbose_name="CPF do Signatário")
     
+    # Trilha de auditoria encadeada (preenchida por fluxo.audit.chain_entries)
+    chain_index = models.PositiveIntegerField(null=True, blank=True, verbose_name="Posição na Trilha")
+    previous_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash da Entrada Anterior")
+    entry_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash da Entrada")
+    
     class Meta:
         verbose_name = "Assinatura Digital"
         verbose_name_plural = "Assinaturas Digitais"
         ordering = ['-signed_at']
+        indexes = [
+            # Verificação pública pelo QR Code (fluxo.verification)
+            models.Index(fields=['signature_hash']),
+        ]
+        constraints = [
+            # Uma assinatura por signatário e papel: requisições repetidas não
+            # geram uma segunda assinatura. Também indexa a verificação "já assinado"
+            models.UniqueConstraint(fields=['document', 'signer', 'signer_type'], name='unique_signer_per_document'),
+            # Uma posição por documento; também indexa a leitura da trilha em ordem
+            models.UniqueConstraint(fields=['document', 'chain_index'], name='unique_signature_chain_index'),
+        ]
     
     def __str__(self):
         return f"Assinatura de {self.signer_name} em {self.document.title}"
@@ -163,7 +282,7 @@ class DigitalSignature(models.Model):
         return hashlib.sha256(signature_string.encode()).hexdigest()
 
 
-class DocumentHistory(models.Model):
+class DocumentHistory(AuditEntryMixin, models.Model):
     """Histórico de mudanças do documento"""
     ACTION_TYPES = [
         ('created', 'Documento Criado'),
@@ -182,12 +301,277 @@ class DocumentHistory(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_TYPES, verbose_name="Ação")
     performed_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Realizado por")
     notes = models.TextField(blank=True, verbose_name="Observações")
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Data/Hora")
+    # Definido antes do INSERT, pois entra no hash da trilha de auditoria
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Data/Hora")
+    
+    # Trilha de auditoria encadeada (preenchida por fluxo.audit.chain_entries)
+    chain_index = models.PositiveIntegerField(null=True, blank=True, verbose_name="Posição na Trilha")
+    previous_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash da Entrada Anterior")
+    entry_hash = models.CharField(max_length=64, blank=True, verbose_name="Hash da Entrada")
     
     class Meta:
         verbose_name = "Histórico do Documento"
         verbose_name_plural = "Históricos dos Documentos"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['document', '-created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'chain_index'], name='unique_history_chain_index'),
+        ]
     
     def __str__(self):
-        return f"{self.get_action_display()} - {self.document.title}"
\ No newline at end of file
+        return f"{self.get_action_display()} - {self.document.title}"
+
+class SigningJob(models.Model):
+    """Tarefa de assinatura processada em segundo plano pelo worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Na Fila'),
+        ('running', 'Processando'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhou')
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    document = models.ForeignKey(
+        InternshipDocument,
+        on_delete=models.CASCADE,
+        related_name='signing_jobs',
+        verbose_name="Documento"
+    )
+    signer = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Signatário")
+    signer_type = models.CharField(
+        max_length=20,
+        choices=DigitalSignature.SIGNER_TYPES,
+        default='health_school',
+        verbose_name="Tipo de Signatário"
+    )
+    signer_cpf = models.CharField(max_length=14, verbose_name="CPF do Signatário")
+    position_x = models.FloatField(verbose_name="Posição X")
+    position_y = models.FloatField(verbose_name="Posição Y")
+    ip_address = models.GenericIPAddressField(verbose_name="Endereço IP")
+    user_agent = models.TextField(verbose_name="User Agent")
+
+    # Controle da fila
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    error = models.TextField(blank=True, verbose_name="Erro")
+    signature = models.ForeignKey(
+        DigitalSignature,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Assinatura Gerada"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Iniciada em")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finalizada em")
+
+    class Meta:
+        verbose_name = "Tarefa de Assinatura"
+        verbose_name_plural = "Tarefas de Assinatura"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Assinatura de {self.document.title} ({self.get_status_display()})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+
+class StoredBlob(models.Model):
+    """Arquivo armazenado pelo conteúdo (SHA-256), compartilhado entre documentos"""
+    name = models.CharField(max_length=255, unique=True, verbose_name="Nome do Blob")
+    ref_count = models.IntegerField(default=0, verbose_name="Referências")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    class Meta:
+        verbose_name = "Blob Armazenado"
+        verbose_name_plural = "Blobs Armazenados"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} referência(s))"
+
+    @classmethod
+    def retain(cls, names):
+        """Incrementa a contagem de referências dos blobs (criando os registros novos)."""
+        names = [name for name in names if name]
+        if not names:
+            return
+        cls.objects.bulk_create([cls(name=name) for name in names], ignore_conflicts=True)
+        for name in names:
+            cls.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+    @classmethod
+    def release(cls, names):
+        """Decrementa a contagem de referências; blobs sem referências são removidos pelo gc_blobs."""
+        for name in names:
+            if name:
+                cls.objects.filter(name=name).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+class FileAudit(models.Model):
+    """Resultado da última auditoria de integridade de um arquivo do storage (manage.py audit_integrity)"""
+    STATUS_CHOICES = [
+        ('ok', 'Íntegro'),
+        ('mismatch', 'Hash Divergente'),
+        ('missing', 'Arquivo Ausente'),
+    ]
+
+    name = models.CharField(max_length=255, unique=True, verbose_name="Arquivo")
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="SHA-256 Calculado")
+    # Tamanho e mtime na auditoria: o modo incremental só recalcula o hash se mudarem
+    size = models.BigIntegerField(null=True, blank=True, verbose_name="Tamanho (bytes)")
+    mtime_ns = models.BigIntegerField(null=True, blank=True, verbose_name="Modificado em (ns)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name="Status")
+    checked_at = models.DateTimeField(verbose_name="Auditado em")
+
+    class Meta:
+        verbose_name = "Auditoria de Arquivo"
+        verbose_name_plural = "Auditorias de Arquivos"
+        indexes = [
+            models.Index(fields=['status']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class AuditCheckpoint(models.Model):
+    """
+    Raiz de Merkle das trilhas de auditoria dos documentos de uma instituição
+    (manage.py verify_audit --checkpoint). Cobre as entradas com ID até
+    last_history_id/last_signature_id.
+    """
+    institution = models.ForeignKey(
+        Institution,
+        on_delete=models.CASCADE,
+        related_name='audit_checkpoints',
+        verbose_name="Instituição"
+    )
+    root = models.CharField(max_length=64, verbose_name="Raiz de Merkle")
+    leaf_count = models.PositiveIntegerField(verbose_name="Documentos")
+    last_history_id = models.BigIntegerField(default=0, verbose_name="Último Histórico")
+    last_signature_id = models.BigIntegerField(default=0, verbose_name="Última Assinatura")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Criado em")
+
+    class Meta:
+        verbose_name = "Checkpoint de Auditoria"
+        verbose_name_plural = "Checkpoints de Auditoria"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['institution', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.institution} - {self.root[:16]}… ({self.leaf_count} documento(s))"
+
+
+class InstitutionDocumentStats(models.Model):
+    """Contadores de documentos por status de uma instituição (desnormalizados)"""
+    # Campo do contador para cada status de InternshipDocument
+    STATUS_FIELDS = {
+        'pending_health_school': 'pending',
+        'signed_health_school': 'signed',
+        'completed': 'completed',
+        'rejected': 'rejected',
+    }
+
+    institution = models.OneToOneField(
+        Institution,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document_stats',
+        verbose_name="Instituição"
+    )
+    pending = models.IntegerField(default=0, verbose_name="Aguardando Assinatura")
+    signed = models.IntegerField(default=0, verbose_name="Assinados")
+    completed = models.IntegerField(default=0, verbose_name="Concluídos")
+    rejected = models.IntegerField(default=0, verbose_name="Rejeitados")
+    total = models.IntegerField(default=0, verbose_name="Total")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    class Meta:
+        verbose_name = "Estatística de Documentos"
+        verbose_name_plural = "Estatísticas de Documentos"
+
+    def __str__(self):
+        return f"{self.institution}: {self.total} documento(s)"
+
+    def as_counts(self):
+        return {
+            'pending': self.pending,
+            'signed': self.signed,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'total': self.total,
+        }
+
+    @classmethod
+    def counts_for(cls, institution):
+        """Contadores da instituição em uma consulta (zeros se ainda não há documentos)."""
+        stats = cls.objects.filter(institution=institution).first()
+        return (stats or cls(institution=institution)).as_counts()
+
+    @classmethod
+    def record_transitions(cls, transitions):
+        """
+        Aplica aos contadores uma lista de (estado anterior, estado novo), onde
+        cada estado é InternshipDocument.stats_state() ou None (documento
+        inexistente). As atualizações usam F() e devem rodar na mesma
+        transação que grava os documentos.
+        """
+        deltas = {}
+        for old, new in transitions:
+            if old == new:
+                continue
+            for state, sign in ((old, -1), (new, 1)):
+                if state is None:
+                    continue
+                status, university_id, health_school_id = state
+                for institution_id in (university_id, health_school_id):
+                    counters = deltas.setdefault(institution_id, {})
+                    counters['total'] = counters.get('total', 0) + sign
+                    field = cls.STATUS_FIELDS.get(status)
+                    if field:
+                        counters[field] = counters.get(field, 0) + sign
+
+        deltas = {
+            institution_id: {field: delta for field, delta in counters.items() if delta}
+            for institution_id, counters in deltas.items()
+        }
+        deltas = {institution_id: counters for institution_id, counters in deltas.items() if counters}
+        if not deltas:
+            return
+        # Só incrementos criam o registro: decrementos vêm de documentos já
+        # contados e, na exclusão em cascata de uma instituição, recriar o
+        # registro dela violaria a chave estrangeira
+        cls.objects.bulk_create([
+            cls(institution_id=institution_id)
+            for institution_id, counters in deltas.items()
+            if any(delta > 0 for delta in counters.values())
+        ], ignore_conflicts=True)
+        for institution_id, counters in deltas.items():
+            cls.objects.filter(institution_id=institution_id).update(
+                **{field: F(field) + delta for field, delta in counters.items()}
+            )
+
+    @classmethod
+    def compute(cls):
+        """Recalcula os contadores de todas as instituições a partir dos documentos."""
+        counts = {}
+        for role in ('university', 'health_school'):
+            rows = InternshipDocument.objects.order_by().values(role, 'status').annotate(count=models.Count('id'))
+            for row in rows:
+                counters = counts.setdefault(row[role], {'pending': 0, 'signed': 0, 'completed': 0, 'rejected': 0, 'total': 0})
+                counters['total'] += row['count']
+                field = cls.STATUS_FIELDS.get(row['status'])
+                if field:
+                    counters[field] += row['count']
+        return counts
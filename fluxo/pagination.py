@@ -0,0 +1,78 @@
+"""
+Paginação por cursor (keyset) para listagens ordenadas por (created_at, id).
+
+Ao contrário de OFFSET, o custo de cada página não cresce com a posição na
+lista: a próxima página é buscada com `WHERE (created_at, id) < cursor`, que
+usa o índice de ordenação diretamente.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+
+
+def encode_cursor(created_at, pk):
+    """Codifica a posição (created_at, id) do último item exibido."""
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica um cursor; retorna None se ausente ou inválido."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Retorna (itens, próximo cursor) da página após `cursor`, do mais novo
+    para o mais antigo. O próximo cursor é None na última página.
+    """
+    position = decode_cursor(cursor)
+    queryset = queryset.order_by('-created_at', '-id')
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # Um item a mais indica se existe próxima página, sem um COUNT separado
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, encode_cursor(items[-1].created_at, items[-1].pk)
+
+
+def phased_keyset_page(querysets, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Pagina uma sequência de querysets como se fosse uma lista só, na ordem
+    dada (ex.: pendentes primeiro, depois os demais). O cursor guarda a fase
+    atual e a posição dentro dela: `<fase>.<cursor da fase>`.
+    """
+    phase, inner = 0, None
+    if cursor:
+        phase_text, _, inner = cursor.partition('.')
+        phase = int(phase_text) if phase_text.isdigit() else 0
+
+    items = []
+    while phase < len(querysets):
+        page, next_inner = keyset_page(querysets[phase], inner, page_size - len(items))
+        items.extend(page)
+        if next_inner is not None:
+            return items, f'{phase}.{next_inner}'
+        phase, inner = phase + 1, None
+        if len(items) >= page_size:
+            break
+
+    # Página cheia no fim de uma fase: só há próxima página se alguma fase seguinte tem itens
+    for next_phase in range(phase, len(querysets)):
+        if querysets[next_phase].exists():
+            return items, f'{next_phase}.'
+    return items, None
@@ -0,0 +1,179 @@
+"""
+Manipulação de PDF: carimbo da assinatura e aplicação no documento original.
+
+Mantido fora de views.py para poder ser importado pelos workers de assinatura
+(processos filhos) sem carregar a camada HTTP.
+"""
+import io
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+# Nota: ReportLab usa pontos (pt). A4 = (595.2755905511812, 841.8897637795277)
+from PyPDF2 import PdfReader, PdfWriter
+
+from .instrumentation import span
+from .pdf_incremental import append_stamp, IncrementalUpdateError
+from .stamps import STAMP_HEIGHT, STAMP_WIDTH, render_stamp
+
+
+# Escala do canvas do PDF.js na tela de assinatura (pixels por ponto)
+CANVAS_SCALE = 1.5
+
+# Geometria usada quando o documento não tem a da página (A4 retrato, sem rotação)
+DEFAULT_PAGE_GEOMETRY = [0, 0, round(A4[0], 2), round(A4[1], 2), 0]
+
+
+def read_page_geometry(source, max_pages=None):
+    """
+    Lê a geometria das páginas de um PDF: retorna (nº de páginas, lista de
+    [x0, y0, largura, altura, rotação]) com a CropBox em pontos.
+    """
+    reader = PdfReader(source)
+    pages = reader.pages
+    count = len(pages)
+    geometry = []
+    for index in range(count if max_pages is None else min(count, max_pages)):
+        page = pages[index]
+        box = page.cropbox
+        geometry.append([
+            round(float(box.left), 2),
+            round(float(box.bottom), 2),
+            round(float(box.width), 2),
+            round(float(box.height), 2),
+            int(page.get('/Rotate', 0)) % 360,
+        ])
+    return count, geometry
+
+
+def canvas_to_pdf(page_geometry, position_x, position_y, scale=CANVAS_SCALE):
+    """
+    Converte a posição clicada no canvas (pixels, Y medido a partir da base,
+    como enviado pelo formulário) para o ponto da página, em pontos.
+
+    Retorna (x, y, rotação): o canto inferior esquerdo do carimbo e o ângulo
+    que o mantém na vertical em páginas com /Rotate. Levanta ValueError se a
+    posição está fora da página; o carimbo é mantido inteiro dentro dela.
+    """
+    x0, y0, width, height, rotate = page_geometry
+    shown_width, shown_height = (height, width) if rotate in (90, 270) else (width, height)
+
+    # Coordenadas na página como exibida: u da esquerda, v do topo
+    u = float(position_x) / scale
+    v = shown_height - float(position_y) / scale
+    if not (0 <= u <= shown_width and 0 <= v <= shown_height):
+        raise ValueError("Posição de assinatura fora da página.")
+    u = min(u, max(shown_width - STAMP_WIDTH, 0))
+    v = min(max(v, STAMP_HEIGHT), shown_height)
+
+    if rotate == 90:
+        return x0 + v, y0 + u, rotate
+    if rotate == 180:
+        return x0 + width - u, y0 + v, rotate
+    if rotate == 270:
+        return x0 + width - v, y0 + height - u, rotate
+    return x0 + u, y0 + height - v, 0
+
+
+def create_signature_stamp_pdf(signature_info, position_x, position_y, signature_hash, page_geometry=None):
+    """
+    Cria a página de overlay com o carimbo da assinatura e QR Code.
+
+    As partes estáticas vêm do template em cache (fluxo.stamps); aqui apenas
+    calculamos a posição e preenchemos os valores dinâmicos. `page_geometry`
+    é a geometria da página carimbada (ver read_page_geometry).
+    Retorna um PageObject do PyPDF2.
+    """
+    page_geometry = page_geometry or DEFAULT_PAGE_GEOMETRY
+    x_pt, y_pt, rotate = canvas_to_pdf(page_geometry, position_x, position_y)
+    x0, y0, width, height, _ = page_geometry
+    
+    # --- Valores dinâmicos do carimbo (na ordem de stamps.FIELD_LABELS) ---
+    values = (
+        signature_info['signer_name'],
+        signature_info['signer_cpf'],
+        f"{signature_info['signing_timestamp'][:19].replace('T', ' ')} (UTC)",
+        f"{signature_hash[:25]}...",
+        f"{signature_info['document_hash'][:25]}...",
+    )
+    qr_data = f"HASH:{signature_hash}|DOC:{signature_info['document_hash']}|ID:{signature_info['document_id']}"
+
+    return render_stamp(
+        signature_info['signer_type'], x_pt, y_pt, values, qr_data,
+        page_size=(x0 + width, y0 + height), rotate=rotate
+    )
+
+def merge_stamp_rewrite(source, stamp_page):
+    """
+    Modo 'rewrite': reescreve o PDF inteiro com o carimbo mesclado na primeira página.
+    Custo proporcional ao tamanho do documento.
+    """
+    original_reader = PdfReader(source)
+    writer = PdfWriter()
+
+    if original_reader.pages:
+        first_page = original_reader.pages[0]
+
+        # Use a largura e altura da página original para alinhamento se necessário
+        # Aqui, apenas adicionamos o carimbo como overlay
+        first_page.merge_page(stamp_page)
+        writer.add_page(first_page)
+
+        # Adiciona as páginas restantes
+        for page_num in range(1, len(original_reader.pages)):
+            writer.add_page(original_reader.pages[page_num])
+
+    output_buffer = io.BytesIO()
+    writer.write(output_buffer)
+    return output_buffer.getvalue()
+
+
+def merge_stamp_incremental(source, stamp_page):
+    """
+    Modo 'incremental': anexa ao final dos bytes originais apenas a primeira página
+    alterada, o XObject do carimbo e uma nova seção xref.
+    Custo proporcional ao tamanho do carimbo.
+    """
+    return append_stamp(source.read(), stamp_page)
+
+
+SIGNING_MODES = {
+    'incremental': merge_stamp_incremental,
+    'rewrite': merge_stamp_rewrite,
+}
+
+
+def apply_signature_to_pdf(document, signature_info, signature_hash, position_x, position_y, mode=None):
+    """
+    Mescla o PDF do carimbo (overlay) com a primeira página do PDF original.
+    Retorna o conteúdo binário do PDF assinado.
+
+    `mode` escolhe entre 'incremental' (padrão, via settings.FLUXO_SIGNING_MODE)
+    e 'rewrite'. PDFs que não aceitam atualização incremental (ex.: criptografados)
+    caem automaticamente no modo 'rewrite'.
+    """
+    mode = mode or getattr(settings, 'FLUXO_SIGNING_MODE', 'incremental')
+    try:
+        # 1. Cria o carimbo a partir do template em cache, na geometria real da página
+        if document.page_geometry:
+            page_geometry = document.first_page_geometry()
+        else:
+            document.original_file.seek(0)
+            page_geometry = read_page_geometry(document.original_file, max_pages=1)[1][0]
+        with span('stamp'):
+            stamp_page = create_signature_stamp_pdf(
+                signature_info, position_x, position_y, signature_hash, page_geometry
+            )
+
+        # 2. Mescla o carimbo na primeira página do PDF original
+        with span('merge'):
+            document.original_file.seek(0)
+            try:
+                return SIGNING_MODES[mode](document.original_file, stamp_page)
+            except IncrementalUpdateError as e:
+                print(f"Atualização incremental indisponível ({e}); usando reescrita completa.")
+                document.original_file.seek(0)
+                return merge_stamp_rewrite(document.original_file, stamp_page)
+
+    except Exception as e:
+        print(f"Erro no apply_signature_to_pdf: {e}")
+        return None
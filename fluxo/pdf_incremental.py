@@ -0,0 +1,342 @@
+"""
+Assinatura por atualização incremental (append-only) de PDFs.
+
+Em vez de reescrever o documento inteiro, anexamos ao final dos bytes
+originais apenas:
+
+* uma nova versão do dicionário da página carimbada;
+* o Form XObject do carimbo (e os recursos que ele usa);
+* dois pequenos content streams que envolvem o conteúdo original em q/Q;
+* uma nova seção xref (tabela ou stream, conforme o original) com /Prev.
+
+O custo passa a depender do tamanho do carimbo, não do tamanho do documento,
+e os bytes originais permanecem intactos no início do arquivo assinado.
+"""
+import io
+import re
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    read_object,
+)
+
+# Atributos de página herdáveis da árvore de páginas (ISO 32000-1, 7.7.3.4)
+INHERITABLE_PAGE_ATTRIBUTES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+STAMP_XOBJECT_NAME = 'FmSig'
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)\s*%%EOF', re.DOTALL)
+_OBJECT_HEADER_RE = re.compile(rb'\s*\d+\s+\d+\s+obj\s*')
+
+
+class IncrementalUpdateError(Exception):
+    """O PDF não pode receber uma atualização incremental (ex.: criptografado ou xref inválida)."""
+
+
+def _find_last_startxref(data):
+    """Retorna o offset da última seção xref declarada no final do arquivo."""
+    matches = _STARTXREF_RE.findall(data[-2048:])
+    if not matches:
+        raise IncrementalUpdateError("startxref não encontrado no final do arquivo.")
+    return int(matches[-1])
+
+
+def _uses_xref_stream(data, startxref):
+    """Indica se a última seção de referência cruzada é um xref stream (PDF 1.5+)."""
+    return not data[startxref:startxref + 4].startswith(b'xref')
+
+
+def _xref_size(reader, data, startxref):
+    """
+    /Size da última seção de referência cruzada: o maior número de objeto + 1.
+
+    O PyPDF2 3.x não copia o /Size de um xref stream para reader.trailer;
+    nesse caso ele é lido do próprio dicionário do stream. O maior número
+    de objeto conhecido pelo leitor serve de limite inferior.
+    """
+    size = reader.trailer.get('/Size')
+    if size is None:
+        match = _OBJECT_HEADER_RE.match(data, startxref)
+        if match:
+            stream = io.BytesIO(data)
+            stream.seek(match.end())
+            xref = read_object(stream, reader)
+            if isinstance(xref, DictionaryObject):
+                size = xref.get('/Size')
+    numbers = [number for generation in reader.xref.values() for number in generation]
+    numbers += list(reader.xref_objStm)
+    return max(int(size or 0), max(numbers, default=0) + 1)
+
+
+def _locate_page(reader, page_index):
+    """
+    Percorre a árvore de páginas até a página desejada sem achatar o documento.
+
+    Retorna a referência indireta da página e os atributos herdados dos nós
+    intermediários. Apenas O(profundidade) objetos são carregados.
+    """
+    node = reader.trailer['/Root'].raw_get('/Pages')
+    inherited = {}
+    while True:
+        if not isinstance(node, IndirectObject):
+            raise IncrementalUpdateError("Árvore de páginas com nó direto não suportada.")
+        obj = node.get_object()
+        for key in INHERITABLE_PAGE_ATTRIBUTES:
+            if key in obj:
+                inherited[key] = obj.raw_get(key)
+        if obj.get('/Type') == '/Page':
+            return node, obj, inherited
+        for kid in obj['/Kids']:
+            kid_obj = kid.get_object()
+            count = int(kid_obj.get('/Count', 1)) if kid_obj.get('/Type') == '/Pages' else 1
+            if page_index < count:
+                node = kid
+                break
+            page_index -= count
+        else:
+            raise IncrementalUpdateError("Página não encontrada na árvore de páginas.")
+
+
+class _ObjectAllocator:
+    """Numera e copia objetos novos (e os importados do carimbo) para a atualização."""
+
+    def __init__(self, first_number):
+        self.next_number = first_number
+        self.objects = {}
+        self._imported = {}
+
+    def add(self, obj):
+        reference = self._reserve()
+        self.objects[reference.idnum] = obj
+        return reference
+
+    def import_object(self, obj):
+        """Copia recursivamente um objeto de outro PDF, renumerando as referências."""
+        if isinstance(obj, IndirectObject):
+            key = (id(obj.pdf), obj.idnum, obj.generation)
+            if key not in self._imported:
+                reference = self._reserve()
+                self._imported[key] = reference
+                resolved = obj.get_object()
+                if isinstance(resolved, StreamObject):
+                    self.objects[reference.idnum] = self._copy_stream(resolved)
+                else:
+                    self.objects[reference.idnum] = self.import_object(resolved)
+            return self._imported[key]
+        if isinstance(obj, StreamObject):
+            # Streams precisam ser objetos indiretos no arquivo de destino
+            key = ('stream', id(obj))
+            if key not in self._imported:
+                reference = self._reserve()
+                self._imported[key] = reference
+                self.objects[reference.idnum] = self._copy_stream(obj)
+            return self._imported[key]
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            for key, value in dict.items(obj):
+                copy[NameObject(key)] = self.import_object(value)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.import_object(value) for value in obj)
+        return obj
+
+    def _copy_stream(self, stream):
+        copy = EncodedStreamObject() if '/Filter' in stream else DecodedStreamObject()
+        for key, value in dict.items(stream):
+            if key != '/Length':
+                copy[NameObject(key)] = self.import_object(value)
+        copy._data = stream._data
+        return copy
+
+    def _reserve(self):
+        # Reserva o número antes de copiar o conteúdo para suportar ciclos
+        reference = IndirectObject(self.next_number, 0, None)
+        self.next_number += 1
+        self.objects[reference.idnum] = None
+        return reference
+
+
+def _stamp_form_xobject(stamp_page, allocator):
+    """Converte a página do carimbo em um Form XObject importado para o documento."""
+    contents = stamp_page.get('/Contents')
+    if contents is None:
+        raise IncrementalUpdateError("Carimbo sem conteúdo.")
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        form = DecodedStreamObject()
+        form._data = b'\n'.join(part.get_object().get_data() for part in contents)
+    elif '/Filter' in contents:
+        form = EncodedStreamObject()
+        form[NameObject('/Filter')] = contents['/Filter']
+        if '/DecodeParms' in contents:
+            form[NameObject('/DecodeParms')] = contents['/DecodeParms']
+        form._data = contents._data
+    else:
+        form = DecodedStreamObject()
+        form._data = contents._data
+
+    form[NameObject('/Type')] = NameObject('/XObject')
+    form[NameObject('/Subtype')] = NameObject('/Form')
+    form[NameObject('/BBox')] = ArrayObject(stamp_page.mediabox)
+    form[NameObject('/Resources')] = allocator.import_object(
+        stamp_page.raw_get('/Resources') if '/Resources' in stamp_page else DictionaryObject()
+    )
+    return allocator.add(form)
+
+
+def _content_references(page):
+    """Lista as referências dos content streams originais da página."""
+    if '/Contents' not in page:
+        return []
+    raw = page.raw_get('/Contents')
+    resolved = raw.get_object()
+    if isinstance(resolved, ArrayObject):
+        return list(resolved)
+    return [raw]
+
+
+def _stamped_page(page, inherited, form_reference, allocator):
+    """Monta a nova versão do dicionário da página com o carimbo sobreposto."""
+    new_page = DictionaryObject()
+    for key, value in inherited.items():
+        new_page[NameObject(key)] = value
+    for key, value in dict.items(page):
+        new_page[NameObject(key)] = value
+
+    resources = DictionaryObject()
+    if '/Resources' in new_page:
+        for key, value in dict.items(new_page['/Resources']):
+            resources[NameObject(key)] = value
+    xobjects = DictionaryObject()
+    if '/XObject' in resources:
+        for key, value in dict.items(resources['/XObject']):
+            xobjects[NameObject(key)] = value
+
+    name = f'/{STAMP_XOBJECT_NAME}'
+    suffix = 0
+    while name in xobjects:
+        suffix += 1
+        name = f'/{STAMP_XOBJECT_NAME}{suffix}'
+    xobjects[NameObject(name)] = form_reference
+    resources[NameObject('/XObject')] = xobjects
+    new_page[NameObject('/Resources')] = resources
+
+    # Isola o estado gráfico do conteúdo original antes de desenhar o carimbo,
+    # como faz o PageObject.merge_page no modo de reescrita.
+    prefix = DecodedStreamObject()
+    prefix._data = b'q\n'
+    suffix_stream = DecodedStreamObject()
+    suffix_stream._data = f'\nQ\nq {name} Do Q\n'.encode()
+    new_page[NameObject('/Contents')] = ArrayObject(
+        [allocator.add(prefix)] + _content_references(page) + [allocator.add(suffix_stream)]
+    )
+    return new_page
+
+
+def _write_object(out, number, generation, obj):
+    out.write(f'{number} {generation} obj\n'.encode())
+    obj.write_to_stream(out, None)
+    out.write(b'\nendobj\n')
+
+
+def _xref_subsections(entries):
+    """Agrupa as entradas (número, offset, geração) em subseções contíguas."""
+    entries = sorted(entries)
+    groups = []
+    for entry in entries:
+        if groups and groups[-1][-1][0] + 1 == entry[0]:
+            groups[-1].append(entry)
+        else:
+            groups.append([entry])
+    return groups
+
+
+def _trailer_dict(reader, size, prev):
+    trailer = DictionaryObject()
+    trailer[NameObject('/Size')] = NumberObject(size)
+    for key in ('/Root', '/Info', '/ID'):
+        if key in reader.trailer:
+            trailer[NameObject(key)] = reader.trailer.raw_get(key)
+    trailer[NameObject('/Prev')] = NumberObject(prev)
+    return trailer
+
+
+def append_stamp(data, stamp_page, page_index=0):
+    """
+    Anexa o carimbo à página `page_index` através de uma atualização incremental.
+
+    `data` são os bytes do PDF original e `stamp_page` a página do carimbo
+    (PageObject do PyPDF2). Retorna os bytes do PDF assinado, que começam
+    exatamente com os bytes originais. Qualquer falha de leitura vira
+    IncrementalUpdateError, para que o chamador recorra à reescrita completa.
+    """
+    try:
+        return _append_stamp(data, stamp_page, page_index)
+    except IncrementalUpdateError:
+        raise
+    except Exception as e:
+        raise IncrementalUpdateError(f"PDF ilegível ou estrutura não suportada: {e!r}") from e
+
+
+def _append_stamp(data, stamp_page, page_index):
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        raise IncrementalUpdateError("PDF criptografado não suporta atualização incremental.")
+
+    startxref = _find_last_startxref(data)
+    page_reference, page, inherited = _locate_page(reader, page_index)
+
+    allocator = _ObjectAllocator(_xref_size(reader, data, startxref))
+    form_reference = _stamp_form_xobject(stamp_page, allocator)
+    new_page = _stamped_page(page, inherited, form_reference, allocator)
+
+    out = io.BytesIO()
+    base = len(data)
+    if not data.endswith(b'\n'):
+        out.write(b'\n')
+
+    entries = []
+    entries.append((page_reference.idnum, base + out.tell(), page_reference.generation))
+    _write_object(out, page_reference.idnum, page_reference.generation, new_page)
+    for number, obj in allocator.objects.items():
+        entries.append((number, base + out.tell(), 0))
+        _write_object(out, number, 0, obj)
+
+    if _uses_xref_stream(data, startxref):
+        xref_number = allocator.next_number
+        xref_offset = base + out.tell()
+        entries.append((xref_number, xref_offset, 0))
+        index = ArrayObject()
+        rows = bytearray()
+        for group in _xref_subsections(entries):
+            index.extend([NumberObject(group[0][0]), NumberObject(len(group))])
+            for _, offset, generation in group:
+                rows += b'\x01' + offset.to_bytes(4, 'big') + generation.to_bytes(2, 'big')
+        xref = DecodedStreamObject()
+        xref.update(_trailer_dict(reader, xref_number + 1, startxref))
+        xref[NameObject('/Type')] = NameObject('/XRef')
+        xref[NameObject('/W')] = ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)])
+        xref[NameObject('/Index')] = index
+        xref._data = bytes(rows)
+        _write_object(out, xref_number, 0, xref)
+    else:
+        xref_offset = base + out.tell()
+        out.write(b'xref\n')
+        for group in _xref_subsections(entries):
+            out.write(f'{group[0][0]} {len(group)}\n'.encode())
+            for _, offset, generation in group:
+                out.write(f'{offset:010d} {generation:05d} n\r\n'.encode())
+        out.write(b'trailer\n')
+        _trailer_dict(reader, allocator.next_number, startxref).write_to_stream(out, None)
+        out.write(b'\n')
+
+    out.write(f'startxref\n{xref_offset}\n%%EOF\n'.encode())
+    return data + out.getvalue()
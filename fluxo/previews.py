@@ -0,0 +1,45 @@
+"""
+Prévia da primeira página dos documentos.
+
+A tela de assinatura só renderiza a página 1. Em vez de baixar o original
+inteiro, ela carrega um PDF derivado contendo apenas essa página (e os
+recursos que ela usa), gerado uma única vez por `original_hash` e gravado
+no mesmo storage do original, em `previews/ab/cd/<sha256>-p1.pdf`.
+"""
+import io
+
+from django.core.files.base import ContentFile
+from PyPDF2 import PdfReader, PdfWriter
+
+from .storage import document_storage, preview_name
+
+
+def build_first_page_pdf(source):
+    """Gera um PDF só com a primeira página de `source` (arquivo binário)."""
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    # reader.pages achata a árvore: atributos herdados (/Resources, /MediaBox...) vão para a página
+    writer.add_page(reader.pages[0])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def get_first_page_preview(document):
+    """
+    Retorna o nome, no storage, da prévia da primeira página do documento,
+    gerando-a se necessário. Retorna None se a prévia não pôde ser gerada.
+    """
+    if not document.original_file or not document.original_hash:
+        return None
+    name = preview_name(document.original_hash)
+    if document_storage.exists(name):
+        return name
+
+    try:
+        with document.original_file.open('rb') as original:
+            content = build_first_page_pdf(original)
+    except Exception as e:
+        print(f"Erro ao gerar a prévia do documento {document.pk}: {e}")
+        return None
+    return document_storage.save(name, ContentFile(content))
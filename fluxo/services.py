@@ -0,0 +1,334 @@
+"""
+Fluxo de assinatura fora da camada HTTP.
+
+Usado tanto pelas views quanto pelo worker da fila de assinaturas
+(fluxo.jobs): a renderização do PDF é pura (pode rodar em outro processo) e
+as gravações no banco ficam concentradas em `finalize_signature`.
+"""
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from .audit import chain_entries
+from .bulk_send import sent_records
+from .instrumentation import span
+from .models import DigitalSignature, DocumentHistory, InstitutionDocumentStats, InternshipDocument, StoredBlob
+from .pdf import apply_signature_to_pdf, read_page_geometry
+from .storage import blob_name, content_digest, document_storage
+from .verification import invalidate_verification
+
+
+def build_signature(document, user, signer_cpf, position_x, position_y, ip_address, user_agent,
+                    signed_at=None, signer_type='health_school'):
+    """
+    Monta a DigitalSignature (ainda não salva), os dados do carimbo e o hash.
+
+    O Hash da Assinatura depende de todos os dados, incluindo a hora exata.
+    """
+    signature = DigitalSignature(
+        document=document,
+        signer=user,
+        signer_type=signer_type,
+        signed_at=signed_at or timezone.now(),
+        ip_address=ip_address,
+        user_agent=user_agent,
+        signer_name=user.get_full_name() or user.username,
+        signer_email=user.email,
+        signer_cpf=signer_cpf
+    )
+
+    # Prepara dados completos para o carimbo e o registro final
+    signature_info = {
+        'document_id': document.id,
+        'signer_name': signature.signer_name,
+        'signer_email': signature.signer_email,
+        'signer_cpf': signature.signer_cpf,
+        'signer_type': signer_type,
+        'signing_timestamp': signature.signed_at.isoformat(),
+        'document_hash': document.original_hash,
+        'position_x': position_x,
+        'position_y': position_y
+    }
+
+    # Garante que o campo signature_data (que alimenta o hash) esteja preenchido
+    signature.signature_data = json.dumps(signature_info)
+    signature.signature_hash = signature.generate_signature_hash()
+    return signature, signature_info
+
+
+def render_signed_pdf(document, signature_info, signature_hash, position_x, position_y):
+    """Aplica o carimbo ao PDF original. Não acessa o banco (seguro para process pool)."""
+    return apply_signature_to_pdf(document, signature_info, signature_hash, position_x, position_y)
+
+
+def finalize_signatures(items):
+    """
+    Grava, em uma única transação, as assinaturas, os PDFs assinados, o novo
+    status dos documentos e o histórico. `items` é uma lista de
+    (documento, assinatura, conteúdo do PDF assinado, posição X, posição Y).
+
+    Idempotente: se o signatário já assinou o documento, nada é gravado para
+    ele e a assinatura existente é retornada. Retorna, na ordem de `items`,
+    uma lista de (assinatura, criada); (None, False) se o documento não existe mais.
+
+    Os PDFs são gravados no storage antes da transação, que fica apenas com
+    as escritas no banco (no SQLite, as demais escritas esperam o commit).
+    Após um rollback, os blobs sem referência são removidos pelo gc_blobs.
+    """
+    now = timezone.now()
+    results = []
+    new_signatures = []
+    new_history = []
+    updated_documents = []
+
+    # Hash, tamanho e nome do blob vêm do buffer em memória: downloads (ETag),
+    # a verificação pública e a auditoria não precisam reler o arquivo
+    stored = []
+    with span('storage'):
+        for _, _, signed_pdf_content, *_ in items:
+            digest = hashlib.sha256(signed_pdf_content).hexdigest()
+            name = document_storage.save(blob_name(digest), ContentFile(signed_pdf_content))
+            stored.append((digest, len(signed_pdf_content), name))
+
+    with transaction.atomic():
+        # Bloqueia os documentos (em bancos com SELECT FOR UPDATE) para serializar finalizações
+        documents = InternshipDocument.objects.select_for_update().in_bulk(
+            [document.pk for document, *_ in items]
+        )
+        existing = {
+            (signature.document_id, signature.signer_id, signature.signer_type): signature
+            for signature in DigitalSignature.objects.filter(document_id__in=documents)
+        }
+
+        for (document, signature, signed_pdf_content, position_x, position_y), (digest, size, name) in zip(items, stored):
+            document = documents.get(document.pk)
+            if document is None:
+                results.append((None, False))
+                continue
+            key = (document.pk, signature.signer_id, signature.signer_type)
+            if key in existing:
+                results.append((existing[key], False))
+                continue
+
+            signature.document = document
+            document.signed_file, document.signed_hash, document.signed_size = name, digest, size
+            if document.page_count is None:
+                # O carimbo não muda o número de páginas: aproveita o buffer para preenchê-lo
+                try:
+                    document.page_count, document.page_geometry = read_page_geometry(io.BytesIO(signed_pdf_content))
+                except Exception as e:
+                    print(f"Erro ao ler a geometria do documento assinado {document.pk}: {e}")
+            document.status = 'signed_health_school'
+            document.updated_at = now
+
+            existing[key] = signature
+            new_signatures.append(signature)
+            updated_documents.append(document)
+            new_history.append(DocumentHistory(
+                document=document,
+                action='signed',
+                performed_by=signature.signer,
+                notes=f'Documento assinado digitalmente na posição X:{position_x}, Y:{position_y}'
+            ))
+            results.append((signature, True))
+
+        # bulk_create não dispara pre_save: assinatura e histórico de cada
+        # documento entram na trilha de auditoria nesta ordem
+        chain_entries([entry for pair in zip(new_signatures, new_history) for entry in pair])
+        DigitalSignature.objects.bulk_create(new_signatures)
+        InternshipDocument.objects.bulk_update(updated_documents, [
+            'signed_file', 'signed_hash', 'signed_size', 'page_count', 'page_geometry', 'status', 'updated_at'
+        ])
+        DocumentHistory.objects.bulk_create(new_history)
+
+        # bulk_update não dispara post_save: atualiza aqui as referências dos blobs...
+        retained, released = [], []
+        for document in updated_documents:
+            current = document.blob_names()
+            retained += [name for name in current if name not in document._blob_names]
+            released += [name for name in document._blob_names if name not in current]
+            document._blob_names = current
+        StoredBlob.retain(retained)
+        StoredBlob.release(released)
+
+        # ... e os contadores de status por instituição, na mesma transação
+        transitions = []
+        for document in updated_documents:
+            current = document.stats_state()
+            transitions.append((document._stats_state, current))
+            document._stats_state = current
+            document._verification_state = document.verification_state()
+        InstitutionDocumentStats.record_transitions(transitions)
+        # Nem o bulk_create das assinaturas: remove possíveis "não encontrado" do
+        # cache e os vereditos das demais assinaturas, que exibem o signed_hash.
+        # Depois do commit (inclusive de uma transação externa)
+        hashes = [signature.signature_hash for signature in existing.values()]
+        transaction.on_commit(lambda: invalidate_verification(hashes))
+    return results
+
+
+def finalize_signature(document, signature, signed_pdf_content, position_x, position_y):
+    """Versão de `finalize_signatures` para um único documento. Retorna (assinatura, criada)."""
+    return finalize_signatures([(document, signature, signed_pdf_content, position_x, position_y)])[0]
+
+
+def sign_document(document, user, signer_cpf, position_x, position_y, ip_address, user_agent, signed_at=None):
+    """
+    Executa o fluxo completo de assinatura no processo atual.
+    Retorna (assinatura, criada) ou None se o PDF assinado não pôde ser gerado.
+    """
+    signature, signature_info = build_signature(
+        document, user, signer_cpf, position_x, position_y, ip_address, user_agent, signed_at=signed_at
+    )
+    signed_pdf_content = render_signed_pdf(
+        document, signature_info, signature.signature_hash, position_x, position_y
+    )
+    if signed_pdf_content is None:
+        return None
+    return finalize_signature(document, signature, signed_pdf_content, position_x, position_y)
+
+
+def send_document(university, health_school, file, user, ip_address, user_agent,
+                  title, description='', num_students=0, original_hash=None):
+    """
+    Cria e envia um documento: grava o PDF no storage e, em uma única
+    transação, o documento, o histórico de envio, a assinatura do remetente
+    e os contadores da instituição (post_save). `original_hash` é o SHA-256
+    calculado no upload (SHA256UploadHandler), se disponível.
+    """
+    # Geometria das páginas: lida uma única vez, aqui, para não reabrir o PDF a cada requisição
+    try:
+        page_count, page_geometry = read_page_geometry(file)
+    except Exception as e:
+        print(f"Erro ao ler a geometria do PDF enviado: {e}")
+        page_count, page_geometry = None, []
+    file.seek(0)
+
+    # Como em finalize_signatures, o arquivo é gravado antes da transação
+    original_hash = original_hash or content_digest(file)
+    extension = os.path.splitext(file.name)[1].lower() or '.pdf'
+    with span('storage'):
+        stored_name = document_storage.save(blob_name(original_hash, extension), file)
+
+    with transaction.atomic():
+        document = InternshipDocument.objects.create(
+            title=title,
+            description=description,
+            university=university,
+            health_school=health_school,
+            original_file=stored_name,
+            original_hash=original_hash,
+            page_count=page_count,
+            page_geometry=page_geometry,
+            created_by=user,
+            status='pending_health_school',
+            num_students=num_students,
+            student_info=json.dumps({'num_students': num_students})
+        )
+        history, signature = sent_records(document, user, ip_address, user_agent)
+        history.save()
+        signature.save()
+    return document
+
+
+# --- ASSINATURA EM LOTE ---
+
+# Documentos gravados por transação na assinatura em lote
+BULK_SIGN_BATCH_SIZE = 25
+
+_render_executor = None
+
+
+def init_render_process():
+    """Inicializa o Django nos processos de renderização (necessário com o método 'spawn')."""
+    django.setup()
+
+
+def render_executor():
+    """
+    ProcessPoolExecutor compartilhado para renderização de PDFs, dimensionado
+    pelos núcleos da máquina (ou settings.FLUXO_RENDER_PROCESSES).
+    """
+    global _render_executor
+    if _render_executor is None:
+        processes = getattr(settings, 'FLUXO_RENDER_PROCESSES', None) or os.cpu_count() or 1
+        _render_executor = ProcessPoolExecutor(max_workers=processes, initializer=init_render_process)
+    return _render_executor
+
+
+def bulk_sign_documents(documents, user, signer_cpf, position_x, position_y, ip_address, user_agent, executor=None):
+    """
+    Assina vários documentos com o mesmo CPF e a mesma posição de carimbo.
+
+    A renderização dos PDFs é distribuída no ProcessPoolExecutor e as gravações
+    são feitas em transações de até BULK_SIGN_BATCH_SIZE documentos, à medida
+    que os carimbos ficam prontos. Retorna um dict por documento com
+    'document', 'status' ('signed', 'already_signed' ou 'failed') e 'error'.
+    """
+    executor = executor or render_executor()
+    results = {}
+    futures = {}
+
+    already_signed = set(DigitalSignature.objects.filter(
+        document__in=documents, signer=user, signer_type='health_school'
+    ).values_list('document_id', flat=True))
+
+    for document in documents:
+        if document.pk in already_signed:
+            results[document.pk] = {'document': document, 'status': 'already_signed', 'error': ''}
+            continue
+        signature, signature_info = build_signature(
+            document, user, signer_cpf, position_x, position_y, ip_address, user_agent
+        )
+        future = executor.submit(
+            render_signed_pdf, document, signature_info, signature.signature_hash, position_x, position_y
+        )
+        futures[future] = (document, signature)
+
+    def flush(batch):
+        for (document, _, _, _, _), (signature, created) in zip(batch, finalize_signatures(batch)):
+            if signature is None:
+                # Documento excluído enquanto o carimbo era gerado
+                results[document.pk] = {
+                    'document': document,
+                    'status': 'failed',
+                    'error': 'O documento não existe mais.',
+                }
+                continue
+            results[document.pk] = {
+                'document': document,
+                'status': 'signed' if created else 'already_signed',
+                'error': '',
+            }
+        batch.clear()
+
+    batch = []
+    for future in as_completed(futures):
+        document, signature = futures[future]
+        try:
+            signed_pdf_content = future.result()
+        except Exception as e:
+            signed_pdf_content = None
+            print(f"Erro ao assinar o documento {document.pk} em lote: {e}")
+        if signed_pdf_content is None:
+            results[document.pk] = {
+                'document': document,
+                'status': 'failed',
+                'error': 'Falha ao gerar o documento assinado digitalmente.',
+            }
+            continue
+        batch.append((document, signature, signed_pdf_content, position_x, position_y))
+        if len(batch) >= BULK_SIGN_BATCH_SIZE:
+            flush(batch)
+    if batch:
+        flush(batch)
+
+    return [results[document.pk] for document in documents]
@@ -0,0 +1,127 @@
+"""
+Sinais do app fluxo: contagem de referências dos blobs (ver fluxo.storage),
+contadores de documentos por instituição (InstitutionDocumentStats),
+encadeamento das entradas novas na trilha de auditoria (ver fluxo.audit),
+invalidação do cache de instituições por usuário (ver fluxo.membership),
+do cache da verificação pública de assinaturas (ver fluxo.verification) e
+PRAGMAs das novas conexões SQLite (ver fluxo.sqlite).
+"""
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .audit import chain_entries
+from .membership import invalidate_user_institutions
+from .models import (
+    DigitalSignature,
+    DocumentHistory,
+    Institution,
+    InstitutionDocumentStats,
+    InternshipDocument,
+    StoredBlob,
+)
+from .sqlite import apply_pragmas
+from .verification import invalidate_verification
+
+
+@receiver(post_init, sender=InternshipDocument)
+def remember_document_state(sender, instance, **kwargs):
+    # Documento novo: os blobs já informados no construtor ainda não foram contados
+    instance._blob_names = instance.blob_names() if instance.pk is not None else []
+    instance._stats_state = instance.stats_state() if instance.pk is not None else None
+    instance._verification_state = instance.verification_state()
+
+
+@receiver(pre_save, sender=InternshipDocument)
+def load_deferred_stats_state(sender, instance, **kwargs):
+    # Instância carregada com campos adiados: busca o estado anterior no banco
+    if instance.pk is not None and instance._stats_state is None and not instance._state.adding:
+        instance._stats_state = InternshipDocument.objects.filter(pk=instance.pk).values_list(
+            'status', 'university_id', 'health_school_id'
+        ).first()
+
+
+@receiver(post_save, sender=InternshipDocument)
+def update_document_stats(sender, instance, **kwargs):
+    current = instance.stats_state()
+    if current is None:
+        return
+    InstitutionDocumentStats.record_transitions([(instance._stats_state, current)])
+    instance._stats_state = current
+
+
+@receiver(post_delete, sender=InternshipDocument)
+def release_document_stats(sender, instance, **kwargs):
+    InstitutionDocumentStats.record_transitions([(instance._stats_state, None)])
+
+
+@receiver(post_save, sender=InternshipDocument)
+def update_blob_references(sender, instance, **kwargs):
+    previous = instance._blob_names
+    current = instance.blob_names()
+    StoredBlob.retain([name for name in current if name not in previous])
+    StoredBlob.release([name for name in previous if name not in current])
+    instance._blob_names = current
+
+
+@receiver(post_delete, sender=InternshipDocument)
+def release_document_blobs(sender, instance, **kwargs):
+    StoredBlob.release(instance._blob_names)
+
+
+@receiver(post_save, sender=InternshipDocument)
+def invalidate_document_verification(sender, instance, created, **kwargs):
+    # O veredito inclui os hashes do original e do assinado: qualquer troca invalida as assinaturas
+    current = instance.verification_state()
+    if not created and current != instance._verification_state:
+        hashes = list(instance.signatures.values_list('signature_hash', flat=True))
+        transaction.on_commit(lambda: invalidate_verification(hashes))
+    instance._verification_state = current
+
+
+@receiver(post_init, sender=DigitalSignature)
+def remember_signature_hash(sender, instance, **kwargs):
+    instance._signature_hash = instance.__dict__.get('signature_hash')
+
+
+@receiver(post_save, sender=DigitalSignature)
+@receiver(post_delete, sender=DigitalSignature)
+def invalidate_signature_verification(sender, instance, **kwargs):
+    # Depois do commit, para que uma verificação concorrente não volte a guardar o estado antigo
+    hashes = [instance._signature_hash, instance.__dict__.get('signature_hash')]
+    transaction.on_commit(lambda: invalidate_verification(hashes))
+    instance._signature_hash = instance.__dict__.get('signature_hash')
+
+
+@receiver(pre_save, sender=DocumentHistory)
+@receiver(pre_save, sender=DigitalSignature)
+def chain_audit_entry(sender, instance, **kwargs):
+    # Gravações em lote (bulk_create) chamam chain_entries diretamente
+    if instance._state.adding and not instance.entry_hash:
+        chain_entries([instance])
+
+
+@receiver(m2m_changed, sender=Institution.admin_users.through)
+def invalidate_admin_institutions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Depois do clear não há mais como saber quem era administrador
+        if reverse:
+            invalidate_user_institutions([instance.pk])
+        else:
+            invalidate_user_institutions(instance.admin_users.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_institutions([instance.pk] if reverse else pk_set)
+
+
+@receiver(post_save, sender=Institution)
+@receiver(pre_delete, sender=Institution)
+def invalidate_institution_admins(sender, instance, **kwargs):
+    # Nome e tipo ficam no cache: alterações invalidam os administradores
+    if instance.pk is not None:
+        invalidate_user_institutions(instance.admin_users.values_list('pk', flat=True))
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    apply_pragmas(connection)
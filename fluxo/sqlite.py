@@ -0,0 +1,51 @@
+"""
+Ajustes de concorrência do SQLite, aplicados a cada nova conexão.
+
+O sinal connection_created (ver fluxo.signals) executa os PRAGMAs de
+settings.FLUXO_SQLITE_PRAGMAS, na ordem do dict. O perfil de produção
+(Assinatura.settings_production) liga o WAL (leitores não bloqueiam o
+escritor), synchronous=NORMAL (um fsync por checkpoint, não por commit),
+busy_timeout, mmap_size e cache_size, com conexões persistentes
+(CONN_MAX_AGE) para que o custo de abertura e dos PRAGMAs seja pago uma vez
+por processo, não por requisição.
+"""
+import re
+
+from django.conf import settings
+
+# PRAGMAs exibidos por read_pragmas (ex.: no load_test)
+REPORTED_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')
+
+_NAME_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'FLUXO_SQLITE_PRAGMAS', {})
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Executa os PRAGMAs (por padrão, os de FLUXO_SQLITE_PRAGMAS) na conexão, se for SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not _NAME_RE.match(name) or not _VALUE_RE.match(str(value)):
+                raise ValueError(f"PRAGMA inválido em FLUXO_SQLITE_PRAGMAS: {name}={value}")
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_pragmas(connection, names=REPORTED_PRAGMAS):
+    """Valores em vigor dos PRAGMAs na conexão ({} se não for SQLite)."""
+    if connection.vendor != 'sqlite':
+        return {}
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            if not _NAME_RE.match(name):
+                raise ValueError(f"PRAGMA inválido: {name}")
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
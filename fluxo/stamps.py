@@ -0,0 +1,231 @@
+"""
+Motor de templates do carimbo de assinatura.
+
+As partes estáticas do carimbo (moldura, cabeçalho, rótulos e recursos de
+fonte) são montadas uma única vez por tipo de signatário como um Form XObject
+reutilizável e mantidas em um cache LRU limitado. Por assinatura, apenas os
+valores dinâmicos (nome, CPF, data, hashes) e o QR Code (em vetor) são escritos
+em um pequeno content stream, sem canvas do ReportLab, sem PIL/PNG e sem reparse
+pelo PdfReader.
+"""
+import functools
+import zlib
+
+import qrcode
+from PyPDF2 import PageObject
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    EncodedStreamObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .instrumentation import span
+
+# Geometria do carimbo, em pontos, relativa ao canto inferior esquerdo da moldura
+STAMP_WIDTH = 220
+STAMP_HEIGHT = 50
+TEXT_X = 60
+TEXT_TOP = 40
+HEADER_FONT_SIZE = 8
+FIELD_FONT_SIZE = 7
+# Entrelinhas padrão do ReportLab (1.2 x tamanho da fonte)
+HEADER_LEADING = HEADER_FONT_SIZE * 1.2
+FIELD_LEADING = FIELD_FONT_SIZE * 1.2
+TEXT_GRAY = b'0.1 0.1 0.1 rg'
+
+QR_X = 5
+QR_Y = 5
+QR_SIZE = 40
+
+FIELD_LABELS = ('Nome: ', 'CPF: ', 'Data: ', 'Hash: ', 'Doc Hash: ')
+
+# Número máximo de templates mantidos em memória (um por tipo de signatário)
+TEMPLATE_CACHE_SIZE = 16
+# Número máximo de QR Codes vetoriais mantidos em memória (por payload)
+QR_CACHE_SIZE = 1024
+
+FONTS = {
+    'FB': 'Helvetica-Bold',
+    'FR': 'Helvetica',
+}
+
+
+class _ObjectStore:
+    """
+    Repositório mínimo de objetos indiretos.
+
+    Implementa o protocolo usado pelo PyPDF2 (`get_object`) para que as páginas
+    de carimbo possam ser mescladas (merge_page) ou importadas pela atualização
+    incremental como se viessem de um PdfReader.
+    """
+
+    def __init__(self):
+        self._objects = []
+
+    def add(self, obj):
+        self._objects.append(obj)
+        obj.indirect_reference = IndirectObject(len(self._objects), 0, self)
+        return obj.indirect_reference
+
+    def get_object(self, reference):
+        return self._objects[reference.idnum - 1]
+
+
+def _number(value, precision=2):
+    """Formata um número para o content stream."""
+    return f'{value:.{precision}f}'.rstrip('0').rstrip('.').encode()
+
+
+def pdf_string(text):
+    """Codifica um texto como string literal PDF (WinAnsiEncoding)."""
+    data = text.encode('cp1252', errors='replace')
+    data = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + data + b')'
+
+
+def _font_resources():
+    fonts = DictionaryObject()
+    for name, base_font in FONTS.items():
+        font = DictionaryObject()
+        font[NameObject('/Type')] = NameObject('/Font')
+        font[NameObject('/Subtype')] = NameObject('/Type1')
+        font[NameObject('/BaseFont')] = NameObject(f'/{base_font}')
+        font[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
+        fonts[NameObject(f'/{name}')] = font
+    return fonts
+
+
+def _text_line(font, size, x, y, text):
+    return b' '.join([
+        b'BT', f'/{font}'.encode(), _number(size), b'Tf', TEXT_GRAY,
+        b'1 0 0 1', _number(x), _number(y), b'Tm', pdf_string(text), b'Tj ET',
+    ])
+
+
+class StampTemplate:
+    """Partes estáticas do carimbo de um tipo de signatário, prontas para reuso."""
+
+    def __init__(self, signer_type):
+        self.signer_type = signer_type
+        self.objects = _ObjectStore()
+        self.fonts = _font_resources()
+
+        header = f"ASSINADO DIGITALMENTE ({signer_type.upper()})"
+        lines = [_text_line('FB', HEADER_FONT_SIZE, TEXT_X, TEXT_TOP, header)]
+        self.value_positions = []
+        y = TEXT_TOP - HEADER_LEADING
+        for label in FIELD_LABELS:
+            lines.append(_text_line('FR', FIELD_FONT_SIZE, TEXT_X, y, label))
+            self.value_positions.append((TEXT_X + stringWidth(label, FONTS['FR'], FIELD_FONT_SIZE), y))
+            y -= FIELD_LEADING
+        # Borda do carimbo
+        lines.append(b'0 0 0 RG 1 w 0 0 ' + _number(STAMP_WIDTH) + b' ' + _number(STAMP_HEIGHT) + b' re S')
+
+        right = max(STAMP_WIDTH, TEXT_X + stringWidth(header, FONTS['FB'], HEADER_FONT_SIZE))
+        bottom = y + FIELD_LEADING - FIELD_FONT_SIZE
+
+        form = DecodedStreamObject()
+        form._data = b'\n'.join(lines)
+        form[NameObject('/Type')] = NameObject('/XObject')
+        form[NameObject('/Subtype')] = NameObject('/Form')
+        form[NameObject('/BBox')] = ArrayObject([
+            NumberObject(0), FloatObject(round(bottom, 2)),
+            FloatObject(round(right + 1, 2)), NumberObject(STAMP_HEIGHT + 1),
+        ])
+        resources = DictionaryObject()
+        resources[NameObject('/Font')] = self.fonts
+        form[NameObject('/Resources')] = resources
+        self.form = self.objects.add(form)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_stamp_template(signer_type):
+    """Retorna (e mantém em cache LRU) o template do carimbo para o tipo de signatário."""
+    return StampTemplate(signer_type)
+
+
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_operators(payload):
+    """
+    Desenha o QR Code como retângulos vetoriais a partir da matriz de módulos.
+
+    Módulos escuros consecutivos de uma mesma linha viram um único retângulo.
+    O resultado (operadores do content stream) fica em cache pelo payload
+    (`HASH|DOC|ID`), então re-renderizações não recodificam o QR.
+    """
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=3, border=1)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    count = qr.modules_count
+    size = count + 2 * qr.border
+    module = QR_SIZE / size
+
+    ops = [b'q', _number(module, 4), b'0 0', _number(module, 4), _number(QR_X), _number(QR_Y), b'cm 0 g']
+    for row in range(count):
+        y = _number(size - qr.border - row - 1)
+        col = 0
+        while col < count:
+            if not qr.modules[row][col]:
+                col += 1
+                continue
+            start = col
+            while col < count and qr.modules[row][col]:
+                col += 1
+            ops.extend([_number(start + qr.border), y, _number(col - start), b'1 re'])
+    ops.append(b'f Q')
+    return b' '.join(ops)
+
+
+# Matrizes de rotação (a b c d) para os ângulos de /Rotate
+_ROTATIONS = {
+    0: b'1 0 0 1',
+    90: b'0 1 -1 0',
+    180: b'-1 0 0 -1',
+    270: b'0 -1 1 0',
+}
+
+
+def render_stamp(signer_type, x_pt, y_pt, values, qr_payload, page_size=A4, rotate=0):
+    """
+    Monta a página de overlay do carimbo a partir do template em cache.
+
+    `values` são os textos dinâmicos na ordem de FIELD_LABELS e `rotate` o
+    ângulo (anti-horário) aplicado ao carimbo em (x_pt, y_pt). Retorna um
+    PageObject pronto para `merge_page` ou para a atualização incremental.
+    """
+    template = get_stamp_template(signer_type)
+    objects = _ObjectStore()
+
+    xobjects = DictionaryObject()
+    xobjects[NameObject('/Tpl')] = template.form
+    ops = [b'q ' + _ROTATIONS[rotate] + b' ' + _number(x_pt) + b' ' + _number(y_pt) + b' cm', b'/Tpl Do']
+    for (x, y), value in zip(template.value_positions, values):
+        ops.append(_text_line('FR', FIELD_FONT_SIZE, x, y, value))
+
+    try:
+        with span('qr'):
+            ops.append(qr_operators(qr_payload))
+    except Exception as e:
+        # Em caso de falha no QR Code, apenas registra o erro e prossegue
+        print(f"Erro ao gerar QR Code: {e}")
+    ops.append(b'Q')
+
+    contents = EncodedStreamObject()
+    contents[NameObject('/Filter')] = NameObject('/FlateDecode')
+    contents._data = zlib.compress(b'\n'.join(ops))
+
+    resources = DictionaryObject()
+    resources[NameObject('/Font')] = template.fonts
+    resources[NameObject('/XObject')] = xobjects
+
+    page = PageObject.create_blank_page(None, *page_size)
+    page[NameObject('/Resources')] = resources
+    page[NameObject('/Contents')] = objects.add(contents)
+    return page
@@ -0,0 +1,119 @@
+"""
+Armazenamento endereçado por conteúdo dos PDFs.
+
+Cada arquivo é gravado uma única vez em `blobs/ab/cd/<sha256>.pdf`. Documentos
+com o mesmo conteúdo (ex.: o mesmo modelo de termo reenviado por várias
+universidades) compartilham o blob; o número de referências fica em
+StoredBlob e os blobs órfãos são removidos por `manage.py gc_blobs`.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+# Derivados (ex.: prévia da primeira página) indexados pelo hash do original
+PREVIEW_PREFIX = 'previews'
+
+_BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+_PREVIEW_NAME_RE = re.compile(r'^previews/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})-p1\.pdf$')
+
+
+def blob_name(digest, extension='.pdf'):
+    """Nome do blob para um SHA-256 (em hexadecimal)."""
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def blob_digest(name):
+    """Retorna o SHA-256 contido no nome do blob, ou None se não for um blob."""
+    match = _BLOB_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+def preview_name(digest):
+    """Nome da prévia (primeira página) do original com esse SHA-256."""
+    return f'{PREVIEW_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}-p1.pdf'
+
+
+def preview_digest(name):
+    """Retorna o SHA-256 do original a que a prévia pertence, ou None."""
+    match = _PREVIEW_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+def _is_keyed(name):
+    """Nomes derivados de um hash: o mesmo nome sempre tem o mesmo conteúdo."""
+    return blob_digest(name) is not None or preview_digest(name) is not None
+
+
+def content_digest(content):
+    """Calcula o SHA-256 de um arquivo lendo-o em chunks."""
+    sha256 = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+def original_upload_to(instance, filename):
+    """
+    upload_to do arquivo original: usa o hash já calculado no upload
+    (SHA256UploadHandler) para que o arquivo não precise ser relido.
+    """
+    extension = os.path.splitext(filename)[1].lower() or '.pdf'
+    if instance.original_hash:
+        return blob_name(instance.original_hash, extension)
+    return filename
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage que grava os arquivos pelo SHA-256 do conteúdo.
+
+    Nomes que ainda não são de blob são substituídos pelo nome do blob
+    (calculando o hash do conteúdo). Se o blob (ou a prévia derivada de um
+    original) já existe, a gravação é pulada.
+    """
+
+    def save(self, name, content, max_length=None):
+        if not _is_keyed(name):
+            extension = os.path.splitext(name or '')[1].lower() or '.pdf'
+            name = blob_name(content_digest(content), extension)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Mesmo nome de blob significa mesmo conteúdo: nunca renomeia
+        if _is_keyed(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not _is_keyed(name):
+            return super()._save(name, content)
+
+        path = self.path(name)
+        if os.path.exists(path):
+            # Atualiza o mtime para que o gc_blobs não remova um blob reaproveitado agora
+            os.utime(path)
+            return name
+
+        # Grava em um nome temporário e renomeia atomicamente: uploads simultâneos
+        # do mesmo conteúdo nunca expõem um blob parcialmente escrito.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), path)
+        return name
+
+
+document_storage = ContentAddressedStorage()
+
+
+def get_document_storage():
+    """Storage dos arquivos de InternshipDocument (callable para não fixar a instância nas migrações)."""
+    return document_storage
@@ -1,3 +1,1735 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import qrcode
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import NameObject, NumberObject, RectangleObject
+
+from .audit import verify_inclusion_proof
+from .bulk_send import BULK_SEND_BATCH_SIZE, sent_records
+from .checks import check_shared_cache
+from .idempotency import InFlightTimeout, in_flight_key, new_key, run_once
+from .jobs import MAX_ATTEMPTS, STALE_AFTER, claim_jobs, enqueue_signing, requeue_stale_jobs, run_jobs
+from .management.commands.benchmark_signing import build_synthetic_pdf
+from .models import (
+    AuditCheckpoint,
+    DigitalSignature,
+    DocumentHistory,
+    FileAudit,
+    Institution,
+    InstitutionDocumentStats,
+    InternshipDocument,
+    SigningJob,
+    StoredBlob,
+)
+from .pagination import DEFAULT_PAGE_SIZE, keyset_page, phased_keyset_page
+from .pdf import CANVAS_SCALE, apply_signature_to_pdf, canvas_to_pdf, create_signature_stamp_pdf, read_page_geometry
+from .pdf_incremental import IncrementalUpdateError, append_stamp
+from .services import (
+    build_signature,
+    bulk_sign_documents,
+    finalize_signatures,
+    render_signed_pdf,
+    send_document,
+    sign_document,
+)
+from .sqlite import apply_pragmas, read_pragmas
+from .stamps import QR_SIZE, QR_X, QR_Y, STAMP_HEIGHT, STAMP_WIDTH, StampTemplate, get_stamp_template, qr_operators
+from .previews import get_first_page_preview
+from .storage import blob_name, document_storage, preview_name
+from .uploadhandlers import SHA256UploadHandler, uploaded_sha256
+
+
+def build_xref_stream_pdf(hybrid=False):
+    """
+    PDF 1.5 mínimo com a página dentro de um object stream, indexado por um
+    xref stream; com `hybrid`, por uma tabela xref clássica com /XRefStm.
+    """
+    content = b'BT /F1 12 Tf 72 720 Td (Termo de estagio) Tj ET'
+    page = (b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+            b'/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>')
+    out = BytesIO()
+    out.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+
+    def write(number, body):
+        offsets[number] = out.tell()
+        out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    write(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    write(2, b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>')
+    write(4, b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+    header = b'3 0 '
+    write(5, b'<< /Type /ObjStm /N 1 /First %d /Length %d >>\nstream\n' % (len(header), len(header + page))
+          + header + page + b'\nendstream')
+
+    offsets[6] = out.tell()
+    rows = [(0, 0, 0xFFFF)] + [(2, 5, 0) if number == 3 else (1, offsets[number], 0) for number in range(1, 7)]
+    data = b''.join(kind.to_bytes(1, 'big') + a.to_bytes(4, 'big') + b.to_bytes(2, 'big') for kind, a, b in rows)
+    write(6, b'<< /Type /XRef /Size 7 /W [1 4 2] /Root 1 0 R /Length %d >>\nstream\n' % len(data)
+          + data + b'\nendstream')
+    if not hybrid:
+        out.write(b'startxref\n%d\n%%%%EOF\n' % offsets[6])
+        return out.getvalue()
+
+    # Arquivo híbrido: a tabela clássica omite os objetos do object stream
+    startxref = out.tell()
+    out.write(b'xref\n0 3\n0000000000 65535 f\r\n')
+    for number in (1, 2):
+        out.write(b'%010d 00000 n\r\n' % offsets[number])
+    out.write(b'4 3\n')
+    for number in (4, 5, 6):
+        out.write(b'%010d 00000 n\r\n' % offsets[number])
+    out.write(b'trailer\n<< /Size 7 /Root 1 0 R /XRefStm %d >>\nstartxref\n%d\n%%%%EOF\n' % (offsets[6], startxref))
+    return out.getvalue()
+
+
+SIGNATURE_INFO = {
+    'document_id': 1,
+    'signer_name': 'Escola',
+    'signer_cpf': '000.000.000-00',
+    'signer_type': 'health_school',
+    'signing_timestamp': '2025-01-01T00:00:00',
+    'document_hash': '0' * 64,
+}
+
+
+class IncrementalSigningTests(TestCase):
+    """Modo 'incremental': o carimbo é anexado sem alterar os bytes originais, com xref clássica, stream ou híbrida."""
+
+    def setUp(self):
+        self.stamp_page = create_signature_stamp_pdf(SIGNATURE_INFO, 300, 100, 'f' * 64)
+
+    def assert_appended(self, data, text):
+        output = append_stamp(data, self.stamp_page)
+        self.assertTrue(output.startswith(data))
+        page = PdfReader(BytesIO(output)).pages[0]
+        self.assertIn('/FmSig', page['/Resources']['/XObject'])
+        # Os objetos novos não reutilizam números existentes: o conteúdo original continua legível
+        self.assertIn(text, page.extract_text())
+
+        # Uma segunda assinatura se encadeia à primeira atualização
+        output_twice = append_stamp(output, self.stamp_page)
+        self.assertTrue(output_twice.startswith(output))
+        self.assertIn('/FmSig1', PdfReader(BytesIO(output_twice)).pages[0]['/Resources']['/XObject'])
+
+    def test_classic_xref(self):
+        self.assert_appended(build_synthetic_pdf(2), 'Termo de Compromisso')
+
+    def test_xref_stream(self):
+        self.assert_appended(build_xref_stream_pdf(), 'Termo de estagio')
+
+    def test_hybrid_xref(self):
+        self.assert_appended(build_xref_stream_pdf(hybrid=True), 'Termo de estagio')
+
+    def test_unexpected_error_falls_back_to_rewrite(self):
+        with mock.patch('fluxo.pdf_incremental._locate_page', side_effect=KeyError('/Kids')):
+            with self.assertRaises(IncrementalUpdateError):
+                append_stamp(build_synthetic_pdf(1), self.stamp_page)
+
+            original = build_synthetic_pdf(1)
+            document = mock.Mock(original_file=BytesIO(original))
+            document.first_page_geometry.return_value = [0, 0, 595.28, 841.89, 0]
+            signed = apply_signature_to_pdf(document, SIGNATURE_INFO, 'f' * 64, 300, 100, mode='incremental')
+        # Reescrita completa: o carimbo vai para o conteúdo da página
+        self.assertFalse(signed.startswith(original))
+        self.assertIn('ffffffff', PdfReader(BytesIO(signed)).pages[0].extract_text())
+
+
+class StampTemplateTests(TestCase):
+    """O carimbo montado a partir do template em cache é idêntico ao montado sem cache."""
+
+    def setUp(self):
+        get_stamp_template.cache_clear()
+
+    def render(self, signature_hash):
+        """Aplica o carimbo a uma página e devolve (content stream, texto) do PDF gravado."""
+        page = PdfReader(BytesIO(build_synthetic_pdf(1))).pages[0]
+        page.merge_page(create_signature_stamp_pdf(SIGNATURE_INFO, 300, 100, signature_hash))
+        writer = PdfWriter()
+        writer.add_page(page)
+        output = BytesIO()
+        writer.write(output)
+        page = PdfReader(output).pages[0]
+        return page.get_contents().get_data(), page.extract_text()
+
+    def test_cached_template_matches_uncached(self):
+        with mock.patch('fluxo.stamps.get_stamp_template', StampTemplate):
+            uncached = self.render('f' * 64)
+        self.assertEqual(get_stamp_template.cache_info().currsize, 0)
+
+        # O template é reutilizado entre assinaturas sem ser alterado por elas
+        self.render('e' * 64)
+        cached = self.render('f' * 64)
+        self.assertEqual(get_stamp_template.cache_info().hits, 1)
+        self.assertEqual(cached, uncached)
+
+        contents, text = cached
+        self.assertIn('ASSINADO DIGITALMENTE (HEALTH_SCHOOL)', text)
+        self.assertIn('Escola', text)
+        self.assertIn('f' * 25, text)
+        self.assertIn(b'/Tpl Do', contents)
+
+
+class StampQRCodeTests(TestCase):
+    """O QR Code vetorial do carimbo reproduz, módulo a módulo, a imagem gerada pelo qrcode."""
+
+    def rasterize(self, ops):
+        """Pinta os retângulos do content stream numa grade de módulos (True = escuro)."""
+        tokens = ops.split()
+        self.assertEqual(tokens[:8], [b'q', tokens[1], b'0', b'0', tokens[1], str(QR_X).encode(), str(QR_Y).encode(), b'cm'])
+        self.assertEqual(tokens[-2:], [b'f', b'Q'])
+        module = float(tokens[1])
+        size = round(QR_SIZE / module)
+        self.assertAlmostEqual(module * size, QR_SIZE, places=2)
+
+        grid = [[False] * size for _ in range(size)]
+        rects = tokens[10:-2]
+        for index in range(0, len(rects), 5):
+            x, y, width, height, operator = rects[index:index + 5]
+            self.assertEqual((height, operator), (b'1', b're'))
+            row = size - 1 - int(y)
+            for col in range(int(x), int(x) + int(width)):
+                grid[row][col] = True
+        return grid
+
+    def reference(self, payload):
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=1, border=1)
+        qr.add_data(payload)
+        image = qr.make_image().get_image().convert('L')
+        return [[image.getpixel((col, row)) == 0 for col in range(image.width)] for row in range(image.height)]
+
+    def test_vector_qr_matches_reference_image(self):
+        payload = f"HASH:{'f' * 64}|DOC:{'0' * 64}|ID:1"
+        grid = self.rasterize(qr_operators(payload))
+        self.assertEqual(grid, self.reference(payload))
+
+        # Padrões de localização nos três cantos (7x7, dentro da borda de 1 módulo)
+        finder = [[row in (0, 6) or col in (0, 6) or (2 <= row <= 4 and 2 <= col <= 4) for col in range(7)]
+                  for row in range(7)]
+        last = len(grid) - 8
+        for top, left in ((1, 1), (1, last), (last, 1)):
+            self.assertEqual([line[left:left + 7] for line in grid[top:top + 7]], finder)
+
+    def test_stamp_embeds_qr_for_signature(self):
+        stamp = create_signature_stamp_pdf(SIGNATURE_INFO, 300, 100, 'f' * 64)
+        contents = stamp['/Contents'].get_object().get_data()
+        self.assertIn(qr_operators(f"HASH:{'f' * 64}|DOC:{'0' * 64}|ID:1"), contents)
+
+
+class FluxoTestCase(TestCase):
+    """
+    Base dos testes que gravam arquivos: cache limpo, MEDIA_ROOT temporário
+    (removido ao final) e uma universidade e uma escola de saúde.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        self.university = Institution.objects.create(name='Universidade', type='university', cnpj='11.111.111/0001-11')
+        self.health_school = Institution.objects.create(name='Escola', type='health_school', cnpj='22.222.222/0001-22')
+
+    def create_user(self, username, institution=None):
+        """Usuário `username`, administrador de `institution` se informada."""
+        user = User.objects.create_user(username, f'{username}@example.com', 'senha')
+        if institution is not None:
+            institution.admin_users.add(user)
+        return user
+
+
+class UniversityDashboardTests(TestCase):
+    """Dashboard da universidade com milhares de documentos."""
+
+    NUM_DOCUMENTS = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('universidade', 'uni@example.com', 'senha')
+        cls.university = Institution.objects.create(name='Universidade', type='university', cnpj='00.000.000/0001-00')
+        cls.university.admin_users.add(cls.user)
+        health_schools = [
+            Institution.objects.create(name=f'Escola {i}', type='health_school', cnpj=f'00.000.000/000{i}-99')
+            for i in range(3)
+        ]
+        statuses = ['pending_health_school', 'signed_health_school', 'completed', 'rejected']
+        InternshipDocument.objects.bulk_create([
+            InternshipDocument(
+                title=f'Documento {i}',
+                description='Termo de estágio',
+                university=cls.university,
+                health_school=health_schools[i % 3],
+                original_file=f'documents/original/{i}.pdf',
+                original_hash=f'{i:064x}',
+                status=statuses[i % 4],
+                created_by=cls.user,
+            )
+            for i in range(cls.NUM_DOCUMENTS)
+        ], batch_size=1000)
+        # bulk_create não dispara sinais: reconstrói os contadores por instituição
+        call_command('document_stats', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_counts_and_page_use_constant_queries(self):
+        # sessão, usuário, instituições do usuário, contadores e página
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('university_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['status_counts'], {
+            'pending': 2500, 'signed': 2500, 'completed': 2500, 'rejected': 2500, 'total': self.NUM_DOCUMENTS,
+        })
+        self.assertEqual(len(response.context['documents']), DEFAULT_PAGE_SIZE)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+        # As instituições do usuário agora vêm do cache
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('university_dashboard'), {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['documents']), DEFAULT_PAGE_SIZE)
+
+    def test_keyset_pages_cover_all_documents_once(self):
+        queryset = InternshipDocument.objects.filter(university=self.university).only('id', 'created_at')
+        seen = []
+        cursor = None
+        while True:
+            items, cursor = keyset_page(queryset, cursor, page_size=1000)
+            seen.extend(item.pk for item in items)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), self.NUM_DOCUMENTS)
+        self.assertEqual(len(set(seen)), self.NUM_DOCUMENTS)
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.client.get(reverse('university_dashboard'), {'cursor': 'inválido'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['documents']), DEFAULT_PAGE_SIZE)
+
+
+class HealthSchoolDashboardTests(TestCase):
+    """Caixa de entrada da Escola de Saúde: pendentes primeiro, em páginas por cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('escola', 'escola@example.com', 'senha')
+        cls.university = Institution.objects.create(name='Universidade', type='university', cnpj='11.111.111/0001-11')
+        cls.health_school = Institution.objects.create(name='Escola', type='health_school', cnpj='22.222.222/0001-22')
+        cls.health_school.admin_users.add(cls.user)
+        statuses = ['completed', 'pending_health_school', 'signed_health_school'] * 10
+        for i, status in enumerate(statuses):
+            InternshipDocument.objects.create(
+                title=f'Documento {i}',
+                university=cls.university,
+                health_school=cls.health_school,
+                original_file=f'documents/original/{i}.pdf',
+                original_hash=f'{i:064x}',
+                status=status,
+                created_by=cls.user,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_pending_documents_come_first(self):
+        response = self.client.get(reverse('health_school_dashboard'))
+        statuses = [document.status for document in response.context['documents']]
+        self.assertEqual(statuses[:10], ['pending_health_school'] * 10)
+        self.assertNotIn('pending_health_school', statuses[10:])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_phased_cursor_crosses_phases(self):
+        documents = InternshipDocument.objects.filter(health_school=self.health_school)
+        phases = [
+            documents.filter(status='pending_health_school'),
+            documents.exclude(status='pending_health_school'),
+        ]
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = phased_keyset_page(phases, cursor=cursor, page_size=7)
+            seen += [document.status for document in page]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(seen[:10], ['pending_health_school'] * 10)
+        self.assertNotIn('pending_health_school', seen[10:])
+
+    def test_status_filter_and_counts(self):
+        response = self.client.get(reverse('health_school_dashboard'), {'status': 'completed'})
+        self.assertEqual({document.status for document in response.context['documents']}, {'completed'})
+        self.assertEqual(len(response.context['documents']), 10)
+
+        response = self.client.get(reverse('health_school_dashboard_counts'))
+        self.assertEqual(response.json(), {
+            'pending': 10, 'signed': 10, 'completed': 10, 'rejected': 0, 'total': 30,
+        })
+
+
+class InstitutionMembershipTests(FluxoTestCase):
+    """Cache das instituições administradas por usuário."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('gestor')
+        self.client.force_login(self.user)
+
+    def test_home_redirect_follows_membership_changes(self):
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('admin:index'), fetch_redirect_response=False)
+
+        self.health_school.admin_users.add(self.user)
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('health_school_dashboard'), fetch_redirect_response=False)
+
+        self.user.administered_institutions.add(self.university)
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('university_dashboard'), fetch_redirect_response=False)
+
+        self.university.admin_users.clear()
+        response = self.client.get(reverse('home'))
+        self.assertRedirects(response, reverse('health_school_dashboard'), fetch_redirect_response=False)
+
+    def test_membership_is_loaded_once_per_request(self):
+        self.university.admin_users.add(self.user)
+        # sessão, usuário, instituições do usuário, contadores e página
+        with self.assertNumQueries(5):
+            self.client.get(reverse('university_dashboard'))
+        self.university.name = 'Universidade Federal'
+        self.university.save()
+        response = self.client.get(reverse('university_dashboard'))
+        self.assertEqual(response.context['university'].name, 'Universidade Federal')
+
+    def test_shared_cache_check(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'fluxo_cache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES=locmem, FLUXO_REQUIRE_SHARED_CACHE=True):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['fluxo.E001'])
+        with override_settings(CACHES=shared, FLUXO_REQUIRE_SHARED_CACHE=True):
+            self.assertEqual(check_shared_cache(None), [])
+        filebased = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.media_root}}
+        with override_settings(CACHES=filebased, FLUXO_REQUIRE_SHARED_CACHE=True):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['fluxo.E002'])
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN é específico do SQLite")
+class QueryPlanTests(TestCase):
+    """
+    Roda EXPLAIN QUERY PLAN nas consultas de cada view e falha se alguma
+    tabela do fluxo for lida por varredura (SCAN), inclusive de um índice
+    inteiro (SCAN ... USING [COVERING] INDEX): toda leitura precisa ser um
+    SEARCH por chave.
+    """
+
+    # Tabelas pequenas e estáveis, onde a varredura é intencional (ex.: lista
+    # de universidades no filtro do dashboard da escola de saúde)
+    SMALL_TABLES = {'fluxo_institution', 'auth_user', 'django_session', 'fluxo_institution_admin_users'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.university_user = User.objects.create_user('universidade', 'uni@example.com', 'senha')
+        cls.health_school_user = User.objects.create_user('escola', 'escola@example.com', 'senha')
+        cls.university = Institution.objects.create(name='Universidade', type='university', cnpj='11.111.111/0001-11')
+        cls.health_school = Institution.objects.create(name='Escola', type='health_school', cnpj='22.222.222/0001-22')
+        cls.university.admin_users.add(cls.university_user)
+        cls.health_school.admin_users.add(cls.health_school_user)
+        cls.documents = InternshipDocument.objects.bulk_create([
+            InternshipDocument(
+                title=f'Documento {i}',
+                description='Termo de estágio',
+                university=cls.university,
+                health_school=cls.health_school,
+                original_file=f'documents/original/{i}.pdf',
+                original_hash=f'{i:064x}',
+                page_count=1,
+                page_geometry=[[0, 0, 595.28, 841.89, 0]],
+                created_by=cls.university_user,
+            )
+            for i in range(20)
+        ])
+        DocumentHistory.objects.bulk_create([
+            DocumentHistory(document=document, action='sent', performed_by=cls.university_user)
+            for document in cls.documents
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_no_full_scans(self, user, url, method='get', data=None, search=()):
+        """
+        Falha em qualquer SCAN fora de SMALL_TABLES. As tabelas de `search`
+        (consultas por keyset e filtros) precisam ser lidas por um SEARCH em
+        um índice secundário, não apenas pela chave primária.
+        """
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data or {})
+        self.assertTrue(queries.captured_queries)
+
+        details = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    details.append(detail)
+                    match = re.match(r'SCAN (\w+)', detail)
+                    if match and match.group(1) not in self.SMALL_TABLES:
+                        self.fail(f'{url}: varredura em {match.group(1)}\n{sql}\n{detail}')
+        for table in search:
+            self.assertTrue(
+                any(re.match(rf'SEARCH {table} USING (COVERING )?INDEX ', detail) for detail in details),
+                f'{url}: {table} não é lida por um índice\n' + '\n'.join(details),
+            )
+
+    def test_university_views(self):
+        document = self.documents[0]
+        self.assert_no_full_scans(self.university_user, reverse('university_dashboard'), search=['fluxo_internshipdocument'])
+        self.assert_no_full_scans(self.university_user, reverse('university_view_document', args=[document.id]))
+
+    def test_health_school_views(self):
+        document = self.documents[0]
+        self.assert_no_full_scans(
+            self.health_school_user, reverse('health_school_view_document', args=[document.id]),
+            search=['fluxo_digitalsignature', 'fluxo_documenthistory'],
+        )
+        self.assert_no_full_scans(self.health_school_user, reverse('health_school_sign_document', args=[document.id]))
+        self.assert_no_full_scans(self.health_school_user, reverse('health_school_signing_status', args=[document.id]))
+        documents = ['fluxo_internshipdocument']
+        self.assert_no_full_scans(self.health_school_user, reverse('health_school_bulk_sign'), search=documents)
+        self.assert_no_full_scans(self.health_school_user, reverse('health_school_dashboard'), search=documents)
+        self.assert_no_full_scans(
+            self.health_school_user,
+            reverse('health_school_dashboard') + f'?university={self.university.id}&status=completed',
+            search=documents,
+        )
+        self.assert_no_full_scans(self.health_school_user, reverse('health_school_dashboard_counts'))
+
+    def test_home_redirect(self):
+        self.assert_no_full_scans(self.university_user, reverse('home'))
+
+
+class ServerTimingTests(FluxoTestCase):
+    """Cabeçalho Server-Timing do ServerTimingMiddleware (settings.FLUXO_SERVER_TIMING)."""
+
+    METRIC_RE = re.compile(r'^[a-z]+;dur=\d+\.\d(;desc="[^"]*")?$')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.create_user('escola', self.health_school))
+
+    @override_settings(FLUXO_SERVER_TIMING=True)
+    def test_header_when_enabled(self):
+        with self.assertLogs('fluxo.timing', 'INFO') as logs:
+            response = self.client.get(reverse('health_school_dashboard'))
+        metrics = response['Server-Timing'].split(', ')
+        for metric in metrics:
+            self.assertRegex(metric, self.METRIC_RE)
+        self.assertEqual([metric.split(';')[0] for metric in metrics], ['db', 'tpl', 'total'])
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'health_school_dashboard')
+
+        # O template continua medido uma única vez mesmo com o middleware recarregado
+        self.client = self.client_class()
+        self.client.force_login(self.health_school.admin_users.get())
+        with self.assertLogs('fluxo.timing', 'INFO'):
+            response = self.client.get(reverse('health_school_dashboard'))
+        self.assertNotIn('desc="2x"', response['Server-Timing'])
+
+    def test_no_header_when_disabled(self):
+        response = self.client.get(reverse('health_school_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+
+class InstitutionDocumentStatsTests(FluxoTestCase):
+    """Contadores por instituição mantidos a cada mudança de status."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('gestor')
+
+    def create_document(self, status='pending_health_school'):
+        return InternshipDocument.objects.create(
+            title='Documento',
+            description='Termo de estágio',
+            university=self.university,
+            health_school=self.health_school,
+            original_file='documents/original/termo.pdf',
+            original_hash='a' * 64,
+            status=status,
+            created_by=self.user,
+        )
+
+    def test_counters_follow_create_update_and_delete(self):
+        document = self.create_document()
+        self.create_document(status='completed')
+        self.assertEqual(InstitutionDocumentStats.counts_for(self.health_school), {
+            'pending': 1, 'signed': 0, 'completed': 1, 'rejected': 0, 'total': 2,
+        })
+
+        document.status = 'signed_health_school'
+        document.save()
+        document.delete()
+        self.assertEqual(InstitutionDocumentStats.counts_for(self.university), {
+            'pending': 0, 'signed': 0, 'completed': 1, 'rejected': 0, 'total': 1,
+        })
+        call_command('document_stats', '--check', stdout=StringIO())
+
+    def test_delete_institution_with_documents(self):
+        for status in ('pending_health_school', 'signed_health_school', 'completed', 'rejected'):
+            self.create_document(status=status)
+        self.university.delete()
+        # A exclusão em cascata não recria os contadores da instituição excluída
+        connection.check_constraints()
+        self.assertFalse(InstitutionDocumentStats.objects.filter(institution_id=self.university.pk).exists())
+        self.assertEqual(InstitutionDocumentStats.counts_for(self.health_school), {
+            'pending': 0, 'signed': 0, 'completed': 0, 'rejected': 0, 'total': 0,
+        })
+        call_command('document_stats', '--check', stdout=StringIO())
+
+    def test_check_reports_drift(self):
+        self.create_document()
+        InstitutionDocumentStats.objects.filter(institution=self.university).update(total=5)
+        with self.assertRaises(CommandError):
+            call_command('document_stats', '--check', stdout=StringIO())
+        call_command('document_stats', stdout=StringIO())
+        call_command('document_stats', '--check', stdout=StringIO())
+
+
+class UniversityBulkSendTests(FluxoTestCase):
+    """Envio em lote a partir de um manifesto CSV e de um ZIP ou vários PDFs."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('universidade', self.university)
+        self.client.force_login(self.user)
+        self.pdf = build_synthetic_pdf(2)
+
+    def manifest(self, *lines):
+        content = 'file;title;description;num_students;health_school\n' + '\n'.join(lines)
+        return SimpleUploadedFile('manifesto.csv', content.encode(), content_type='text/csv')
+
+    def test_zip_upload(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('termos/a.pdf', self.pdf)
+            zip_file.writestr('termos/b.pdf', self.pdf)
+            zip_file.writestr('leia-me.txt', 'ignorado')
+        manifest = self.manifest(
+            f'a.pdf;Termo A;Primeiro;3;{self.health_school.id}',
+            f'b.pdf;Termo B;Segundo;1;{self.health_school.cnpj}',
+            f'c.pdf;Termo C;Sem arquivo;1;{self.health_school.id}',
+        )
+        response = self.client.post(reverse('university_bulk_send'), {
+            'manifest': manifest,
+            'archive': SimpleUploadedFile('termos.zip', archive.getvalue(), content_type='application/zip'),
+        })
+
+        results = response.context['results']
+        self.assertEqual([result['status'] for result in results], ['sent', 'sent', 'failed'])
+        documents = InternshipDocument.objects.filter(university=self.university).order_by('title')
+        self.assertEqual([document.title for document in documents], ['Termo A', 'Termo B'])
+        self.assertEqual(documents[0].num_students, 3)
+        self.assertEqual(documents[0].page_count, 2)
+        self.assertEqual(DocumentHistory.objects.filter(action='sent').count(), 2)
+        self.assertEqual(DigitalSignature.objects.filter(signer_type='university').count(), 2)
+
+        # Mesmo conteúdo: um único blob com duas referências
+        self.assertEqual(documents[0].original_file.name, documents[1].original_file.name)
+        self.assertEqual(StoredBlob.objects.get(name=documents[0].original_file.name).ref_count, 2)
+        self.assertEqual(InstitutionDocumentStats.counts_for(self.health_school)['pending'], 2)
+        call_command('document_stats', '--check', stdout=StringIO())
+
+    def test_multiple_files_upload(self):
+        manifest = self.manifest(
+            f'a.pdf;Termo A;;1;{self.health_school.id}',
+            'b.pdf;Termo B;;1;99.999.999/0001-99',
+        )
+        response = self.client.post(reverse('university_bulk_send'), {
+            'manifest': manifest,
+            'files': [
+                SimpleUploadedFile('a.pdf', self.pdf, content_type='application/pdf'),
+                SimpleUploadedFile('b.pdf', self.pdf, content_type='application/pdf'),
+            ],
+        })
+
+        results = response.context['results']
+        self.assertEqual([result['status'] for result in results], ['sent', 'failed'])
+        document = results[0]['document']
+        self.assertEqual(document.original_file.read(), self.pdf)
+        self.assertEqual(document.original_hash, document.calculate_hash(document.original_file))
+
+    def test_invalid_manifest(self):
+        manifest = SimpleUploadedFile('manifesto.csv', b'title,description\nTermo,Sem arquivo\n')
+        response = self.client.post(reverse('university_bulk_send'), {
+            'manifest': manifest,
+            'files': [SimpleUploadedFile('a.pdf', self.pdf, content_type='application/pdf')],
+        })
+        self.assertRedirects(response, reverse('university_bulk_send'))
+        self.assertFalse(InternshipDocument.objects.exists())
+
+    def test_limits_follow_settings(self):
+        manifest = self.manifest(
+            f'a.pdf;Termo A;;1;{self.health_school.id}',
+            f'b.pdf;Termo B;;1;{self.health_school.id}',
+        )
+        files = [
+            SimpleUploadedFile('a.pdf', self.pdf, content_type='application/pdf'),
+            SimpleUploadedFile('b.pdf', self.pdf, content_type='application/pdf'),
+        ]
+        with override_settings(FLUXO_BULK_SEND_MAX_FILES=1):
+            response = self.client.post(reverse('university_bulk_send'), {'manifest': manifest, 'files': files})
+        self.assertRedirects(response, reverse('university_bulk_send'))
+        self.assertFalse(InternshipDocument.objects.exists())
+
+    def test_oversized_entry_after_first_batch(self):
+        names = [f'{i:03d}.pdf' for i in range(BULK_SEND_BATCH_SIZE + 5)]
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            for name in names:
+                zip_file.writestr(name, self.pdf)
+            zip_file.writestr('grande.pdf', self.pdf + b'\0' * 1024)
+        manifest = self.manifest(*[
+            f'{name};Termo {name};;1;{self.health_school.id}' for name in names + ['grande.pdf']
+        ])
+        with override_settings(FLUXO_BULK_SEND_MAX_FILE_SIZE=len(self.pdf)):
+            response = self.client.post(reverse('university_bulk_send'), {
+                'manifest': manifest,
+                'archive': SimpleUploadedFile('termos.zip', archive.getvalue(), content_type='application/zip'),
+            })
+        self.assertRedirects(response, reverse('university_bulk_send'))
+        # Nenhum lote é gravado antes da verificação de todas as entradas
+        self.assertFalse(InternshipDocument.objects.exists())
+
+
+class ExportDocumentsTests(FluxoTestCase):
+    """Exportação em ZIP (streaming) dos documentos assinados."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('escola', self.health_school)
+        self.client.force_login(self.user)
+
+        self.signed = {}
+        for i, status in enumerate(['signed_health_school', 'completed', 'pending_health_school']):
+            document = InternshipDocument.objects.create(
+                title=f'Termo {i}',
+                university=self.university,
+                health_school=self.health_school,
+                original_file=SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+                status=status,
+                created_by=self.user,
+            )
+            if status != 'pending_health_school':
+                content = build_synthetic_pdf(2)
+                document.signed_file.save('assinado.pdf', SimpleUploadedFile('assinado.pdf', content))
+                DigitalSignature.objects.create(
+                    document=document, signer=self.user, signer_type='health_school',
+                    signature_data='{}', signature_hash=f'{i:064x}', ip_address='127.0.0.1',
+                    user_agent='teste', signer_name='Escola', signer_email='escola@example.com',
+                    signer_cpf='000.000.000-00',
+                )
+                self.signed[document.id] = (document, content, f'{i:064x}')
+
+    def read_export(self, response):
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        manifest = list(csv.DictReader(StringIO(archive.read('manifest.csv').decode())))
+        return archive, manifest
+
+    def test_export_signed_documents(self):
+        archive, manifest = self.read_export(self.client.get(reverse('export_documents')))
+
+        self.assertEqual(sorted(int(row['document_id']) for row in manifest), sorted(self.signed))
+        for row in manifest:
+            document, content, signature_hash = self.signed[int(row['document_id'])]
+            info = archive.getinfo(row['file'])
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(archive.read(info), content)
+            self.assertEqual(row['original_hash'], document.original_hash)
+            self.assertEqual(row['signed_sha256'], hashlib.sha256(content).hexdigest())
+            self.assertEqual(row['signatures'], f'health_school:{signature_hash}')
+
+    def test_status_filter_and_command(self):
+        _, manifest = self.read_export(self.client.get(reverse('export_documents'), {'status': 'completed'}))
+        self.assertEqual([row['status'] for row in manifest], ['completed'])
+
+        output = f'{self.media_root}/export.zip'
+        call_command('export_documents', self.health_school.id, output=output, stdout=StringIO())
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(len(archive.namelist()), len(self.signed) + 1)
+
+
+class VerifySignatureTests(FluxoTestCase):
+    """Verificação pública das assinaturas pelo conteúdo do QR Code."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('escola')
+        self.document = InternshipDocument.objects.create(
+            title='Termo',
+            university=self.university,
+            health_school=self.health_school,
+            original_file='documents/original/termo.pdf',
+            original_hash='a' * 64,
+            created_by=self.user,
+        )
+        self.signature, _ = build_signature(self.document, self.user, '123.456.789-00', 100, 100, '127.0.0.1', 'teste')
+
+    def qr(self, signature_hash=None, document_hash=None):
+        return (
+            f'HASH:{signature_hash or self.signature.signature_hash}'
+            f'|DOC:{document_hash or self.document.original_hash}|ID:{self.document.id}'
+        )
+
+    def test_verify_cached_and_invalidated(self):
+        url = reverse('verify_signature')
+        # Ainda não gravada: "não encontrada" fica no cache até a gravação
+        self.assertEqual(self.client.get(url, {'qr': self.qr()}).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_signatures([(self.document, self.signature, b'%PDF-1.4 assinado', 100, 100)])
+
+        with self.assertNumQueries(1):
+            verdict = self.client.get(url, {'qr': self.qr()}).json()
+        self.assertTrue(verdict['valid'])
+        self.assertEqual(verdict['document_id'], self.document.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.client.get(url, {'qr': self.qr()}).json()['valid'])
+
+        # Dados adulterados: o hash recalculado não confere mais
+        signature = DigitalSignature.objects.get(pk=self.signature.pk)
+        signature.signer_cpf = '999.999.999-99'
+        with self.captureOnCommitCallbacks(execute=True):
+            signature.save()
+        verdict = self.client.get(reverse('verify_signature_hash', args=[self.signature.signature_hash])).json()
+        self.assertFalse(verdict['valid'])
+        self.assertFalse(verdict['signature_intact'])
+
+    def test_cache_timeout_follows_settings(self):
+        finalize_signatures([(self.document, self.signature, b'%PDF-1.4 assinado', 100, 100)])
+        # Timeout 0: o resultado não fica no cache, cada verificação consulta o banco
+        with override_settings(FLUXO_VERIFY_CACHE_TIMEOUT=0):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    self.client.get(reverse('verify_signature'), {'qr': self.qr()})
+
+    def test_signed_hash_recorded_at_write_time(self):
+        content = b'%PDF-1.4 assinado'
+        finalize_signatures([(self.document, self.signature, content, 100, 100)])
+        document = InternshipDocument.objects.get(pk=self.document.pk)
+        self.assertEqual(document.signed_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(document.signed_size, len(content))
+
+        verdict = self.client.get(reverse('verify_signature'), {'qr': self.qr()}).json()
+        self.assertEqual(verdict['signed_hash'], document.signed_hash)
+
+        document.health_school.admin_users.add(self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('download_signed_document', args=[document.id]))
+        self.assertEqual(response['ETag'], f'"{document.signed_hash}"')
+        self.assertEqual(response['Content-Length'], str(len(content)))
+
+    def test_document_hash_mismatch_and_invalid_hash(self):
+        finalize_signatures([(self.document, self.signature, b'%PDF-1.4 assinado', 100, 100)])
+        verdict = self.client.get(reverse('verify_signature'), {'qr': self.qr(document_hash='b' * 64)}).json()
+        self.assertFalse(verdict['valid'])
+        self.assertTrue(verdict['signature_intact'])
+        self.assertFalse(verdict['document_match'])
+        self.assertEqual(self.client.get(reverse('verify_signature'), {'hash': 'xyz'}).status_code, 400)
+
+
+class AuditIntegrityTests(FluxoTestCase):
+    """manage.py audit_integrity: arquivos divergentes, ausentes e modo incremental."""
+
+    def setUp(self):
+        super().setUp()
+        user = self.create_user('universidade')
+        self.documents = [
+            InternshipDocument.objects.create(
+                title=f'Termo {i}',
+                university=self.university,
+                health_school=self.health_school,
+                original_file=SimpleUploadedFile('termo.pdf', f'%PDF-1.4 termo {i}'.encode()),
+                created_by=user,
+            )
+            for i in range(3)
+        ]
+
+    def audit(self, *args):
+        out = StringIO()
+        try:
+            # skip_checks=False: o mesmo caminho do manage.py, que roda as verificações do sistema
+            call_command('audit_integrity', *args, skip_checks=False, stdout=out)
+        except CommandError:
+            pass
+        return out.getvalue()
+
+    def test_reports_mismatch_and_missing(self):
+        self.assertIn('3 recalculado(s)', self.audit())
+        self.assertEqual(FileAudit.objects.filter(status='ok').count(), 3)
+
+        corrupted, removed, _ = self.documents
+        with open(corrupted.original_file.path, 'wb') as target:
+            target.write(b'%PDF-1.4 adulterado')
+        os.remove(removed.original_file.path)
+        with self.assertRaises(CommandError):
+            call_command('audit_integrity', skip_checks=False, stdout=StringIO())
+        self.assertEqual(FileAudit.objects.get(name=corrupted.original_file.name).status, 'mismatch')
+        self.assertEqual(FileAudit.objects.get(name=removed.original_file.name).status, 'missing')
+
+    def test_incremental_skips_unchanged_files(self):
+        self.audit()
+        output = self.audit('--incremental')
+        self.assertIn('0 recalculado(s)', output)
+        self.assertIn('3 sem alteração', output)
+
+        document = self.documents[0]
+        with open(document.original_file.path, 'wb') as target:
+            target.write(b'%PDF-1.4 outro conteudo')
+        output = self.audit('--incremental')
+        self.assertIn('1 recalculado(s)', output)
+        self.assertIn('1 divergente(s)', output)
+
+
+class AuditChainTests(FluxoTestCase):
+    """Trilha de auditoria encadeada, checkpoints de Merkle e provas de inclusão (manage.py verify_audit)."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('universidade')
+        self.documents = []
+        for i in range(3):
+            document = InternshipDocument.objects.create(
+                title=f'Termo {i}',
+                university=self.university,
+                health_school=self.health_school,
+                original_file=f'documents/original/termo{i}.pdf',
+                original_hash=f'{i}' * 64,
+                created_by=self.user,
+            )
+            history, signature = sent_records(document, self.user, '127.0.0.1', 'teste')
+            history.save()
+            signature.save()
+            self.documents.append(document)
+        # Assinatura da escola: gravada em lote por finalize_signatures
+        document = self.documents[0]
+        signature, _ = build_signature(document, self.user, '123.456.789-00', 100, 100, '127.0.0.1', 'teste')
+        finalize_signatures([(document, signature, b'%PDF-1.4 assinado', 100, 100)])
+
+    def verify(self, *args):
+        out = StringIO()
+        call_command('verify_audit', *args, stdout=out)
+        return out.getvalue()
+
+    def test_chain_and_tampering(self):
+        document = InternshipDocument.objects.get(pk=self.documents[0].pk)
+        self.assertEqual(document.audit_length, 4)
+        last = DocumentHistory.objects.filter(document=document).order_by('-chain_index').first()
+        self.assertEqual(document.audit_head, last.entry_hash)
+        self.assertIn('Trilha de auditoria íntegra', self.verify())
+
+        # Salvar uma instância antiga do documento não sobrescreve a cabeça da trilha
+        self.documents[0].title = 'Outro título'
+        self.documents[0].save()
+        self.assertIn('8 entrada(s) de 3 documento(s)', self.verify())
+
+        DocumentHistory.objects.filter(pk=last.pk).update(notes='adulterado')
+        with self.assertRaisesMessage(CommandError, '1 problema(s)'):
+            self.verify()
+        DocumentHistory.objects.filter(pk=last.pk).delete()
+        with self.assertRaisesMessage(CommandError, '1 problema(s)'):
+            self.verify()
+
+    def test_checkpoint_and_inclusion_proof(self):
+        self.verify('--checkpoint')
+        checkpoint = AuditCheckpoint.objects.get(institution=self.university)
+        self.assertEqual(checkpoint.leaf_count, 3)
+
+        # Entradas posteriores não alteram a raiz do checkpoint
+        history, _ = sent_records(self.documents[1], self.user, '127.0.0.1', 'teste')
+        history.save()
+        self.verify()
+
+        for document in self.documents:
+            proof = json.loads(self.verify('--prove', str(document.pk)))
+            self.assertEqual(proof['root'], checkpoint.root)
+            self.assertTrue(verify_inclusion_proof(proof))
+        proof['leaf_index'] = (proof['leaf_index'] + 1) % 3
+        self.assertFalse(verify_inclusion_proof(proof))
+
+        DigitalSignature.objects.filter(document=self.documents[2]).update(entry_hash='0' * 64)
+        with self.assertRaises(CommandError):
+            self.verify()
+
+
+class AuditChainAutocommitTests(TransactionTestCase):
+    """Entradas gravadas fora de uma transação: a cabeça da trilha só avança se o INSERT for confirmado."""
+
+    def test_failed_insert_does_not_advance_head(self):
+        user = User.objects.create_user('universidade', 'universidade@example.com', 'senha')
+        university = Institution.objects.create(name='Universidade', type='university', cnpj='11.111.111/0001-11')
+        health_school = Institution.objects.create(name='Escola', type='health_school', cnpj='22.222.222/0001-22')
+        document = InternshipDocument.objects.create(
+            title='Termo',
+            university=university,
+            health_school=health_school,
+            original_file='documents/original/termo.pdf',
+            original_hash='a' * 64,
+            created_by=user,
+        )
+        history, signature = sent_records(document, user, '127.0.0.1', 'teste')
+        history.save()
+        signature.save()
+
+        # Segunda assinatura do mesmo signatário: viola unique_signer_per_document
+        duplicate = sent_records(document, user, '127.0.0.1', 'teste')[1]
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+        self.assertEqual(InternshipDocument.objects.get(pk=document.pk).audit_length, 2)
+        call_command('verify_audit', stdout=StringIO())
+
+
+class SendDocumentServiceTests(FluxoTestCase):
+    """services.send_document: documento, histórico e assinatura do remetente em uma única transação."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('universidade')
+
+    def send(self):
+        return send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+            self.user, '127.0.0.1', 'teste', title='Termo', num_students=2,
+        )
+
+    def test_send_document(self):
+        document = self.send()
+        self.assertEqual(document.page_count, 1)
+        self.assertEqual(document.original_file.name, blob_name(document.original_hash))
+        self.assertEqual(document.history.get().action, 'sent')
+        self.assertEqual(document.signatures.get().signer_type, 'university')
+        self.assertEqual(InstitutionDocumentStats.objects.get(institution=self.university).pending, 1)
+
+    def test_failure_rolls_back_everything(self):
+        with mock.patch('fluxo.services.sent_records', side_effect=RuntimeError('falha')):
+            with self.assertRaises(RuntimeError):
+                self.send()
+        self.assertFalse(InternshipDocument.objects.exists())
+        self.assertFalse(DocumentHistory.objects.exists())
+        self.assertFalse(InstitutionDocumentStats.objects.filter(institution=self.university, pending__gt=0).exists())
+
+
+@override_settings(FLUXO_SIGNING_QUEUE=False)
+class IdempotentSigningTests(FluxoTestCase):
+    """Requisições repetidas de assinatura (mesma chave de idempotência) carimbam o PDF uma única vez."""
+
+    def setUp(self):
+        super().setUp()
+        self.university_user = self.create_user('universidade')
+        self.health_school_user = self.create_user('escola', self.health_school)
+        self.document = send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+            self.university_user, '127.0.0.1', 'teste', title='Termo',
+        )
+        self.client.force_login(self.health_school_user)
+
+    def post(self, key):
+        return self.client.post(
+            reverse('health_school_sign_document', args=[self.document.id]),
+            {'signer_cpf': '000.000.000-00', 'signature_x': 100, 'signature_y': 100, 'idempotency_key': key},
+        )
+
+    def test_run_once_reuses_result(self):
+        func = mock.Mock(return_value='signed')
+        key = new_key()
+        self.assertEqual(run_once('teste', key, func), ('signed', True))
+        self.assertEqual(run_once('teste', key, func), ('signed', False))
+        func.assert_called_once()
+
+    def test_run_once_with_shared_database_cache(self):
+        # O backend do perfil de produção: `add` atômico, visível a todos os processos
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'fluxo_cache'}}
+        with override_settings(CACHES=shared):
+            call_command('createcachetable', stdout=StringIO())
+            scope = 'teste'
+            self.assertTrue(cache.add(in_flight_key(scope), new_key()))
+            with self.assertRaises(InFlightTimeout):
+                run_once(scope, new_key(), mock.Mock(), timeout=0)
+            cache.delete(in_flight_key(scope))
+
+            func = mock.Mock(return_value='queued')
+            key = new_key()
+            self.assertEqual(run_once(scope, key, func), ('queued', True))
+            self.assertEqual(run_once(scope, key, func), ('queued', False))
+            func.assert_called_once()
+
+    def test_repeated_post_signs_once(self):
+        key = new_key()
+        with mock.patch('fluxo.views.sign_document', wraps=sign_document) as sign:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post(key)
+                self.post(key)
+                self.post(new_key())
+        sign.assert_called_once()
+        self.assertEqual(
+            DigitalSignature.objects.filter(document=self.document, signer_type='health_school').count(), 1
+        )
+
+    def test_in_flight_request_is_not_repeated(self):
+        scope = f'sign:{self.document.pk}:{self.health_school_user.pk}:health_school'
+        cache.add(in_flight_key(scope), new_key())
+        with override_settings(FLUXO_SIGN_WAIT_TIMEOUT=0), mock.patch('fluxo.views.sign_document') as sign:
+            response = self.post(new_key())
+        sign.assert_not_called()
+        self.assertRedirects(response, reverse('health_school_view_document', args=[self.document.id]),
+                             fetch_redirect_response=False)
+
+    def test_unique_signer_per_document(self):
+        signature = self.document.signatures.get()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DigitalSignature.objects.create(
+                document=self.document, signer=signature.signer, signer_type=signature.signer_type,
+                signer_name='Duplicada', signer_cpf='000.000.000-00', signature_hash='0' * 64,
+                signature_data='{}', ip_address='127.0.0.1',
+            )
+
+
+class SigningQueueTests(FluxoTestCase):
+    """Fila de assinaturas: a view só registra a tarefa; o worker reivindica, carimba e grava."""
+
+    def setUp(self):
+        super().setUp()
+        self.university_user = self.create_user('universidade')
+        self.health_school_user = self.create_user('escola', self.health_school)
+        self.document = send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+            self.university_user, '127.0.0.1', 'teste', title='Termo',
+        )
+
+    def enqueue(self):
+        job, _ = enqueue_signing(self.document, self.health_school_user, '000.000.000-00', 100, 100, '127.0.0.1', 'teste')
+        return job
+
+    def health_school_signature(self):
+        return self.document.signatures.filter(signer_type='health_school').first()
+
+    def test_view_enqueues_and_worker_signs(self):
+        self.client.force_login(self.health_school_user)
+        status_url = reverse('health_school_signing_status', args=[self.document.id])
+        self.client.post(
+            reverse('health_school_sign_document', args=[self.document.id]),
+            {'signer_cpf': '000.000.000-00', 'signature_x': 100, 'signature_y': 100, 'idempotency_key': new_key()},
+        )
+        self.assertIsNone(self.health_school_signature())
+        self.assertEqual(self.client.get(status_url).json()['status'], 'queued')
+
+        run_jobs(claim_jobs(10))
+        job = SigningJob.objects.get(document=self.document)
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(job.signature, self.health_school_signature())
+        self.assertEqual(self.client.get(status_url).json()['status'], 'done')
+
+    def test_active_job_is_reused(self):
+        job = self.enqueue()
+        self.assertEqual(enqueue_signing(self.document, self.health_school_user, '000.000.000-00', 1, 1, '127.0.0.1', 'teste'),
+                         (job, False))
+        self.assertEqual(SigningJob.objects.count(), 1)
+
+    def test_concurrent_claim_has_single_winner(self):
+        job = self.enqueue()
+        values_list = QuerySet.values_list
+        rival = []
+
+        def read_candidates(queryset, *args, **kwargs):
+            candidates = list(values_list(queryset, *args, **kwargs))
+            if not rival:
+                # Outro worker reivindica a mesma tarefa entre a leitura e a troca de status
+                rival.append(None)
+                rival.extend(claim_jobs(1))
+            return candidates
+
+        with mock.patch.object(QuerySet, 'values_list', read_candidates):
+            claimed = claim_jobs(1)
+        self.assertEqual(claimed, [])
+        self.assertEqual(rival[1:], [job])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_failed_job_is_retried_until_max_attempts(self):
+        job = self.enqueue()
+        with mock.patch('fluxo.jobs.render_signed_pdf', side_effect=RuntimeError('PDF corrompido')):
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                run_jobs(claim_jobs(10))
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                self.assertEqual(job.status, 'failed' if attempt == MAX_ATTEMPTS else 'queued')
+        self.assertEqual(job.error, 'PDF corrompido')
+        self.assertEqual(claim_jobs(10), [])
+        self.assertIsNone(self.health_school_signature())
+
+    def test_preparation_error_fails_only_that_job(self):
+        job = self.enqueue()
+        other_user = self.create_user('outra', self.health_school)
+        other_job, _ = enqueue_signing(self.document, other_user, '111.111.111-11', 100, 100, '127.0.0.1', 'teste')
+
+        def prepare(job):
+            if job.pk == other_job.pk:
+                raise ValueError('Dados inválidos')
+            return build_signature(job.document, job.signer, job.signer_cpf, job.position_x, job.position_y,
+                                   job.ip_address, job.user_agent, signed_at=job.created_at)
+
+        with mock.patch('fluxo.jobs.prepare_job', side_effect=prepare):
+            run_jobs(claim_jobs(10))
+        job.refresh_from_db()
+        other_job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((other_job.status, other_job.error), ('queued', 'Dados inválidos'))
+
+    def test_stale_running_job_is_requeued(self):
+        job = self.enqueue()
+        claim_jobs(1)
+        self.assertEqual(requeue_stale_jobs(), (0, 0))
+
+        later = timezone.now() + STALE_AFTER + timedelta(minutes=1)
+        self.assertEqual(requeue_stale_jobs(now=later), (1, 0))
+        self.assertEqual(claim_jobs(1), [job])
+
+        SigningJob.objects.filter(pk=job.pk).update(attempts=MAX_ATTEMPTS)
+        self.assertEqual(requeue_stale_jobs(now=later), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_reprocessed_job_does_not_stamp_again(self):
+        job = self.enqueue()
+        run_jobs(claim_jobs(1))
+        signature = self.health_school_signature()
+
+        # Worker morreu depois do commit: a tarefa volta à fila e é reprocessada
+        SigningJob.objects.filter(pk=job.pk).update(status='queued')
+        with mock.patch('fluxo.jobs.render_signed_pdf') as render:
+            run_jobs(claim_jobs(1))
+        render.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.signature), ('done', signature))
+        self.assertEqual(self.document.signatures.filter(signer_type='health_school').count(), 1)
+
+
+class BulkSignTests(FluxoTestCase):
+    """Assinatura em lote: um resultado por documento, carimbos renderizados no pool de processos."""
+
+    def setUp(self):
+        super().setUp()
+        self.university_user = self.create_user('universidade')
+        self.health_school_user = self.create_user('escola', self.health_school)
+        self.documents = [
+            send_document(
+                self.university, self.health_school, SimpleUploadedFile(f'termo{i}.pdf', build_synthetic_pdf(i + 1)),
+                self.university_user, '127.0.0.1', 'teste', title=f'Termo {i}',
+            )
+            for i in range(3)
+        ]
+        # Threads no lugar de processos: o banco de testes fica em memória neste processo
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        patcher = mock.patch('fluxo.services.render_executor', return_value=executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.health_school_user)
+
+    def post(self, documents):
+        return self.client.post(reverse('health_school_bulk_sign'), {
+            'document_ids': [document.id for document in documents],
+            'signer_cpf': '000.000.000-00', 'signature_x': 100, 'signature_y': 100,
+        })
+
+    def test_signs_each_selected_document(self):
+        sign_document(self.documents[0], self.health_school_user, '000.000.000-00', 100, 100, '127.0.0.1', 'teste')
+
+        def render(document, *args):
+            if document.pk == self.documents[2].pk:
+                raise RuntimeError('PDF corrompido')
+            return render_signed_pdf(document, *args)
+
+        with mock.patch('fluxo.services.render_signed_pdf', side_effect=render), mock.patch('builtins.print'):
+            response = self.post(self.documents)
+        self.assertEqual(
+            {result['document'].pk: result['status'] for result in response.context['results']},
+            {self.documents[0].pk: 'failed', self.documents[1].pk: 'signed',
+             self.documents[2].pk: 'failed'},
+        )
+
+        signed = InternshipDocument.objects.get(pk=self.documents[1].pk)
+        self.assertEqual(signed.signatures.filter(signer_type='health_school').count(), 1)
+        with signed.signed_file.open('rb') as f:
+            self.assertIn('ASSINADO DIGITALMENTE (HEALTH_SCHOOL)', PdfReader(f).pages[0].extract_text())
+        self.assertFalse(self.documents[2].signatures.filter(signer_type='health_school').exists())
+
+        # Os já assinados saem da lista de pendentes
+        self.assertEqual(list(self.client.get(reverse('health_school_bulk_sign')).context['pending_documents']),
+                         [self.documents[2]])
+
+    def test_document_signed_by_colleague_is_not_stamped_again(self):
+        colleague = self.create_user('colega', self.health_school)
+        sign_document(self.documents[0], colleague, '111.111.111-11', 100, 100, '127.0.0.1', 'teste')
+        document = InternshipDocument.objects.get(pk=self.documents[0].pk)
+
+        response = self.post([document])
+        self.assertEqual([(result['document'], result['status']) for result in response.context['results']],
+                         [(document, 'failed')])
+        self.assertEqual(document.signatures.filter(signer_type='health_school').count(), 1)
+        refreshed = InternshipDocument.objects.get(pk=document.pk)
+        self.assertEqual((refreshed.status, refreshed.signed_file.name), (document.status, document.signed_file.name))
+
+    def test_document_deleted_while_rendering(self):
+        document = self.documents[0]
+        InternshipDocument.objects.filter(pk=document.pk).delete()
+        results = bulk_sign_documents(
+            [document], self.health_school_user, '000.000.000-00', 100, 100, '127.0.0.1', 'teste',
+        )
+        self.assertEqual([(result['status'], result['error']) for result in results],
+                         [('failed', 'O documento não existe mais.')])
+
+    def test_other_institution_documents_are_ignored(self):
+        other = Institution.objects.create(name='Outra Escola', type='health_school', cnpj='33.333.333/0001-33')
+        foreign = send_document(
+            self.university, other, SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+            self.university_user, '127.0.0.1', 'teste', title='Termo de outra escola',
+        )
+        response = self.post([foreign, self.documents[0]])
+        self.assertEqual([result['document'].pk for result in response.context['results']], [self.documents[0].pk])
+        self.assertFalse(foreign.signatures.filter(signer_type='health_school').exists())
+
+    def test_missing_fields_redirect(self):
+        response = self.client.post(reverse('health_school_bulk_sign'), {'signer_cpf': '000.000.000-00'})
+        self.assertRedirects(response, reverse('health_school_bulk_sign'), fetch_redirect_response=False)
+        self.assertFalse(DigitalSignature.objects.filter(signer_type='health_school').exists())
+
+
+class SHA256UploadHandlerTests(FluxoTestCase):
+    """O SHA-256 é calculado durante o upload, chunk a chunk, sem reler o arquivo."""
+
+    def test_hashes_each_file_in_order(self):
+        contents = [build_synthetic_pdf(1), build_synthetic_pdf(2)]
+        request = RequestFactory().post('/', {
+            'files': [SimpleUploadedFile(f'termo{i}.pdf', content) for i, content in enumerate(contents)],
+        })
+        request.upload_handlers.insert(0, SHA256UploadHandler(request))
+        # Chunks pequenos: o hash é atualizado várias vezes por arquivo
+        for handler in request.upload_handlers:
+            handler.chunk_size = 1024
+
+        uploaded = request.FILES.getlist('files')
+        self.assertEqual([f.read() for f in uploaded], contents)
+        expected = [hashlib.sha256(content).hexdigest() for content in contents]
+        self.assertEqual(request.upload_sha256['files'], expected)
+        self.assertEqual(uploaded_sha256(request, 'files', 1), expected[1])
+        self.assertIsNone(uploaded_sha256(request, 'files', 2))
+        self.assertIsNone(uploaded_sha256(request, 'file'))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_send_document_uses_upload_hash(self):
+        self.client.force_login(self.create_user('universidade', self.university))
+        content = build_synthetic_pdf(3)
+        with mock.patch('fluxo.services.content_digest') as content_digest:
+            self.client.post(reverse('university_send_document'), {
+                'title': 'Termo', 'description': 'Termo de estágio', 'health_school': self.health_school.id,
+                'file': SimpleUploadedFile('termo.pdf', content),
+            })
+        content_digest.assert_not_called()
+        document = InternshipDocument.objects.get()
+        self.assertEqual(document.original_hash, hashlib.sha256(content).hexdigest())
+        with document.original_file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_csrf_still_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.create_user('universidade', self.university))
+        response = client.post(reverse('university_send_document'), {
+            'title': 'Termo', 'health_school': self.health_school.id,
+            'file': SimpleUploadedFile('termo.pdf', build_synthetic_pdf(1)),
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(InternshipDocument.objects.exists())
+
+
+class ContentAddressedStorageTests(FluxoTestCase):
+    """Blobs por SHA-256: conteúdo repetido é gravado uma vez; o gc_blobs só remove órfãos antigos."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('universidade', self.university)
+
+    def send(self, content, title='Termo'):
+        return send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', content),
+            self.user, '127.0.0.1', 'teste', title=title,
+        )
+
+    def ref_count(self, name):
+        return StoredBlob.objects.get(name=name).ref_count
+
+    def age(self, name, days=2):
+        """Simula um blob sem uso há `days` dias (registro e mtime do arquivo)."""
+        past = timezone.now() - timedelta(days=days)
+        StoredBlob.objects.filter(name=name).update(updated_at=past)
+        os.utime(document_storage.path(name), (past.timestamp(), past.timestamp()))
+
+    def gc(self, *args):
+        output = StringIO()
+        call_command('gc_blobs', *args, stdout=output)
+        return output.getvalue()
+
+    def test_same_content_shares_blob(self):
+        content = build_synthetic_pdf(1)
+        first, second = self.send(content), self.send(content)
+        name = blob_name(hashlib.sha256(content).hexdigest())
+        self.assertEqual((first.original_file.name, second.original_file.name), (name, name))
+        self.assertEqual(self.ref_count(name), 2)
+        self.assertEqual(os.listdir(os.path.dirname(document_storage.path(name))), [os.path.basename(name)])
+
+        first.delete()
+        self.assertEqual(self.ref_count(name), 1)
+        second.delete()
+        self.assertEqual(self.ref_count(name), 0)
+        # O arquivo só sai com o gc_blobs
+        self.assertTrue(document_storage.exists(name))
+
+    def test_gc_respects_grace_period_and_references(self):
+        kept = self.send(build_synthetic_pdf(1))
+        released = self.send(build_synthetic_pdf(2))
+        kept_name, released_name = kept.original_file.name, released.original_file.name
+        released.delete()
+
+        # Sem referências, mas dentro do período de carência
+        self.gc()
+        self.assertTrue(document_storage.exists(released_name))
+
+        self.age(kept_name)
+        self.age(released_name)
+        self.assertIn('Seriam removidos 1 blob(s)', self.gc('--dry-run'))
+        self.assertTrue(document_storage.exists(released_name))
+
+        self.assertIn('Removidos 1 blob(s)', self.gc())
+        self.assertFalse(document_storage.exists(released_name))
+        self.assertFalse(StoredBlob.objects.filter(name=released_name).exists())
+        self.assertTrue(document_storage.exists(kept_name))
+        self.assertEqual(self.ref_count(kept_name), 1)
+
+    def test_gc_removes_old_untracked_files(self):
+        # Gravações interrompidas antes do commit: arquivo sem registro em StoredBlob
+        names = [document_storage.save('termo.pdf', ContentFile(build_synthetic_pdf(pages))) for pages in (1, 2)]
+        self.age(names[0])
+        self.gc()
+        self.assertFalse(document_storage.exists(names[0]))
+        self.assertTrue(document_storage.exists(names[1]))
+
+    def test_repair_recounts_references(self):
+        document = self.send(build_synthetic_pdf(1))
+        name = document.original_file.name
+        StoredBlob.objects.filter(name=name).update(ref_count=5)
+        self.assertIn(f'Referências de {name}: 5 -> 1', self.gc('--repair', '--dry-run'))
+        self.assertEqual(self.ref_count(name), 5)
+        self.gc('--repair')
+        self.assertEqual(self.ref_count(name), 1)
+
+        StoredBlob.objects.all().delete()
+        self.gc('--repair')
+        self.assertEqual(self.ref_count(name), 1)
+
+    def test_adopt_legacy_files(self):
+        document = self.send(build_synthetic_pdf(1))
+        content = build_synthetic_pdf(2)
+        legacy_name = 'documentos/2024/01/termo.pdf'
+        os.makedirs(os.path.dirname(document_storage.path(legacy_name)))
+        with open(document_storage.path(legacy_name), 'wb') as f:
+            f.write(content)
+        InternshipDocument.objects.filter(pk=document.pk).update(original_file=legacy_name)
+
+        self.gc('--adopt-legacy')
+        document.refresh_from_db()
+        name = blob_name(hashlib.sha256(content).hexdigest())
+        self.assertEqual(document.original_file.name, name)
+        self.assertEqual(self.ref_count(name), 1)
+        self.assertFalse(document_storage.exists(legacy_name))
+
+
+class DownloadTests(FluxoTestCase):
+    """Downloads: ETag pelo SHA-256, 304, um intervalo Range por requisição e If-Range."""
+
+    def setUp(self):
+        super().setUp()
+        user = self.create_user('universidade', self.university)
+        self.content = build_synthetic_pdf(3)
+        self.document = send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', self.content),
+            user, '127.0.0.1', 'teste', title='Termo',
+        )
+        self.url = reverse('download_original_document', args=[self.document.id])
+        self.etag = f'"{self.document.original_hash}"'
+        self.client.force_login(user)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+    def test_if_none_match(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"outro"').status_code, 200)
+
+    def test_single_range(self):
+        size = len(self.content)
+        for header, start, end in [('bytes=0-99', 0, 99), ('bytes=100-', 100, size - 1),
+                                   ('bytes=-50', size - 50, size - 1), ('bytes=10-999999', 10, size - 1)]:
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1], header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}', header)
+            self.assertEqual(response['Content-Length'], str(end - start + 1), header)
+
+    def test_unsatisfiable_range(self):
+        size = len(self.content)
+        for header in (f'bytes={size}-', 'bytes=-0', 'bytes=50-10'):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], f'bytes */{size}', header)
+
+    def test_invalid_or_multiple_ranges_are_ignored(self):
+        # Vários intervalos (sem multipart/byteranges): o arquivo inteiro é enviado
+        for header in ('bytes=-', 'items=0-9', 'bytes=a-b', 'bytes=0-9,-', 'bytes=0-9,20-29', 'bytes=0-9, -5'):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(b''.join(response.streaming_content), self.content, header)
+            self.assertNotIn('Content-Range', response, header)
+
+    def test_if_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+        # Versão antiga do arquivo: o intervalo é ignorado e o arquivo inteiro é enviado
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=f'"{"0" * 64}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    @override_settings(FLUXO_SENDFILE_BACKEND='nginx')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.original_file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], self.etag)
+
+
+class FirstPagePreviewTests(FluxoTestCase):
+    """A tela de assinatura carrega um PDF só com a primeira página, gerado uma vez por original."""
+
+    def setUp(self):
+        super().setUp()
+        self.university_user = self.create_user('universidade', self.university)
+        self.health_school_user = self.create_user('escola', self.health_school)
+        self.document = self.send(build_synthetic_pdf(20))
+        self.url = reverse('document_preview', args=[self.document.id])
+
+    def send(self, content):
+        return send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', content),
+            self.university_user, '127.0.0.1', 'teste', title='Termo',
+        )
+
+    def test_preview_has_only_first_page(self):
+        name = get_first_page_preview(self.document)
+        self.assertEqual(name, preview_name(self.document.original_hash))
+        with document_storage.open(name) as f:
+            reader = PdfReader(f)
+            self.assertEqual(len(reader.pages), 1)
+            self.assertIn('página 1, cláusula 1', reader.pages[0].extract_text())
+        self.assertLess(document_storage.size(name), self.document.original_file.size / 5)
+
+        # Gerada uma única vez por original
+        with mock.patch('fluxo.previews.build_first_page_pdf') as build:
+            self.assertEqual(get_first_page_preview(self.document), name)
+        build.assert_not_called()
+
+    def test_sign_page_loads_preview(self):
+        self.client.force_login(self.health_school_user)
+        response = self.client.get(reverse('health_school_sign_document', args=[self.document.id]))
+        self.assertContains(response, self.url)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.document.original_hash}-p1"')
+        self.assertEqual(len(PdfReader(BytesIO(b''.join(response.streaming_content))).pages), 1)
+
+    def test_other_institution_is_denied(self):
+        other = Institution.objects.create(name='Outra Escola', type='health_school', cnpj='33.333.333/0001-33')
+        self.client.force_login(self.create_user('outra', other))
+        self.assertRedirects(self.client.get(self.url), reverse('home'), fetch_redirect_response=False)
+
+    def test_unreadable_original_falls_back(self):
+        with mock.patch('builtins.print'):
+            document = self.send(b'%PDF-1.4 corrompido')
+            self.client.force_login(self.health_school_user)
+            response = self.client.get(reverse('document_preview', args=[document.id]))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 corrompido')
+        self.assertFalse(document_storage.exists(preview_name(document.original_hash)))
+
+    def test_gc_removes_orphan_previews(self):
+        name = get_first_page_preview(self.document)
+        past = (timezone.now() - timedelta(days=2)).timestamp()
+        os.utime(document_storage.path(name), (past, past))
+        call_command('gc_blobs', stdout=StringIO())
+        self.assertTrue(document_storage.exists(name))
+
+        self.document.delete()
+        call_command('gc_blobs', stdout=StringIO())
+        self.assertFalse(document_storage.exists(name))
+
+
+def build_rotated_pdf(rotate, cropbox=(10, 20, 605, 862), pages=2):
+    """PDF em branco com /Rotate e CropBox deslocada da origem em todas as páginas."""
+    writer = PdfWriter()
+    for _ in range(pages):
+        page = PageObject.create_blank_page(None, 620, 880)
+        page.cropbox = RectangleObject(cropbox)
+        page[NameObject('/Rotate')] = NumberObject(rotate)
+        writer.add_page(page)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class PageGeometryTests(FluxoTestCase):
+    """Geometria das páginas lida no upload e usada para posicionar o carimbo (CropBox e /Rotate)."""
+
+    def setUp(self):
+        super().setUp()
+        self.university_user = self.create_user('universidade', self.university)
+        self.health_school_user = self.create_user('escola', self.health_school)
+
+    def send(self, content):
+        return send_document(
+            self.university, self.health_school, SimpleUploadedFile('termo.pdf', content),
+            self.university_user, '127.0.0.1', 'teste', title='Termo',
+        )
+
+    def test_read_page_geometry(self):
+        self.assertEqual(read_page_geometry(BytesIO(build_rotated_pdf(90))), (2, [[10, 20, 595, 842, 90]] * 2))
+        self.assertEqual(read_page_geometry(BytesIO(build_rotated_pdf(-90)), max_pages=1), (2, [[10, 20, 595, 842, 270]]))
+        self.assertEqual(read_page_geometry(BytesIO(build_synthetic_pdf(1)))[1], [[0, 0, 595.28, 841.89, 0]])
+
+    def test_canvas_to_pdf(self):
+        geometry = [10, 20, 595, 842]
+        # Clique a 100pt da esquerda e 300pt do topo da página como exibida
+        left, top = 100, 300
+        expected = {
+            0: (10 + left, 20 + 842 - top),
+            90: (10 + top, 20 + left),
+            180: (10 + 595 - left, 20 + top),
+            270: (10 + 595 - top, 20 + 842 - left),
+        }
+        for rotate, point in expected.items():
+            shown_height = 595 if rotate in (90, 270) else 842
+            x, y, angle = canvas_to_pdf(geometry + [rotate], left * CANVAS_SCALE, (shown_height - top) * CANVAS_SCALE)
+            self.assertEqual((round(x, 2), round(y, 2), angle), point + (rotate,), rotate)
+
+    def test_canvas_to_pdf_keeps_stamp_inside_page(self):
+        geometry = [0, 0, 595, 842, 0]
+        # Cantos inferior direito e superior esquerdo: o carimbo é deslocado para caber na página
+        self.assertEqual(canvas_to_pdf(geometry, 595 * CANVAS_SCALE, 0), (595 - STAMP_WIDTH, 0, 0))
+        self.assertEqual(canvas_to_pdf(geometry, 0, 842 * CANVAS_SCALE), (0, 842 - STAMP_HEIGHT, 0))
+        for x, y in ((-1, 10), (10, -1), (596 * CANVAS_SCALE, 10), (10, 843 * CANVAS_SCALE)):
+            with self.assertRaises(ValueError):
+                canvas_to_pdf(geometry, x, y)
+
+    def test_geometry_indexed_at_upload(self):
+        document = self.send(build_rotated_pdf(90, pages=3))
+        document.refresh_from_db()
+        self.assertEqual(document.page_count, 3)
+        self.assertEqual(document.first_page_geometry(), [10, 20, 595, 842, 90])
+
+        # O índice dispensa a releitura do PDF ao assinar
+        self.client.force_login(self.health_school_user)
+        with mock.patch('fluxo.models.read_page_geometry') as read, mock.patch('fluxo.pdf.read_page_geometry') as read_pdf:
+            self.client.get(reverse('health_school_sign_document', args=[document.id]))
+            sign_document(document, self.health_school_user, '000.000.000-00', 15, 880, '127.0.0.1', 'teste')
+        read.assert_not_called()
+        read_pdf.assert_not_called()
+
+    def test_legacy_document_geometry_filled_once(self):
+        document = self.send(build_rotated_pdf(180))
+        InternshipDocument.objects.filter(pk=document.pk).update(page_count=None, page_geometry=[])
+        document.refresh_from_db()
+        self.assertEqual(document.first_page_geometry(), [0, 0, 595.28, 841.89, 0])
+
+        document.ensure_page_geometry()
+        document.refresh_from_db()
+        self.assertEqual((document.page_count, document.first_page_geometry()), (2, [10, 20, 595, 842, 180]))
+
+    @override_settings(FLUXO_SIGNING_MODE='incremental')
+    def test_stamp_follows_rotated_page(self):
+        document = self.send(build_rotated_pdf(90))
+        # Canto superior esquerdo da página exibida (deitada: 842 x 595)
+        sign_document(document, self.health_school_user, '000.000.000-00', 10 * CANVAS_SCALE,
+                      (595 - 10) * CANVAS_SCALE, '127.0.0.1', 'teste')
+        document.refresh_from_db()
+        with document.signed_file.open('rb') as f:
+            page = PdfReader(f).pages[0]
+            stamp = page['/Resources']['/XObject']['/FmSig'].get_object().get_data()
+        # Rotação de 90° e canto do carimbo junto ao canto inferior esquerdo da CropBox
+        self.assertIn(b'q 0 1 -1 0 ' + str(10 + STAMP_HEIGHT).encode() + b' 30 cm', stamp)
+
+
+@skipUnless(connection.vendor == 'sqlite', "PRAGMAs do SQLite")
+class SQLitePragmaTests(TestCase):
+    """PRAGMAs de FLUXO_SQLITE_PRAGMAS aplicados às novas conexões (connection_created)."""
+
+    def test_pragmas_applied_on_connection_created(self):
+        original = read_pragmas(connection, ['cache_size', 'busy_timeout'])
+        self.addCleanup(apply_pragmas, connection, original)
+        with override_settings(FLUXO_SQLITE_PRAGMAS={'cache_size': -8000, 'busy_timeout': 1234}):
+            connection_created.send(sender=connection.__class__, connection=connection)
+        self.assertEqual(read_pragmas(connection, ['cache_size', 'busy_timeout']), {'cache_size': -8000, 'busy_timeout': 1234})
+
+    def test_invalid_pragma(self):
+        with self.assertRaises(ValueError):
+            apply_pragmas(connection, {'cache_size': '1; DROP TABLE fluxo_institution'})
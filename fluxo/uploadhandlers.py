@@ -0,0 +1,43 @@
+"""
+Upload handlers do fluxo de documentos.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class SHA256UploadHandler(FileUploadHandler):
+    """
+    Calcula o SHA-256 de cada arquivo enviado à medida que os chunks chegam.
+
+    Deve ser inserido no início de `request.upload_handlers`: ele não guarda o
+    arquivo, apenas atualiza o hash e repassa cada chunk aos handlers seguintes
+    (memória ou arquivo temporário). Os hashes ficam em
+    `request.upload_sha256[nome_do_campo]`, na ordem dos arquivos enviados.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.sha256 = None
+        if request is not None:
+            request.upload_sha256 = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.request is not None:
+            self.request.upload_sha256.setdefault(self.field_name, []).append(self.sha256.hexdigest())
+        # O arquivo em si é montado pelos handlers seguintes
+        return None
+
+
+def uploaded_sha256(request, field_name, index=0):
+    """Retorna o SHA-256 calculado no upload do arquivo `field_name` (ou None)."""
+    digests = getattr(request, 'upload_sha256', {}).get(field_name, [])
+    return digests[index] if index < len(digests) else None
@@ -6,14 +6,24 @@ urlpatterns = [
     # Universidade
     path('university/', views.university_dashboard, name='university_dashboard'),
     path('university/send/', views.university_send_document, name='university_send_document'),
+    path('university/send/bulk/', views.university_bulk_send, name='university_bulk_send'),
     path('university/document/<int:document_id>/', views.university_view_document, name='university_view_document'),
     
     # Escola de Saúde
     path('health-school/', views.health_school_dashboard, name='health_school_dashboard'),
+    path('health-school/counts/', views.health_school_dashboard_counts, name='health_school_dashboard_counts'),
+    path('health-school/bulk-sign/', views.health_school_bulk_sign, name='health_school_bulk_sign'),
     path('health-school/document/<int:document_id>/', views.health_school_view_document, name='health_school_view_document'),
     path('health-school/document/<int:document_id>/sign/', views.health_school_sign_document, name='health_school_sign_document'),
+    path('health-school/document/<int:document_id>/sign/status/', views.health_school_signing_status, name='health_school_signing_status'),
     
     # Downloads
     path('document/<int:document_id>/download/original/', views.download_original_document, name='download_original_document'),
     path('document/<int:document_id>/download/signed/', views.download_signed_document, name='download_signed_document'),
+    path('document/<int:document_id>/preview/', views.document_preview, name='document_preview'),
+    path('documents/export/', views.export_documents, name='export_documents'),
+    
+    # Verificação pública (QR Code do carimbo)
+    path('verify/', views.verify_signature, name='verify_signature'),
+    path('verify/<str:signature_hash>/', views.verify_signature, name='verify_signature_hash'),
 ]
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Verificação pública das assinaturas a partir do QR Code do carimbo.
+
+O QR Code contém `HASH:<hash da assinatura>|DOC:<hash do original>|ID:<documento>`.
+A verificação busca a DigitalSignature pelo `signature_hash` (indexado),
+recalcula `generate_signature_hash()` e confere o hash e o ID do documento,
+sem abrir nenhum PDF. O veredito traz também o `signed_hash` do documento,
+para conferir o PDF assinado que o verificador tem em mãos. Os dados ficam
+no cache do Django por hash; o cache é invalidado pelos sinais de
+DigitalSignature e de troca dos arquivos do documento (ver fluxo.signals)
+e pelas gravações em lote.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DigitalSignature
+
+# Segundos que um hash inexistente fica no cache
+NOT_FOUND_TIMEOUT = 60
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def cache_timeout():
+    """Segundos que o resultado de um hash encontrado fica no cache."""
+    return getattr(settings, 'FLUXO_VERIFY_CACHE_TIMEOUT', 3600)
+
+
+def cache_key(signature_hash):
+    return f'fluxo:verify:{signature_hash}'
+
+
+def parse_qr_payload(payload):
+    """
+    Interpreta o conteúdo do QR Code. Retorna um dict com 'hash', 'doc' e
+    'id' (os ausentes ficam None).
+    """
+    fields = {'hash': None, 'doc': None, 'id': None}
+    for part in (payload or '').split('|'):
+        key, _, value = part.partition(':')
+        key = key.strip().lower()
+        if key in fields and value.strip():
+            fields[key] = value.strip()
+    return fields
+
+
+def is_valid_hash(value):
+    return bool(_HASH_RE.match(value or ''))
+
+
+def _signature_records(signature_hash):
+    """Dados (já recalculados) das assinaturas com esse hash; uma consulta, sem PDFs."""
+    signatures = DigitalSignature.objects.filter(signature_hash=signature_hash).select_related('document').only(
+        'signature_hash', 'signature_data', 'signer_type', 'signer_name', 'signer_email', 'signer_cpf',
+        'signed_at', 'document_id', 'document__original_hash', 'document__signed_hash',
+    )
+    return [
+        {
+            'document_id': signature.document_id,
+            'document_hash': signature.document.original_hash,
+            'signed_hash': signature.document.signed_hash,
+            'signer_name': signature.signer_name,
+            'signer_type': signature.signer_type,
+            'signed_at': signature.signed_at.isoformat(),
+            'intact': signature.generate_signature_hash() == signature.signature_hash,
+        }
+        for signature in signatures
+    ]
+
+
+def get_signature_records(signature_hash):
+    """`_signature_records` com cache por hash."""
+    key = cache_key(signature_hash)
+    records = cache.get(key)
+    if records is None:
+        records = _signature_records(signature_hash)
+        cache.set(key, records, cache_timeout() if records else NOT_FOUND_TIMEOUT)
+    return records
+
+
+def verify(signature_hash, document_hash=None, document_id=None):
+    """
+    Veredito compacto para o hash da assinatura (e, se informados, o hash do
+    original e o ID do documento lidos do QR Code).
+    """
+    if not is_valid_hash(signature_hash):
+        return {'valid': False, 'error': 'invalid_hash'}
+
+    records = get_signature_records(signature_hash)
+    if document_id is not None:
+        records = [record for record in records if str(record['document_id']) == str(document_id)]
+    if not records:
+        return {'valid': False, 'error': 'not_found'}
+
+    record = records[0]
+    document_match = document_hash is None or document_hash == record['document_hash']
+    return {
+        'valid': record['intact'] and document_match,
+        'signature_intact': record['intact'],
+        'document_match': document_match,
+        'document_id': record['document_id'],
+        'document_hash': record['document_hash'],
+        'signed_hash': record['signed_hash'],
+        'signer_name': record['signer_name'],
+        'signer_type': record['signer_type'],
+        'signed_at': record['signed_at'],
+    }
+
+
+def invalidate_verification(signature_hashes):
+    """Remove do cache os resultados dos hashes informados."""
+    cache.delete_many([cache_key(signature_hash) for signature_hash in set(signature_hashes) if signature_hash])
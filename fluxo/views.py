@@ -1,24 +1,30 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, FileResponse
-from django.utils import timezone
+from django.http import HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.core.files.base import ContentFile
-
-from .models import Institution, InternshipDocument, DigitalSignature, DocumentHistory
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET
+
+from .models import Institution, InstitutionDocumentStats, InternshipDocument, DigitalSignature, DocumentHistory
+from .bulk_send import BulkSendError, iter_uploaded_files, iter_zip_entries, parse_manifest, send_documents
+from .downloads import serve_file
+from .exports import export_filename, export_queryset, iter_export_zip
+from .idempotency import InFlightTimeout, clean_key, new_key, run_once
+from .jobs import enqueue_signing, latest_job_for
+from .membership import institutions_for
+from .pagination import keyset_page, phased_keyset_page
+from .pdf import CANVAS_SCALE, canvas_to_pdf
+from .previews import get_first_page_preview
+from .services import bulk_sign_documents, send_document, sign_document
+from .uploadhandlers import SHA256UploadHandler, uploaded_sha256
+from .verification import parse_qr_payload, verify
 import hashlib
 import json
 import os 
 
-# --- IMPORTS PARA MANIPULAÇÃO DE PDF E QR CODE ---
-import io
-import qrcode
-from PIL import Image
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-# Nota: ReportLab usa pontos (pt). A4 = (595.2755905511812, 841.8897637795277)
-from PyPDF2 import PdfReader, PdfWriter, Transformation
-
 # --- UTILITIES ---
 # ... (get_client_ip, university_required, health_school_required, e dashboards)
 # Funções inalteradas
@@ -35,8 +41,7 @@ def get_client_ip(request):
 def university_required(function):
     """Decorator para exigir que o usuário seja administrador de uma Universidade."""
     def wrapper(request, *args, **kwargs):
-        if request.user.is_authenticated and \
-           Institution.objects.filter(admin_users=request.user, type='university').exists():
+        if institutions_for(request).university is not None:
             return function(request, *args, **kwargs)
         messages.error(request, "Acesso não autorizado para a Universidade.")
         return redirect('home')
@@ -45,8 +50,7 @@ def university_required(function):
 def health_school_required(function):
     """Decorator para exigir que o usuário seja administrador de uma Escola de Saúde."""
     def wrapper(request, *args, **kwargs):
-        if request.user.is_authenticated and \
-           Institution.objects.filter(admin_users=request.user, type='health_school').exists():
+        if institutions_for(request).health_school is not None:
             return function(request, *args, **kwargs)
         messages.error(request, "Acesso não autorizado para a Escola de Saúde.")
         return redirect('home')
@@ -58,28 +62,42 @@ def health_school_required(function):
 @university_required
 def university_dashboard(request):
     """Dashboard principal da Universidade (usa university/dashboard.html)."""
-    university = get_object_or_404(Institution, admin_users=request.user, type='university')
+    university = request.institutions.university
     
-    documents = InternshipDocument.objects.filter(university=university).order_by('-created_at')
+    university_documents = InternshipDocument.objects.filter(university=university)
     
-    status_counts = {
-        'pending': documents.filter(status='pending_health_school').count(),
-        'signed': documents.filter(status='signed_health_school').count(),
-        'completed': documents.filter(status='completed').count(),
-        'total': documents.count(),
-    }
+    # Contadores desnormalizados: uma leitura por chave, sem varrer os documentos
+    status_counts = InstitutionDocumentStats.counts_for(university)
+    
+    # Apenas as colunas exibidas, com a escola de saúde no mesmo JOIN
+    documents, next_cursor = keyset_page(
+        university_documents.select_related('health_school').only(
+            'id', 'title', 'description', 'status', 'created_at', 'signed_file', 'health_school__name'
+        ),
+        cursor=request.GET.get('cursor')
+    )
     
     return render(request, 'university/dashboard.html', {
         'university': university,
         'documents': documents,
-        'status_counts': status_counts
+        'status_counts': status_counts,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     })
 
+@csrf_exempt
 @login_required
 @university_required
 def university_send_document(request):
     """View para criar e enviar um novo documento de estágio."""
-    university = get_object_or_404(Institution, admin_users=request.user, type='university')
+    # O handler precisa ser instalado antes de o corpo da requisição ser lido,
+    # por isso a verificação de CSRF fica na view interna.
+    request.upload_handlers.insert(0, SHA256UploadHandler(request))
+    return _university_send_document(request)
+
+@csrf_protect
+def _university_send_document(request):
+    university = request.institutions.university
     health_schools = Institution.objects.filter(type='health_school')
     
     # Placeholder
@@ -94,39 +112,19 @@ def university_send_document(request):
         
         health_school = get_object_or_404(Institution, id=health_school_id, type='health_school')
         
-        # Criação do Documento
-        document = InternshipDocument.objects.create(
+        # Documento, histórico, assinatura do remetente e contadores da
+        # instituição são gravados em uma única transação (services.send_document)
+        document = send_document(
+            university,
+            health_school,
+            file,
+            request.user,
+            get_client_ip(request),
+            request.META.get('HTTP_USER_AGENT', ''),
             title=title,
             description=description,
-            university=university,
-            health_school=health_school,
-            original_file=file,
-            created_by=request.user,
-            status='pending_health_school', 
             num_students=num_students,
-            student_info=json.dumps({'num_students': num_students})
-        )
-        
-        # Adicionar o histórico de criação
-        DocumentHistory.objects.create(
-            document=document,
-            action='sent',
-            performed_by=request.user,
-            notes='Documento enviado para assinatura da Escola de Saúde'
-        )
-        
-        # Cria a DigitalSignature para o remetente (Universidade)
-        DigitalSignature.objects.create(
-            document=document,
-            signer=request.user,
-            signer_type='university',
-            signature_data=json.dumps({'notes': 'Enviado/Assinado pela Universidade'}),
-            signature_hash=document.original_hash[:64] if document.original_hash else 'NOHASH',
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            signer_name=request.user.get_full_name() or request.user.username,
-            signer_email=request.user.email,
-            signer_cpf='000.000.000-00'
+            original_hash=uploaded_sha256(request, 'file'),
         )
 
         messages.success(request, f'Documento "{document.title}" enviado com sucesso.')
@@ -138,11 +136,62 @@ def university_send_document(request):
         'students': students
     })
 
+@csrf_exempt
+@login_required
+@university_required
+def university_bulk_send(request):
+    """Envio em lote: manifesto CSV com um ZIP ou vários PDFs (usa university/bulk_send.html)."""
+    # Como no envio individual, o handler de hash entra antes da leitura do corpo
+    request.upload_handlers.insert(0, SHA256UploadHandler(request))
+    return _university_bulk_send(request)
+
+@csrf_protect
+def _university_bulk_send(request):
+    university = request.institutions.university
+    health_schools = Institution.objects.filter(type='health_school').only('id', 'name', 'cnpj')
+    
+    results = None
+    if request.method == 'POST':
+        manifest = request.FILES.get('manifest')
+        archive = request.FILES.get('archive')
+        files = request.FILES.getlist('files')
+        
+        if not manifest or not (archive or files):
+            messages.error(request, "Envie o manifesto CSV e um arquivo ZIP ou os PDFs dos documentos.")
+            return redirect('university_bulk_send')
+        
+        try:
+            rows = parse_manifest(manifest)
+            if archive:
+                entries = iter_zip_entries(archive)
+            else:
+                entries = iter_uploaded_files(files, getattr(request, 'upload_sha256', {}).get('files', []))
+            results = send_documents(
+                rows,
+                entries,
+                university,
+                request.user,
+                get_client_ip(request),
+                request.META.get('HTTP_USER_AGENT', '')
+            )
+        except BulkSendError as e:
+            messages.error(request, str(e))
+            return redirect('university_bulk_send')
+        
+        sent = sum(1 for result in results if result['status'] == 'sent')
+        messages.success(request, f'{sent} de {len(results)} documento(s) enviado(s) com sucesso.')
+    
+    return render(request, 'university/bulk_send.html', {
+        'university': university,
+        'health_schools': health_schools,
+        'results': results,
+    })
+
 @login_required
 @university_required
 def university_view_document(request, document_id):
     """Detalhes de um documento na visão da Universidade (usa university/view_document.html)."""
-    university = get_object_or_404(Institution, admin_users=request.user, type='university')
+    university = request.institutions.university
     document = get_object_or_404(InternshipDocument, id=document_id, university=university)
     
     signatures = document.signatures.all() 
@@ -160,15 +209,54 @@ def university_view_document(request, document_id):
 @login_required
 @health_school_required
 def health_school_dashboard(request):
-    """Dashboard principal da Escola de Saúde."""
-    messages.info(request, "Dashboard da Escola de Saúde não possui template no escopo.")
-    return redirect('home')
+    """Caixa de entrada da Escola de Saúde: pendentes primeiro (usa health_school/dashboard.html)."""
+    health_school = request.institutions.health_school
+    
+    documents = InternshipDocument.objects.filter(health_school=health_school)
+    university_id = request.GET.get('university', '')
+    status = request.GET.get('status', '')
+    if university_id.isdigit():
+        documents = documents.filter(university_id=int(university_id))
+    if status not in dict(InternshipDocument.STATUS_CHOICES):
+        status = ''
+    
+    # Apenas as colunas exibidas, com a universidade no mesmo JOIN
+    documents = documents.select_related('university').only(
+        'id', 'title', 'description', 'status', 'created_at', 'signed_file', 'university__name'
+    )
+    if status:
+        phases = [documents.filter(status=status)]
+    else:
+        # Aguardando assinatura primeiro; cada fase usa o índice (health_school, status, created_at)
+        phases = [
+            documents.filter(status='pending_health_school'),
+            documents.exclude(status='pending_health_school'),
+        ]
+    page, next_cursor = phased_keyset_page(phases, cursor=request.GET.get('cursor'))
+    
+    return render(request, 'health_school/dashboard.html', {
+        'health_school': health_school,
+        'documents': page,
+        'status_counts': InstitutionDocumentStats.counts_for(health_school),
+        'universities': Institution.objects.filter(type='university').only('id', 'name').order_by('name'),
+        'status_choices': InternshipDocument.STATUS_CHOICES,
+        'selected_university': university_id,
+        'selected_status': status,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
+
+@login_required
+@health_school_required
+def health_school_dashboard_counts(request):
+    """Contadores (JSON) da caixa de entrada, consultados periodicamente pelo dashboard."""
+    return JsonResponse(InstitutionDocumentStats.counts_for(request.institutions.health_school))
 
 @login_required
 @health_school_required
 def health_school_view_document(request, document_id):
     """Detalhes de um documento na visão da Escola de Saúde (usa health_school/view_document.html)."""
-    health_school = get_object_or_404(Institution, admin_users=request.user, type='health_school')
+    health_school = request.institutions.health_school
     document = get_object_or_404(InternshipDocument, id=document_id, health_school=health_school)
     
     signatures = document.signatures.all() 
@@ -179,145 +267,34 @@ def health_school_view_document(request, document_id):
         'health_school': health_school,
         'signatures': signatures,
         'history': history,
+        'signing_job': latest_job_for(document, request.user),
     })
 
-# --- MÓDULO DE MANIPULAÇÃO DE PDF ---
-
-def create_signature_stamp_pdf(signature_info, position_x, position_y, signature_hash):
-    """Cria um PDF de uma página com o carimbo da assinatura e QR Code."""
-    buffer = io.BytesIO()
-    
-    # Tamanho da página (usando A4)
-    p_width, p_height = A4 
-    
-    # Cria o objeto ReportLab Canvas
-    c = canvas.Canvas(buffer, pagesize=A4)
-
-    # --- Configurações de Posição ---
-    # Convertendo as coordenadas de pixel (canvas) para pontos (pt)
-    # Assumimos uma proporção aproximada do A4 (largura de 595.275 pt)
-    # E que a coordenada Y já está invertida (origem inferior esquerda)
-    
-    # Fator de escala SIMPLIFICADO para conversão de pixel para ponto
-    # Nota: Em um sistema real, o fator de escala deve ser calculado dinamicamente
-    # baseado nas dimensões reais do PDF e da tela do cliente.
-    # Usaremos um fator arbitrário de 0.7 para que o carimbo não seja muito grande.
-    SCALE_FACTOR = 0.7 
-    
-    # Posição X e Y (em pontos)
-    # Usamos position_x (pixel) * SCALE_FACTOR
-    # Usamos position_y (pixel) * SCALE_FACTOR
-    x_pt = float(position_x) * SCALE_FACTOR
-    y_pt = float(position_y) * SCALE_FACTOR
-    
-    # Garante que o carimbo fique dentro dos limites da página
-    x_pt = min(x_pt, p_width - 200) 
-    y_pt = max(y_pt, 50) 
-    
-    # --- 1. Carimbo de Texto da Assinatura ---
-    c.setFont("Helvetica-Bold", 8)
-    
-    # Texto do carimbo
-    text = c.beginText(x_pt + 60, y_pt + 40)
-    text.setFont("Helvetica-Bold", 8)
-    text.setFillColorRGB(0.1, 0.1, 0.1)
-    
-    text.textLine(f"ASSINADO DIGITALMENTE ({signature_info['signer_type'].upper()})")
-    text.setFont("Helvetica", 7)
-    text.textLine(f"Nome: {signature_info['signer_name']}")
-    text.textLine(f"CPF: {signature_info['signer_cpf']}")
-    text.textLine(f"Data: {signature_info['signing_timestamp'][:19].replace('T', ' ')} (UTC)")
-    text.textLine(f"Hash: {signature_hash[:25]}...")
-    text.textLine(f"Doc Hash: {signature_info['document_hash'][:25]}...")
-    
-    c.drawText(text)
-    
-    # Borda do carimbo
-    c.rect(x_pt, y_pt, 220, 50, stroke=1, fill=0)
-
-    # --- 2. QR Code ---
-    try:
-        qr_data = f"HASH:{signature_hash}|DOC:{signature_info['document_hash']}|ID:{signature_info['document_id']}"
-        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=3, border=1)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img_qr = qr.make_image(fill_color="black", back_color="white")
-        
-        # Salva o QR Code em um buffer para o ReportLab
-        qr_buffer = io.BytesIO()
-        img_qr.save(qr_buffer, format="PNG")
-        qr_buffer.seek(0)
-        
-        # Desenha o QR Code ao lado do texto
-        c.drawImage(ImageReader(qr_buffer), x_pt + 5, y_pt + 5, width=40, height=40)
-        
-    except Exception as e:
-        # Em caso de falha no QR Code, apenas registra o erro e prossegue
-        print(f"Erro ao gerar QR Code: {e}")
-        
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-def apply_signature_to_pdf(document, signature_info, signature_hash, position_x, position_y):
-    """
-    Mescla o PDF do carimbo (overlay) com a primeira página do PDF original.
-    Retorna o conteúdo binário do PDF assinado.
-    """
-    try:
-        # 1. Cria o carimbo PDF
-        stamp_pdf_buffer = create_signature_stamp_pdf(signature_info, position_x, position_y, signature_hash)
-        stamp_reader = PdfReader(stamp_pdf_buffer)
-        stamp_page = stamp_reader.pages[0]
-        
-        # 2. Carrega o PDF original
-        document.original_file.seek(0)
-        original_reader = PdfReader(document.original_file)
-        writer = PdfWriter()
-        
-        # 3. Mescla o carimbo na primeira página
-        if original_reader.pages:
-            first_page = original_reader.pages[0]
-            
-            # Use a largura e altura da página original para alinhamento se necessário
-            # Aqui, apenas adicionamos o carimbo como overlay
-            first_page.merge_page(stamp_page)
-            writer.add_page(first_page)
-            
-            # Adiciona as páginas restantes
-            for page_num in range(1, len(original_reader.pages)):
-                writer.add_page(original_reader.pages[page_num])
-
-        # 4. Salva o novo PDF mesclado em um buffer
-        output_buffer = io.BytesIO()
-        writer.write(output_buffer)
-        output_buffer.seek(0)
-        
-        return output_buffer.read()
-        
-    except Exception as e:
-        print(f"Erro no apply_signature_to_pdf: {e}")
-        return None
-
-
 # --- ATUALIZAÇÃO DA VIEW health_school_sign_document ---
 
 @login_required
 @health_school_required
 def health_school_sign_document(request, document_id):
     """Exibe o formulário de assinatura e processa o POST (usa health_school/sign_document.html)."""
-    health_school = get_object_or_404(Institution, admin_users=request.user, type='health_school')
+    health_school = request.institutions.health_school
     document = get_object_or_404(InternshipDocument, id=document_id, health_school=health_school)
 
-    if DigitalSignature.objects.filter(
-        document=document, 
-        signer=request.user, 
-        signer_type='health_school'
-    ).exists():
+    def already_signed():
+        return DigitalSignature.objects.filter(
+            document=document,
+            signer=request.user,
+            signer_type='health_school'
+        ).exists()
+
+    # No POST, a conferência é feita em run_once: uma requisição repetida
+    # recebe o mesmo resultado da primeira
+    if request.method != 'POST' and already_signed():
         messages.info(request, "Este documento já foi assinado por você.")
         return redirect('health_school_view_document', document_id=document.id)
 
+    # Documentos antigos: a geometria é lida do PDF uma única vez e gravada
+    document.ensure_page_geometry()
+
     if request.method == 'POST':
         signer_cpf = request.POST.get('signer_cpf')
         
@@ -328,83 +305,151 @@ def health_school_sign_document(request, document_id):
         if not signer_cpf or not signature_x or not signature_y:
             messages.error(request, "O CPF e a posição de assinatura são obrigatórios.")
             return redirect('health_school_sign_document', document_id=document.id)
-            
-        # 1. Cria a DigitalSignature (temporariamente para obter o hash de auditoria)
-        # O Hash da Assinatura depende de todos os dados, incluindo a hora exata.
-        temp_signature = DigitalSignature(
-            document=document,
-            signer=request.user,
-            signer_type='health_school',
-            # Usar data e hora exata AGORA para o hash
-            signed_at=timezone.now(), 
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            signer_name=request.user.get_full_name() or request.user.username,
-            signer_email=request.user.email,
-            signer_cpf=signer_cpf
-        )
 
-        # Prepara dados completos para o carimbo e o registro final
-        signature_info = {
-            'document_id': document.id,
-            'signer_name': temp_signature.signer_name,
-            'signer_email': temp_signature.signer_email,
-            'signer_cpf': temp_signature.signer_cpf,
-            'signer_type': 'health_school',
-            'signing_timestamp': temp_signature.signed_at.isoformat(),
-            'document_hash': document.original_hash,
-            'position_x': signature_x,
-            'position_y': signature_y
-        }
-        
-        # Garante que o campo signature_data (que alimenta o hash) esteja preenchido
-        temp_signature.signature_data = json.dumps(signature_info)
-        
-        # Gera o Hash da Assinatura
-        signature_hash = temp_signature.generate_signature_hash() #
-        
-        # --- NOVO: APLICAÇÃO DO CARIMBO AO PDF ---
-        signed_pdf_content = apply_signature_to_pdf(
-            document, 
-            signature_info, 
-            signature_hash, 
-            signature_x, 
-            signature_y
-        )
-
-        if signed_pdf_content is None:
-             messages.error(request, "Falha ao gerar o documento assinado digitalmente. Verifique as dependências PDF.")
-             return redirect('health_school_sign_document', document_id=document.id)
+        try:
+            canvas_to_pdf(document.first_page_geometry(), float(signature_x), float(signature_y))
+        except ValueError:
+            messages.error(request, "Posição de assinatura inválida.")
+            return redirect('health_school_sign_document', document_id=document.id)
 
-        # 2. Atualiza e salva a DigitalSignature
-        temp_signature.signature_hash = signature_hash
-        temp_signature.signature_data = json.dumps(signature_info) # Salva a posição
-        temp_signature.save() # Salva o registro no banco
-        
-        # 3. Salva o novo arquivo PDF assinado no modelo InternshipDocument
-        document.signed_file.save(
-            name=f'signed_{document.id}_{temp_signature.signer_name.replace(" ", "_")}.pdf',
-            content=ContentFile(signed_pdf_content)
-        )
-        document.status = 'signed_health_school' #
-        document.save()
-        
-        # 4. Adiciona o histórico
-        DocumentHistory.objects.create(
-            document=document,
-            action='signed',
-            performed_by=request.user,
-            notes=f'Documento assinado digitalmente na posição X:{signature_x}, Y:{signature_y}'
-        )
-        
-        messages.success(request, f'Documento "{document.title}" assinado com sucesso! Enviado de volta para a universidade.')
+        def sign():
+            if already_signed():
+                return 'already_signed'
+            if getattr(settings, 'FLUXO_SIGNING_QUEUE', True):
+                # Registra a tarefa e retorna imediatamente; o worker faz o carimbo
+                _, created = enqueue_signing(
+                    document,
+                    request.user,
+                    signer_cpf,
+                    float(signature_x),
+                    float(signature_y),
+                    get_client_ip(request),
+                    request.META.get('HTTP_USER_AGENT', '')
+                )
+                return 'queued' if created else 'already_queued'
+            result = sign_document(
+                document,
+                request.user,
+                signer_cpf,
+                signature_x,
+                signature_y,
+                get_client_ip(request),
+                request.META.get('HTTP_USER_AGENT', '')
+            )
+            if result is None:
+                return 'failed'
+            return 'signed' if result[1] else 'already_signed'
+
+        # Duplo clique ou retry: a requisição repetida espera a primeira em vez de carimbar de novo
+        try:
+            outcome, _ = run_once(
+                f'sign:{document.pk}:{request.user.pk}:health_school',
+                clean_key(request.POST.get('idempotency_key')),
+                sign,
+            )
+        except InFlightTimeout:
+            outcome = 'already_queued'
+
+        if outcome == 'failed':
+            messages.error(request, "Falha ao gerar o documento assinado digitalmente. Verifique as dependências PDF.")
+            return redirect('health_school_sign_document', document_id=document.id)
+        if outcome == 'signed':
+            messages.success(request, f'Documento "{document.title}" assinado com sucesso! Enviado de volta para a universidade.')
+        elif outcome == 'queued':
+            messages.info(request, f'Assinatura do documento "{document.title}" em processamento.')
+        elif outcome == 'already_queued':
+            messages.info(request, "Já existe uma assinatura deste documento em processamento.")
+        else:
+            messages.info(request, "Este documento já foi assinado por você.")
         return redirect('health_school_view_document', document_id=document.id)
     
     # GET request
     return render(request, 'health_school/sign_document.html', {
         'document': document,
         'health_school': health_school,
-        'user': request.user
+        'user': request.user,
+        'idempotency_key': new_key(),
+        'page_layout': {
+            'scale': CANVAS_SCALE,
+            'page_count': document.page_count,
+            'first_page': document.first_page_geometry(),
+        },
+    })
+
+@login_required
+@health_school_required
+def health_school_signing_status(request, document_id):
+    """Status (JSON) da última tarefa de assinatura do usuário, consultado pela página do documento."""
+    health_school = request.institutions.health_school
+    document = get_object_or_404(InternshipDocument, id=document_id, health_school=health_school)
+
+    job = latest_job_for(document, request.user)
+    if job is None:
+        return JsonResponse({'status': None})
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'error': job.error,
+        'document_status': document.status,
+    })
+
+@login_required
+@health_school_required
+def health_school_bulk_sign(request):
+    """Assina vários documentos de uma vez com o mesmo CPF e posição (usa health_school/bulk_sign.html)."""
+    health_school = request.institutions.health_school
+    pending_documents = InternshipDocument.objects.filter(
+        health_school=health_school,
+        status='pending_health_school'
+    ).exclude(
+        signatures__signer=request.user,
+        signatures__signer_type='health_school'
+    ).select_related('university')
+
+    results = None
+    if request.method == 'POST':
+        document_ids = request.POST.getlist('document_ids')
+        signer_cpf = request.POST.get('signer_cpf')
+        signature_x = request.POST.get('signature_x')
+        signature_y = request.POST.get('signature_y')
+
+        if not document_ids or not signer_cpf or not signature_x or not signature_y:
+            messages.error(request, "Selecione os documentos e informe o CPF e a posição de assinatura.")
+            return redirect('health_school_bulk_sign')
+
+        try:
+            float(signature_x), float(signature_y)
+        except ValueError:
+            messages.error(request, "Posição de assinatura inválida.")
+            return redirect('health_school_bulk_sign')
+
+        requested = InternshipDocument.objects.filter(
+            id__in=[int(document_id) for document_id in document_ids if document_id.isdigit()],
+            health_school=health_school
+        )
+        # Como na lista de pendentes: documentos já assinados (ex.: por outro
+        # usuário da escola) ou rejeitados não são carimbados de novo
+        documents = list(requested.filter(status='pending_health_school'))
+        excluded = [
+            {'document': document, 'status': 'failed', 'error': "O documento não está aguardando assinatura."}
+            for document in requested.exclude(status='pending_health_school')
+        ]
+        results = excluded + bulk_sign_documents(
+            documents,
+            request.user,
+            signer_cpf,
+            signature_x,
+            signature_y,
+            get_client_ip(request),
+            request.META.get('HTTP_USER_AGENT', '')
+        )
+        signed = sum(1 for result in results if result['status'] == 'signed')
+        messages.success(request, f'{signed} de {len(results)} documento(s) assinado(s) com sucesso.')
+
+    return render(request, 'health_school/bulk_sign.html', {
+        'health_school': health_school,
+        'pending_documents': pending_documents,
+        'results': results,
     })
 
 # --- DOWNLOADS E REDIRECIONAMENTO (inalteradas) ---
@@ -414,10 +459,7 @@ def download_document(request, document_id, file_type):
     """Função auxiliar para downloads."""
     document = get_object_or_404(InternshipDocument, id=document_id)
     
-    is_authorized = document.university.admin_users.filter(id=request.user.id).exists() or \
-                    document.health_school.admin_users.filter(id=request.user.id).exists()
-    
-    if not is_authorized:
+    if not institutions_for(request).can_access(document):
         messages.error(request, "Você não tem permissão para acessar este documento.")
         return redirect('home')
 
@@ -434,9 +476,29 @@ def download_document(request, document_id, file_type):
         messages.error(request, f"Arquivo {file_type} não encontrado para este documento.")
         return redirect(request.META.get('HTTP_REFERER', 'home'))
 
-    response = HttpResponse(file_field.read(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    if file_type == 'original':
+        return serve_file(request, file_field, filename, content_hash=document.original_hash)
+    return serve_file(
+        request, file_field, filename, content_hash=document.signed_hash or None, size=document.signed_size
+    )
+
+@login_required
+def document_preview(request, document_id):
+    """Serve a prévia (só a primeira página) usada pela tela de assinatura."""
+    document = get_object_or_404(InternshipDocument, id=document_id)
+
+    if not institutions_for(request).can_access(document):
+        messages.error(request, "Você não tem permissão para acessar este documento.")
+        return redirect('home')
+
+    name = get_first_page_preview(document)
+    if name is None:
+        # Sem prévia (ex.: PDF que o PyPDF2 não consegue ler): entrega o original
+        return download_document(request, document_id, 'original')
+
+    preview = FieldFile(document, document.original_file.field, name)
+    filename = f"{document.title.replace(' ', '_')}_PREVIA.pdf"
+    return serve_file(request, preview, filename, content_hash=f'{document.original_hash}-p1')
 
 @login_required
 def download_original_document(request, document_id):
@@ -448,15 +510,54 @@ def download_signed_document(request, document_id):
     """Faz o download do arquivo assinado."""
     return download_document(request, document_id, 'signed')
 
+@login_required
+def export_documents(request):
+    """Exporta em um ZIP (gerado em streaming) os documentos assinados da instituição do usuário."""
+    institutions = institutions_for(request)
+    institution = institutions.university or institutions.health_school
+    if institution is None:
+        messages.error(request, "Seu perfil não está associado a nenhuma instituição.")
+        return redirect('home')
+
+    status = request.GET.get('status', '')
+    if status not in dict(InternshipDocument.STATUS_CHOICES):
+        status = ''
+    partner_id = request.GET.get('partner', '')
+    documents = export_queryset(
+        institution,
+        status=status or None,
+        partner_id=int(partner_id) if partner_id.isdigit() else None
+    )
+
+    response = StreamingHttpResponse(iter_export_zip(documents), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(institution)}"'
+    return response
+
+@require_GET
+def verify_signature(request, signature_hash=None):
+    """
+    Verificação pública de uma assinatura (sem login): aceita o hash na URL,
+    `?hash=` ou o conteúdo completo do QR Code em `?qr=`. Responde um JSON curto.
+    """
+    fields = parse_qr_payload(request.GET.get('qr', ''))
+    signature_hash = (signature_hash or request.GET.get('hash') or fields['hash'] or '').lower()
+    verdict = verify(signature_hash, document_hash=fields['doc'], document_id=fields['id'])
+
+    status = {'invalid_hash': 400, 'not_found': 404}.get(verdict.get('error'), 200)
+    response = JsonResponse(verdict, status=status)
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
 def home_redirect(request):
     """Redireciona usuário para o dashboard correto ou página inicial (usa base.html)."""
     if not request.user.is_authenticated:
         return render(request, 'home.html') 
     
-    if Institution.objects.filter(admin_users=request.user, type='university').exists():
+    institutions = institutions_for(request)
+    if institutions.university is not None:
         return redirect('university_dashboard')
     
-    if Institution.objects.filter(admin_users=request.user, type='health_school').exists():
+    if institutions.health_school is not None:
         return redirect('health_school_dashboard')
     
     messages.info(request, "Seu perfil não tem um dashboard associado.")